@@ -1,5 +1,8 @@
 import os
+from pathlib import Path
 from typing import List
+
+import yaml
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -21,6 +24,15 @@ class Settings(BaseSettings):
     ESP32_TIMEOUT: int = Field(default=10, description="ESP32 communication timeout")
     ESP32_RETRY_ATTEMPTS: int = Field(default=3, description="ESP32 retry attempts")
     
+    # ESP32-CAM Live Stream
+    CAMERA_STREAM_PORT: int = Field(default=81, description="ESP32-CAM MJPEG stream server port")
+    CAMERA_STREAM_PATH: str = Field(default="/stream", description="ESP32-CAM MJPEG stream path")
+    CAMERA_STREAM_DEFAULT_FPS: float = Field(default=5.0, description="Frames per second sent to a stream client unless it asks otherwise")
+    CAMERA_STREAM_MAX_FPS: float = Field(default=15.0, description="Highest frame rate a stream client may negotiate")
+    CAMERA_STREAM_IDLE_SECONDS: float = Field(default=10.0, description="Seconds an upstream MJPEG reader stays open without consumers")
+    CAMERA_FRAME_MAX_AGE: float = Field(default=0.5, description="Default max age in seconds of a shared frame served to capture consumers")
+    CAMERA_FRAME_TIMEOUT: float = Field(default=2.0, description="Seconds to wait for the next streamed frame before a single /capture request")
+    
     # Network Configuration
     NETWORK_BASE_IP: str = Field(default="192.168.1.", description="Base IP for device discovery")
     NETWORK_SCAN_RANGE: int = Field(default=254, description="IP range to scan")
@@ -33,16 +45,98 @@ class Settings(BaseSettings):
     )
     MODEL_INPUT_SIZE: tuple = Field(default=(224, 224), description="Model input image size")
     MODEL_CONFIDENCE_THRESHOLD: float = Field(default=0.7, description="Minimum confidence for action")
+    MODEL_ARTIFACT_PATH: str = Field(default="", description="Model artifact to serve (overrides config.yaml model.path)")
+    MODEL_BACKEND: str = Field(default="", description="Force a backend: keras, saved_model or tflite")
+    MODEL_SIGNATURE: str = Field(default="serving_default", description="SavedModel signature used for inference")
+    MODEL_TFLITE_THREADS: int = Field(default=2, description="TFLite interpreter threads")
+    MODEL_LAZY_LOAD: bool = Field(default=True, description="Load TensorFlow and the CNN in the background after startup")
+    MODEL_REGISTRY_KEEP_VERSIONS: int = Field(default=2, description="Model versions kept resident for rollback")
+    MODEL_REGISTRY_DRAIN_TIMEOUT: float = Field(default=10.0, description="Seconds to wait for batches on a replaced model")
+    PREPROCESS_JPEG_DRAFT: bool = Field(default=True, description="Downscale JPEGs during decode (libjpeg DCT scaling)")
+    PREPROCESS_RESAMPLE: str = Field(default="bicubic", description="Resize filter: nearest, bilinear or bicubic")
+    
+    # Project configuration file shared with the dashboard and frontend
+    PROJECT_CONFIG_FILE: str = Field(
+        default=str(Path(__file__).resolve().parents[2] / "config.yaml"),
+        description="Path to the project config.yaml"
+    )
+    
+    # Inference Engine Configuration
+    INFERENCE_MAX_BATCH_SIZE: int = Field(default=16, description="Maximum images per inference batch")
+    INFERENCE_MAX_WAIT_MS: float = Field(default=5.0, description="Maximum wait to fill a batch in milliseconds")
+    INFERENCE_EXECUTOR: str = Field(default="thread", description="Preprocessing executor: thread or process")
+    INFERENCE_PREPROCESS_WORKERS: int = Field(default=2, description="Workers for image decoding/preprocessing")
+    INFERENCE_MODEL_WORKERS: int = Field(default=1, description="Threads running model inference")
+    INFERENCE_MAX_PENDING: int = Field(default=64, description="Pending CNN tasks before answering 503")
+    SERVING_BATCH_SIZES: List[int] = Field(
+        default=[1, 2, 4, 8, 16],
+        description="Batch sizes traced as tf.function serving signatures"
+    )
+    
+    # Batch Classification
+    BATCH_MAX_FILES: int = Field(default=500, description="Maximum images per /predict_batch request")
+    BATCH_CHUNK_SIZE: int = Field(default=32, description="Images decoded and classified per chunk")
+    BATCH_MAX_PENDING_FRACTION: float = Field(default=0.25, description="Share of INFERENCE_MAX_PENDING one /predict_batch may hold (current + next chunk)")
+    BATCH_OVERLOAD_RETRIES: int = Field(default=3, description="Retries of a streamed chunk when inference is saturated")
+    
+    # Upload Ingestion Pools
+    INGEST_BUFFER_POOL_SIZE: int = Field(default=16, description="Reusable upload buffers kept in the pool")
+    INGEST_MAX_POOLED_BYTES: int = Field(default=8 * 1024 * 1024, description="Largest upload buffer returned to the pool")
+    INGEST_TENSOR_POOL_SIZE: int = Field(default=32, description="Preallocated float32 image tensors kept in the pool")
+    
+    # Classification Result Cache
+    RESULT_CACHE_ENABLED: bool = Field(default=True, description="Reuse results for repeated frames")
+    RESULT_CACHE_SIZE: int = Field(default=256, description="Maximum cached classification results (LRU)")
+    RESULT_CACHE_TTL_SECONDS: float = Field(default=30.0, description="Seconds a cached result stays valid")
+    RESULT_CACHE_PERCEPTUAL: bool = Field(default=False, description="Also match near-duplicate frames by dHash")
+    RESULT_CACHE_PERCEPTUAL_DISTANCE: int = Field(default=4, description="Maximum dHash Hamming distance for a hit")
+    
+    # Captured Image Archive (config.yaml monitoring.save_images / images_path)
+    IMAGE_ARCHIVE_PATH: str = Field(default="", description="Archive directory (default: config.yaml monitoring.images_path)")
+    IMAGE_ARCHIVE_QUEUE_SIZE: int = Field(default=256, description="Frames waiting to be written before dropping")
+    IMAGE_ARCHIVE_DROP_POLICY: str = Field(default="drop_newest", description="When the queue is full: drop_newest or drop_oldest")
+    IMAGE_ARCHIVE_FSYNC_BATCH: int = Field(default=32, description="Frames written per fsync batch")
+    IMAGE_ARCHIVE_FSYNC_INTERVAL: float = Field(default=1.0, description="Maximum seconds a queued frame waits for its fsync batch")
+    
+    # Bulk Re-classification (API)
+    RECLASSIFY_OUTPUT_ROOT: str = Field(default="../../data/reclassified", description="Directory that holds every reclassification output_dir")
+    RECLASSIFY_PREDICT_TIMEOUT_SECONDS: float = Field(default=120.0, description="Seconds a job batch may wait for the shared model pool")
+    RECLASSIFY_SHUTDOWN_TIMEOUT_SECONDS: float = Field(default=30.0, description="Seconds to wait on shutdown for the running job to stop")
+    
+    # Motion Gate Configuration
+    MOTION_GATE_ENABLED: bool = Field(default=True, description="Skip the CNN on static ESP32-CAM frames")
+    MOTION_GATE_THRESHOLD: float = Field(default=6.0, description="Mean grayscale difference (0-255) counted as motion")
+    MOTION_GATE_MAX_SKIP_SECONDS: float = Field(default=30.0, description="Force a classification after this many seconds")
+    MOTION_GATE_SENSOR_MAX_AGE_SECONDS: float = Field(default=10.0, description="PIR/weight readings older than this are ignored")
+    MOTION_GATE_MIN_WEIGHT: float = Field(default=0.1, description="Weight (kg) that indicates an object on the belt")
+    
+    # ESP32-CONTROL Command Queue
+    COMMAND_QUEUE_MAX_DEPTH: int = Field(default=64, description="Pending commands per device before rejecting new ones")
+    COMMAND_DEFAULT_TTL_SECONDS: float = Field(default=300.0, description="Seconds a command stays deliverable (0 = no expiry)")
+    COMMAND_SERVO_TTL_SECONDS: float = Field(default=10.0, description="Seconds a move_servo command stays deliverable")
+    COMMAND_ACK_TIMEOUT_SECONDS: float = Field(default=5.0, description="Seconds to wait for a push-delivered command ack before redelivering")
+    COMMAND_MAX_DELIVERY_ATTEMPTS: int = Field(default=3, description="Push deliveries of an unacknowledged command before dropping it")
+    COMMAND_POLL_TIMEOUT_SECONDS: float = Field(default=25.0, description="Maximum seconds a command long-poll is held open")
+    COMMAND_WS_HEARTBEAT_SECONDS: float = Field(default=15.0, description="Seconds between pings on an idle command WebSocket")
     
     # WebSocket Configuration
     WS_MAX_CONNECTIONS: int = Field(default=100, description="Maximum WebSocket connections")
     WS_HEARTBEAT_INTERVAL: int = Field(default=30, description="WebSocket heartbeat interval")
     WS_MESSAGE_TIMEOUT: int = Field(default=10, description="WebSocket message timeout")
+    WS_SEND_QUEUE_SIZE: int = Field(default=256, description="Outbound messages queued per WebSocket before the overflow policy applies")
+    WS_OVERFLOW_POLICY: str = Field(default="drop_oldest", description="Full send queue policy: drop_oldest, coalesce or disconnect")
+    WS_DELTA_HISTORY: int = Field(default=32, description="Patches kept per delta topic so clients can resync from a sequence number")
     
     # Data Storage Configuration
     DATA_RETENTION_DAYS: int = Field(default=30, description="Days to retain sensor data")
-    SENSOR_HISTORY_LIMIT: int = Field(default=1000, description="Maximum sensor history records")
+    SENSOR_HISTORY_LIMIT: int = Field(default=1000, description="Sensor readings kept per device (ring buffer)")
+    SENSOR_HISTORY_MAX_DEVICES: int = Field(default=64, description="Devices tracked in the sensor history")
     CLASSIFICATION_HISTORY_LIMIT: int = Field(default=500, description="Maximum classification records")
+    DATABASE_PATH: str = Field(default="", description="SQLite time-series database (default: config.yaml database.path)")
+    TIMESERIES_ENABLED: bool = Field(default=True, description="Persist sensor readings and classifications to SQLite")
+    TIMESERIES_FLUSH_INTERVAL: float = Field(default=1.0, description="Seconds between batched inserts")
+    TIMESERIES_BATCH_SIZE: int = Field(default=500, description="Pending rows that trigger an early flush")
+    TIMESERIES_MAX_PENDING: int = Field(default=20000, description="Rows buffered before new ones are dropped")
     
     # System Status Configuration
     STATUS_UPDATE_INTERVAL: int = Field(default=30, description="System status update interval")
@@ -123,6 +217,39 @@ def get_model_path(model_name: str = "") -> str:
         return settings.MODEL_PATH
     return os.path.join(settings.MODEL_PATH, model_name)
 
+def load_project_config() -> dict:
+    """Load the project config.yaml (empty dict if missing)"""
+    try:
+        with open(settings.PROJECT_CONFIG_FILE, "r", encoding="utf-8") as file:
+            return yaml.safe_load(file) or {}
+    except FileNotFoundError:
+        return {}
+
+def get_model_artifact_path() -> str:
+    """Get the model artifact to serve, resolving config.yaml paths relative to the file"""
+    if settings.MODEL_ARTIFACT_PATH:
+        return settings.MODEL_ARTIFACT_PATH
+    model_path = load_project_config().get("model", {}).get("path", "")
+    if not model_path:
+        return ""
+    return str((Path(settings.PROJECT_CONFIG_FILE).parent / model_path).resolve())
+
+def get_captured_images_path() -> str:
+    """Get the captured images archive (config.yaml monitoring.images_path)"""
+    images_path = load_project_config().get("monitoring", {}).get("images_path", "")
+    if not images_path:
+        return ""
+    return str((Path(settings.PROJECT_CONFIG_FILE).parent / images_path).resolve())
+
+def get_database_path() -> str:
+    """Get the SQLite database (config.yaml database.path)"""
+    if settings.DATABASE_PATH:
+        return settings.DATABASE_PATH
+    database_path = load_project_config().get("database", {}).get("path", "")
+    if not database_path:
+        return ""
+    return str((Path(settings.PROJECT_CONFIG_FILE).parent / database_path).resolve())
+
 def is_valid_material(material: str) -> bool:
     """Check if material is valid"""
     return material.lower() in [cls.lower() for cls in settings.MODEL_CLASSES]
\ No newline at end of file
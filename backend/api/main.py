@@ -1,23 +1,35 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import tensorflow as tf
-import numpy as np
-from PIL import Image
-import io
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
 import uvicorn
 from datetime import datetime
 import os
 import json
 import asyncio
+import time
+from contextlib import AsyncExitStack
 
 # Import routers and services
 from routes.microcontroller import router as microcontroller_router
-from routes.esp32_integration import router as esp32_router
+from routes.esp32_integration import esp32_devices, router as esp32_router
 from routes.rnn_predictions import router as rnn_router
+from routes.reclassification import router as reclassification_router, shutdown_reclassification
 from services.system_service import SystemService
+from services.inference_engine import inference_engine
+from services.inference_executor import inference_executor, InferenceOverloadedError
+from services.classifier import classifier
+from services.ingestion import get_ingestion_stats, ingest_upload
+from services.image_archiver import image_archiver
+from services.serialization import FastJSONResponse
+from services.camera_hub import camera_hub
+from services.timeseries_store import timeseries_store
+from services.result_cache import result_cache
+from services.motion_gate import motion_gate
+from services.model_backends import detect_backend, is_model_artifact, wrap_keras_model
+from services.model_registry import model_registry
+from config import settings, get_model_artifact_path
 from websocket_manager import websocket_manager
 
 # Configurar logging
@@ -30,7 +42,8 @@ app = FastAPI(
     description="API para clasificación de materiales usando CNN y predicción de volúmenes con RNN",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
 )
 
 # Configurar CORS para permitir conexiones desde Raspberry Pi
@@ -49,12 +62,19 @@ app.include_router(esp32_router, prefix="/api", tags=["esp32"])
 # Incluir rutas de predicción RNN
 app.include_router(rnn_router, prefix="/rnn", tags=["rnn-predictions"])
 
+# Incluir rutas de re-clasificación masiva del archivo de imágenes
+app.include_router(reclassification_router, prefix="/reclassify", tags=["reclassification"])
+
 # Variables globales
-model = None
-class_names = ['glass', 'metal', 'plastic']
-IMG_SIZE = (224, 224)
 system_service = SystemService()
 
+# Estado de arranque del modelo CNN: starting -> loading -> ready | failed
+model_startup = {
+    "state": "starting",
+    "load_seconds": None,
+    "error": None
+}
+
 def create_dummy_model():
     """Crear un modelo dummy para pruebas cuando no se encuentra el modelo real"""
     from tensorflow.keras.models import Sequential
@@ -67,7 +87,7 @@ def create_dummy_model():
     model = Sequential([
         base_model,
         GlobalAveragePooling2D(),
-        Dense(128, acti vation='relu'),
+        Dense(128, activation='relu'),
         Dense(3, activation='softmax')
     ])
 
@@ -81,54 +101,75 @@ def create_dummy_model():
 
 # Cargar el modelo al iniciar la aplicación
 @app.on_event("startup")
+async def start_model_loading():
+    """Cargar TensorFlow y el modelo en segundo plano: las rutas HTTP, WebSocket y ESP32 responden de inmediato"""
+    if settings.MODEL_LAZY_LOAD:
+        app.state.model_loader = asyncio.create_task(load_model())
+    else:
+        await load_model()
+
 async def load_model():
-    global model
-    try:
-        # Buscar modelos en la carpeta CNN
+    model_startup["state"] = "loading"
+    started = time.perf_counter()
+    version = None
+
+    # 1. Artefacto configurado en config.yaml (model.path), p. ej. el SavedModel exportado
+    artifact_path = get_model_artifact_path()
+    if artifact_path and os.path.exists(artifact_path):
+        version = await model_registry.load(artifact_path, backend=settings.MODEL_BACKEND)
+        if version.status == "failed":
+            logger.error(f"Error cargando modelo configurado {artifact_path}: {version.error}")
+            version = None
+
+    # 2. Modelos Keras en la carpeta CNN
+    if version is None:
         cnn_folder = "../ai_client/CNN"
         model_files = ["modelo_corregido_materiales.keras", "best_model.keras", "best_model.h5"]
-        
-        model_loaded = False
         for model_file in model_files:
             model_path = os.path.join(cnn_folder, model_file)
             if os.path.exists(model_path):
-                try:
-                    loaded_model = tf.keras.models.load_model(model_path)
-                    logger.info(f"Modelo cargado exitosamente desde {model_path}")
-                    logger.info(f"Métodos disponibles en el modelo: {dir(loaded_model)}")
-                    # Validar si el modelo tiene método predict
-                    if hasattr(loaded_model, "predict"):
-                        model = loaded_model
-                        model_loaded = True
-                        break
-                    else:
-                        logger.error(f"El modelo en {model_path} no tiene el método 'predict'.")
-                except Exception as e:
-                    logger.error(f"Error cargando modelo {model_path}: {str(e)}")
-                    continue
-        
-        if not model_loaded:
-            logger.error(f"No se pudo cargar ningún modelo desde {cnn_folder}")
-            logger.warning("Creando modelo dummy para pruebas...")
-            model = create_dummy_model()
-    except Exception as e:
-        logger.error(f"Error al cargar el modelo: {str(e)}")
+                version = await model_registry.load(model_path)
+                if version.status != "failed":
+                    break
+                logger.error(f"Error cargando modelo {model_path}: {version.error}")
+                version = None
+
+    # 3. Modelo dummy para pruebas
+    if version is None:
+        logger.error("No se pudo cargar ningún modelo")
         logger.warning("Creando modelo dummy para pruebas...")
-        model = create_dummy_model()
+        try:
+            backend = await inference_executor.run_model(lambda: wrap_keras_model(create_dummy_model()))
+            version = await model_registry.register(backend, name="dummy")
+        except Exception as e:
+            logger.error(f"Error al crear el modelo dummy: {str(e)}")
+            model_startup["state"] = "failed"
+            model_startup["error"] = str(e)
+            return
+
+    model_startup["state"] = "ready"
+    model_startup["load_seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Modelo servido con backend '{version.backend.name}' desde {version.path} ({model_startup['load_seconds']}s)")
+
+def overloaded_error(e: InferenceOverloadedError) -> HTTPException:
+    """Respuesta 503 cuando la cola de inferencia está llena"""
+    logger.warning(f"Inference backpressure: {e}")
+    return HTTPException(
+        status_code=503,
+        detail="Servicio de clasificación saturado, reintente más tarde",
+        headers={"Retry-After": "1"}
+    )
 
-def preprocess_image(image: Image.Image) -> np.ndarray:
-    """Preprocesar la imagen para el modelo"""
-    try:
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        image = image.resize(IMG_SIZE)
-        img_array = np.array(image)
-        img_array = img_array.astype('float32') / 255.0
-        img_array = np.expand_dims(img_array, axis=0)
-        return img_array
-    except Exception as e:
-        logger.error(f"Error en preprocesamiento: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Error al procesar imagen: {str(e)}")
+@app.on_event("shutdown")
+async def shutdown_background_workers():
+    # El trabajo de re-clasificación usa el pool del modelo: detenerlo antes de cerrar el ejecutor
+    await shutdown_reclassification()
+    model_registry.shutdown()
+    inference_executor.shutdown()
+    # Escribir los frames y filas que quedan en cola
+    await asyncio.to_thread(image_archiver.close)
+    await asyncio.to_thread(timeseries_store.close)
+    camera_hub.close()
 
 @app.get("/")
 async def root():
@@ -136,119 +177,164 @@ async def root():
         "message": "Material Classification API",
         "version": "1.0.0",
         "status": "running",
-        "model_loaded": model is not None,
-        "classes": class_names,
+        "model_loaded": model_registry.active_model is not None,
+        "classes": classifier.class_names,
         "docs": "/docs",
         "timestamp": datetime.now().isoformat()
     }
 
 @app.get("/health")
 async def health_check():
+    model_loaded = model_registry.active_model is not None
     return {
         "status": "healthy",
-        "model_status": "loaded" if model is not None else "not_loaded",
+        "ready": model_loaded,
+        "readiness": "ready" if model_loaded else model_startup["state"],
+        "model_status": "loaded" if model_loaded else "not_loaded",
+        "model_startup": model_startup,
         "timestamp": datetime.now().isoformat()
     }
 
 @app.post("/predict", response_model=Dict)
 async def predict_image(file: UploadFile = File(...)):
-    if model is None:
+    if not classifier.ready:
         raise HTTPException(status_code=503, detail="Modelo no cargado")
 
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="El archivo debe ser una imagen")
 
     try:
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
-        processed_image = preprocess_image(image)
-        predictions = model.predict(processed_image)
-        predicted_class_idx = int(np.argmax(predictions[0]))
-        predicted_class = class_names[predicted_class_idx]
-        confidence = float(predictions[0][predicted_class_idx])
+        # El upload se lee en un buffer del pool y se decodifica sin copias intermedias
+        async with ingest_upload(file) as image_data:
+            image_size = len(image_data)
+            classification = await classifier.classify(image_data)
+            # Se archiva en segundo plano: la petición no espera al disco
+            image_archiver.submit(image_data, classification.predicted_class, classification.confidence, source="predict")
 
         result = {
-            "predicted_class": predicted_class,
-            "confidence": confidence,
-            "all_probabilities": {
-                class_names[i]: float(predictions[0][i])
-                for i in range(len(class_names))
-            },
+            **classifier.to_dict(classification),
             "timestamp": datetime.now().isoformat(),
             "image_info": {
                 "filename": file.filename,
                 "content_type": file.content_type,
-                "size": len(image_data)
+                "size": image_size
             }
         }
 
-        logger.info(f"Predicción: {predicted_class} con confianza {confidence:.4f}")
+        logger.info(f"Predicción: {classification.predicted_class} con confianza {classification.confidence:.4f}")
         
         # Comunicar resultado al sistema de microcontrolador
         try:
             from routes.microcontroller import system_state
-            system_state["last_classification"] = predicted_class
+            system_state["last_classification"] = classification.predicted_class
             
             # Activar sistema de separación si la confianza es alta
-            if confidence > 0.7:
-                servo_positions = {
-                    "glass": 45,
-                    "plastic": 90,
-                    "metal": 135
-                }
-                target_position = servo_positions.get(predicted_class, 90)
-                system_state["servo_position"] = target_position
+            if classification.actionable:
+                system_state["servo_position"] = classification.servo_position
                 system_state["motor_active"] = True
-                logger.info(f"Sistema de separación activado automáticamente: {predicted_class} -> {target_position}°")
+                logger.info(f"Sistema de separación activado automáticamente: {classification.predicted_class} -> {classification.servo_position}°")
         except Exception as e:
             logger.warning(f"Error comunicando con sistema de microcontrolador: {e}")
             
         return result
+    except InferenceOverloadedError as e:
+        raise overloaded_error(e)
     except Exception as e:
         logger.error(f"Error en predicción: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al procesar imagen: {str(e)}")
 
+def batch_item(index: int, filename: Optional[str], classification) -> Dict:
+    """Resultado de una imagen dentro de /predict_batch"""
+    if isinstance(classification, str):
+        return {
+            "index": index,
+            "filename": filename,
+            "error": classification,
+            "predicted_class": None,
+            "confidence": 0.0
+        }
+    return {
+        "index": index,
+        "filename": filename,
+        **classifier.to_dict(classification)
+    }
+
+async def classify_chunk(files: List[UploadFile], offset: int) -> List[Dict]:
+    """Leer y clasificar un trozo de uploads; los buffers del pool se liberan al terminar el trozo"""
+    async with AsyncExitStack() as stack:
+        images = [await stack.enter_async_context(ingest_upload(file)) for file in files]
+        classifications = await classifier.classify_many(images)
+    return [
+        batch_item(offset + i, file.filename, classification)
+        for i, (file, classification) in enumerate(zip(files, classifications))
+    ]
+
+async def classify_chunk_with_retry(files: List[UploadFile], offset: int) -> List[Dict]:
+    """En streaming ya no se puede responder 503: si el motor está saturado se reintenta el trozo"""
+    for attempt in range(settings.BATCH_OVERLOAD_RETRIES + 1):
+        try:
+            return await classify_chunk(files, offset)
+        except InferenceOverloadedError as e:
+            if attempt == settings.BATCH_OVERLOAD_RETRIES:
+                return [batch_item(offset + i, file.filename, f"Servicio saturado: {e}") for i, file in enumerate(files)]
+            await asyncio.sleep(0.5 * (attempt + 1))
+
+async def stream_batch_results(files: List[UploadFile], chunk_size: int):
+    """Generar NDJSON por trozos, clasificando el trozo siguiente mientras se envía el actual"""
+    started = time.perf_counter()
+    chunks = [(offset, files[offset:offset + chunk_size]) for offset in range(0, len(files), chunk_size)]
+    errors = 0
+    task = asyncio.create_task(classify_chunk_with_retry(chunks[0][1], chunks[0][0]))
+    try:
+        for position in range(len(chunks)):
+            items = await task
+            if position + 1 < len(chunks):
+                offset, chunk = chunks[position + 1]
+                task = asyncio.create_task(classify_chunk_with_retry(chunk, offset))
+            for item in items:
+                errors += "error" in item
+                yield json.dumps({**item, "chunk": position}) + "\n"
+    finally:
+        if not task.done():
+            task.cancel()
+    yield json.dumps({
+        "done": True,
+        "total": len(files),
+        "errors": errors,
+        "chunks": len(chunks),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }) + "\n"
+
 @app.post("/predict_batch", response_model=List[Dict])
-async def predict_batch_images(files: List[UploadFile] = File(...)):
-    if model is None:
+async def predict_batch_images(files: List[UploadFile] = File(...),
+                               stream: bool = False,
+                               chunk_size: Optional[int] = None):
+    """Clasificar hasta BATCH_MAX_FILES imágenes por trozos; con stream=true responde NDJSON a medida que avanza"""
+    if not classifier.ready:
         raise HTTPException(status_code=503, detail="Modelo no cargado")
 
-    if len(files) > 10:
-        raise HTTPException(status_code=400, detail="Máximo 10 imágenes por lote")
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Máximo {settings.BATCH_MAX_FILES} imágenes por lote")
+
+    # Los dos trozos en vuelo (el actual y el siguiente) ocupan como mucho BATCH_MAX_PENDING_FRACTION de la cola
+    # de inferencia: el resto queda para las peticiones /predict sueltas
+    budget = int(inference_executor.max_pending * settings.BATCH_MAX_PENDING_FRACTION)
+    chunk_size = max(1, min(chunk_size or settings.BATCH_CHUNK_SIZE, budget // 2))
+
+    if stream:
+        return StreamingResponse(stream_batch_results(files, chunk_size), media_type="application/x-ndjson")
 
     results = []
-    for i, file in enumerate(files):
-        try:
-            image_data = await file.read()
-            image = Image.open(io.BytesIO(image_data))
-            processed_image = preprocess_image(image)
-            predictions = model.predict(processed_image)
-            predicted_class_idx = int(np.argmax(predictions[0]))
-            predicted_class = class_names[predicted_class_idx]
-            confidence = float(predictions[0][predicted_class_idx])
-
-            results.append({
-                "index": i,
-                "filename": file.filename,
-                "predicted_class": predicted_class,
-                "confidence": confidence,
-                "all_probabilities": {
-                    class_names[j]: float(predictions[0][j])
-                    for j in range(len(class_names))
-                }
-            })
-        except Exception as e:
-            results.append({
-                "index": i,
-                "filename": file.filename,
-                "error": str(e),
-                "predicted_class": None,
-                "confidence": 0.0
-            })
+    try:
+        for offset in range(0, len(files), chunk_size):
+            results.extend(await classify_chunk(files[offset:offset + chunk_size], offset))
+    except InferenceOverloadedError as e:
+        raise overloaded_error(e)
     return results
 
 @app.get("/model_info")
 async def get_model_info():
+    model = model_registry.active_model
     if model is None:
         raise HTTPException(status_code=503, detail="Modelo no cargado")
     try:
@@ -256,41 +342,52 @@ async def get_model_info():
             "model_type": str(type(model)),
             "input_shape": getattr(model, "input_shape", "N/A"),
             "output_shape": getattr(model, "output_shape", "N/A"),
-            "classes": class_names,
-            "num_classes": len(class_names),
-            "trainable_params": model.count_params() if hasattr(model, "count_params") else "N/A"
+            "classes": classifier.class_names,
+            "num_classes": len(classifier.class_names),
+            "trainable_params": model.count_params() if hasattr(model, "count_params") else "N/A",
+            "backend": model.get_info(),
+            "registry": model_registry.get_info()
         }
     except Exception as e:
         return {"error": str(e)}
 
 @app.post("/load_model")
-async def load_cnn_model(model_name: str = "modelo_corregido_materiales.keras"):
-    """Endpoint para cargar manualmente un modelo CNN específico"""
-    global model
+async def load_cnn_model(model_name: str = "modelo_corregido_materiales.keras", wait: bool = False):
+    """Cargar un modelo CNN (.keras, .h5, .tflite o SavedModel) en segundo plano y activarlo al terminar el calentamiento"""
     try:
         cnn_folder = "../ai_client/CNN"
         model_path = os.path.join(cnn_folder, model_name)
         
         if not os.path.exists(model_path):
-            available_models = []
-            if os.path.exists(cnn_folder):
-                available_models = [f for f in os.listdir(cnn_folder) if f.endswith(('.h5', '.keras'))]
             raise HTTPException(
                 status_code=404, 
-                detail=f"Modelo '{model_name}' no encontrado. Modelos disponibles: {available_models}"
+                detail=f"Modelo '{model_name}' no encontrado. Modelos disponibles: {list_model_artifacts(cnn_folder)}"
             )
         
-        loaded_model = tf.keras.models.load_model(model_path)
-        
-        if not hasattr(loaded_model, "predict"):
+        if not is_model_artifact(model_path):
             raise HTTPException(
                 status_code=400, 
-                detail=f"El modelo '{model_name}' no tiene el método 'predict'"
+                detail=f"El modelo '{model_name}' no es un artefacto soportado"
             )
         
-        model = loaded_model
+        # El modelo activo sigue sirviendo mientras se carga y calienta la nueva versión
+        if not wait:
+            version = model_registry.load_in_background(model_path, name=model_name)
+            logger.info(f"Cargando modelo '{model_name}' como versión {version.version} en segundo plano")
+            return {
+                "status": "loading",
+                "message": f"Modelo '{model_name}' cargándose como versión {version.version}",
+                "model_path": model_path,
+                "version": version.to_dict(),
+                "timestamp": datetime.now().isoformat()
+            }
+        
+        version = await model_registry.load(model_path, name=model_name)
+        if version.status == "failed":
+            raise HTTPException(status_code=500, detail=f"Error al cargar modelo: {version.error}")
         logger.info(f"Modelo '{model_name}' cargado exitosamente desde {model_path}")
         
+        model = version.backend
         return {
             "status": "success",
             "message": f"Modelo '{model_name}' cargado exitosamente",
@@ -298,6 +395,8 @@ async def load_cnn_model(model_name: str = "modelo_corregido_materiales.keras"):
             "model_type": str(type(model)),
             "input_shape": getattr(model, "input_shape", "N/A"),
             "output_shape": getattr(model, "output_shape", "N/A"),
+            "backend": model.get_info(),
+            "version": version.to_dict(),
             "timestamp": datetime.now().isoformat()
         }
         
@@ -307,6 +406,38 @@ async def load_cnn_model(model_name: str = "modelo_corregido_materiales.keras"):
         logger.error(f"Error cargando modelo '{model_name}': {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al cargar modelo: {str(e)}")
 
+@app.post("/rollback_model")
+async def rollback_cnn_model(version: Optional[int] = None):
+    """Volver instantáneamente a una versión de modelo residente (por defecto la anterior)"""
+    try:
+        restored = await model_registry.rollback(version)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Rollback a la versión {restored.version} ({restored.name})")
+    return {
+        "status": "success",
+        "message": f"Versión {restored.version} ({restored.name}) activa",
+        "version": restored.to_dict(),
+        "registry": model_registry.get_info(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+def list_model_artifacts(folder: str) -> List[str]:
+    """Listar artefactos de modelo servibles en una carpeta"""
+    if not os.path.exists(folder):
+        return []
+    return sorted(f for f in os.listdir(folder) if is_model_artifact(os.path.join(folder, f)))
+
+def artifact_size(path: str) -> int:
+    """Tamaño en bytes de un archivo o directorio SavedModel"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
 @app.get("/available_models")
 async def get_available_models():
     """Obtener lista de modelos disponibles en la carpeta CNN"""
@@ -315,15 +446,15 @@ async def get_available_models():
         if not os.path.exists(cnn_folder):
             return {"models": [], "message": "Carpeta CNN no encontrada"}
         
-        model_files = [f for f in os.listdir(cnn_folder) if f.endswith(('.h5', '.keras'))]
-        
+        model = model_registry.active_model
         models_info = []
-        for model_file in model_files:
+        for model_file in list_model_artifacts(cnn_folder):
             model_path = os.path.join(cnn_folder, model_file)
-            file_size = os.path.getsize(model_path)
+            file_size = artifact_size(model_path)
             models_info.append({
                 "filename": model_file,
                 "path": model_path,
+                "backend": detect_backend(model_path).name,
                 "size_bytes": file_size,
                 "size_mb": round(file_size / (1024 * 1024), 2)
             })
@@ -331,18 +462,77 @@ async def get_available_models():
         return {
             "models": models_info,
             "count": len(models_info),
-            "current_model_loaded": model is not None
+            "current_model_loaded": model is not None,
+            "current_backend": model.get_info() if model else None,
+            "registry": model_registry.get_info()
         }
         
     except Exception as e:
         logger.error(f"Error obteniendo modelos disponibles: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al obtener modelos: {str(e)}")
 
+@app.get("/system/inference_stats")
+async def get_inference_stats():
+    """Obtener latencia de cola (p50/p95/p99) y throughput del motor de inferencia por tamaño de lote"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "inference": inference_engine.get_stats(),
+        "ingestion": get_ingestion_stats()
+    }
+
 # WebSocket Endpoints
+def resolve_camera_ip(camera: Optional[str]) -> Optional[str]:
+    """device_id registrado o IP de un ESP32-CAM (por defecto, la primera descubierta)"""
+    if camera:
+        device = esp32_devices.get(camera)
+        return device.ip_address if device is not None else camera
+    if system_service.esp32_cam_ips:
+        return system_service.esp32_cam_ips[0]
+    return system_service.last_capture_ip
+
+# Registrado antes de /ws/{client_type} para que esa ruta no lo capture
+@app.websocket("/ws/camera_stream")
+async def camera_stream_websocket(websocket: WebSocket, camera: Optional[str] = None, fps: Optional[float] = None):
+    """Stream en vivo de un ESP32-CAM: mensajes binarios con el JPEG tal cual, a los fps negociados"""
+    await websocket.accept()
+    camera_ip = resolve_camera_ip(camera)
+    if camera_ip is None:
+        await websocket.send_json({"type": "error", "message": "No ESP32-CAM devices found"})
+        await websocket.close(code=1011)
+        return
+    
+    # Una sola lectura del stream por cámara, compartida por todos los clientes
+    client = camera_hub.subscribe(camera_ip, websocket, fps)
+    writer = asyncio.create_task(client.run())
+    receiver = None
+    try:
+        while True:
+            receiver = asyncio.create_task(websocket.receive_json())
+            await asyncio.wait({receiver, writer}, return_when=asyncio.FIRST_COMPLETED)
+            if writer.done():
+                # El cliente no consume ni un frame en WS_MESSAGE_TIMEOUT o se cerró
+                break
+            message = receiver.result()
+            if isinstance(message, dict) and message.get("type") == "set_fps":
+                client.set_fps(camera_hub.negotiate_fps(message.get("fps")))
+            elif isinstance(message, dict) and message.get("type") == "get_stats":
+                client.notify({"type": "stream_stats", "data": client.get_stats()})
+                
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    except Exception as e:
+        logger.error(f"Camera stream WebSocket error: {e}")
+    finally:
+        camera_hub.unsubscribe(camera_ip, client)
+        writer.cancel()
+        if receiver is not None:
+            receiver.cancel()
+
 @app.websocket("/ws/{client_type}")
 async def websocket_endpoint(websocket: WebSocket, client_type: str):
     """WebSocket principal para comunicación en tiempo real"""
-    await websocket_manager.connect(websocket, client_type)
+    # ?overflow=drop_oldest|coalesce|disconnect: qué hacer si el cliente no consume a tiempo
+    await websocket_manager.connect(websocket, client_type, overflow_policy=websocket.query_params.get("overflow"))
     try:
         while True:
             # Recibir mensajes del cliente
@@ -359,29 +549,11 @@ async def websocket_endpoint(websocket: WebSocket, client_type: str):
         logger.error(f"WebSocket error: {e}")
         await websocket_manager.disconnect(websocket, client_type)
 
-@app.websocket("/ws/camera_stream")
-async def camera_stream_websocket(websocket: WebSocket):
-    """WebSocket específico para stream de cámara"""
-    await websocket.accept()
-    
-    try:
-        # Suscribir automáticamente a camera_stream
-        await websocket_manager.subscribe_to_event(websocket, "camera_stream")
-        
-        while True:
-            # Mantener conexión viva
-            await asyncio.sleep(1)
-            
-    except WebSocketDisconnect:
-        await websocket_manager.unsubscribe_from_event(websocket, "camera_stream")
-    except Exception as e:
-        logger.error(f"Camera stream WebSocket error: {e}")
-
 # Endpoints mejorados que integran con el sistema ESP32
 @app.post("/system/capture_and_classify")
 async def capture_and_classify_from_esp32():
     """Capturar imagen de ESP32-CAM y clasificar"""
-    if model is None:
+    if not classifier.ready:
         raise HTTPException(status_code=503, detail="Modelo no cargado")
     
     try:
@@ -391,12 +563,28 @@ async def capture_and_classify_from_esp32():
             raise HTTPException(status_code=503, detail="No se pudo capturar imagen de ESP32-CAM")
         
         # Clasificar imagen
-        result = await system_service.classify_image(image_bytes, model)
+        try:
+            result = await system_service.classify_image(image_bytes, camera_id=system_service.last_capture_ip)
+        except InferenceOverloadedError as e:
+            raise overloaded_error(e)
         if result is None:
             raise HTTPException(status_code=500, detail="Error en clasificación")
         
+        # Frame estático o sin objeto: se devuelve el último resultado sin volver a accionar el servo
+        if result["gated"]["skipped"]:
+            result["system_action"] = {
+                "servo_command_sent": False,
+                "reason": f"Motion gate: {result['gated']['reason']}"
+            }
+            return result
+        
+        image_archiver.submit(
+            image_bytes, result["predicted_class"], result["confidence"],
+            source=system_service.last_capture_ip or "esp32-cam"
+        )
+        
         # Enviar comando al ESP32-CONTROL si la confianza es alta
-        if result["confidence"] > 0.7:
+        if result["confidence"] > classifier.threshold:
             classification_success = await system_service.send_classification_command(
                 material=result["predicted_class"],
                 servo_position=result["servo_position"]
@@ -411,7 +599,7 @@ async def capture_and_classify_from_esp32():
             result["system_action"] = {
                 "servo_command_sent": False,
                 "reason": "Low confidence",
-                "threshold": 0.7
+                "threshold": classifier.threshold
             }
         
         # Broadcast resultado via WebSocket
@@ -438,20 +626,28 @@ async def get_system_metrics():
         websocket_stats = websocket_manager.get_connection_stats()
         
         # Agregar información del modelo
+        model = model_registry.active_model
         model_info = {
             "loaded": model is not None,
-            "classes": class_names,
-            "input_shape": getattr(model, "input_shape", None) if model else None
+            "classes": classifier.class_names,
+            "input_shape": getattr(model, "input_shape", None) if model else None,
+            "backend": model.get_info() if model else None,
+            "inference": inference_engine.get_stats(),
+            "result_cache": result_cache.get_stats(),
+            "motion_gate": motion_gate.get_stats()
         }
         
-        return {
+        # Respuesta ya construida: se serializa una vez con dumps() sin pasar por jsonable_encoder
+        return FastJSONResponse({
             "timestamp": datetime.now().isoformat(),
             "system_health": "healthy" if esp32_metrics["connectivity"]["online_devices"] > 0 else "degraded",
             "esp32_devices": esp32_metrics,
             "websocket_connections": websocket_stats,
             "ml_model": model_info,
+            "image_archive": image_archiver.get_stats(),
+            "camera_streams": camera_hub.get_stats(),
             "api_version": "2.0.0"
-        }
+        })
         
     except Exception as e:
         logger.error(f"Error getting system metrics: {e}")
@@ -515,7 +711,7 @@ async def startup_periodic_tasks():
                 # Broadcast estado via WebSocket
                 await websocket_manager.broadcast_system_status({
                     "system_metrics": metrics,
-                    "model_loaded": model is not None,
+                    "model_loaded": model_registry.active_model is not None,
                     "api_version": "2.0.0",
                     "timestamp": datetime.now().isoformat()
                 })
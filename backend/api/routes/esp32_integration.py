@@ -1,5 +1,5 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile, BackgroundTasks, Depends
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, File, UploadFile, BackgroundTasks, Depends, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, JSONResponse
 from pydantic import BaseModel
 from typing import Dict, List, Optional, Union
 import aiohttp
@@ -7,10 +7,17 @@ import asyncio
 import logging
 from datetime import datetime, timedelta
 import json
-import io
 from PIL import Image
 import numpy as np
 import base64
+import time
+
+from config import settings
+from services.camera_hub import camera_hub
+from services.classification_stats import classification_stats
+from services.command_queue import CommandQueueFullError, command_queue
+from services.sensor_store import sensor_store
+from services.timeseries_store import timeseries_store
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -56,12 +63,16 @@ class ESP32Command(BaseModel):
     command: str  # "classify", "stop", "start_conveyor", "move_servo"
     parameters: Optional[Dict] = None
     priority: Optional[int] = 1  # 1=high, 2=medium, 3=low
+    ttl_seconds: Optional[float] = None  # Default: COMMAND_SERVO_TTL_SECONDS / COMMAND_DEFAULT_TTL_SECONDS
+
+class ESP32CommandAck(BaseModel):
+    ids: List[str]
 
-# Global state management
+# Global state management (devices and pending commands are mirrored to timeseries_store)
 esp32_devices = {}  # device_id -> ESP32Status
-sensor_history = []  # List of sensor readings
+# Sensor readings live in sensor_store (one ring buffer per device)
 classification_history = []  # List of classifications
-pending_commands = {}  # device_id -> List of commands
+# Pending commands live in command_queue (one priority heap per device)
 
 @router.get("/esp32-cam/status")
 async def get_esp32_cam_status():
@@ -101,6 +112,7 @@ async def register_esp32_device(device_id: str, ip_address: str, device_type: st
                             free_heap=device_info.get("free_heap", 0)
                         )
                         
+                        timeseries_store.save_state("device", device_id, esp32_devices[device_id].dict())
                         logger.info(f"ESP32 {device_type} {device_id} registered successfully at {ip_address}")
                         return {
                             "status": "success",
@@ -116,6 +128,7 @@ async def register_esp32_device(device_id: str, ip_address: str, device_type: st
                 status="offline",
                 last_seen=datetime.now()
             )
+            timeseries_store.save_state("device", device_id, esp32_devices[device_id].dict())
             
             return {
                 "status": "warning",
@@ -127,9 +140,44 @@ async def register_esp32_device(device_id: str, ip_address: str, device_type: st
         logger.error(f"Error registering ESP32 device: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _shared_frame_response(device_id: str, device: ESP32Status, max_age: Optional[float]) -> Response:
+    # Último frame del hub de cámaras: los consumidores concurrentes no llegan al ESP32-CAM
+    frame = await camera_hub.get_frame(device.ip_address, max_age)
+    if frame is None:
+        raise HTTPException(status_code=503, detail="Failed to capture image")
+    
+    # Actualizar último visto
+    device.last_seen = datetime.now()
+    
+    return Response(
+        content=frame.data,
+        media_type="image/jpeg",
+        headers={
+            "Content-Disposition": f"attachment; filename=esp32_{device_id}_capture.jpg",
+            "X-Frame-Seq": str(frame.seq),
+            "X-Frame-Timestamp": frame.timestamp.isoformat(),
+            "X-Frame-Age-Ms": f"{(time.monotonic() - frame.received_at) * 1000:.0f}"
+        }
+    )
+
+@router.get("/esp32-cam/capture")
+async def capture_image_from_default_camera(max_age: Optional[float] = None):
+    """Capturar imagen del primer ESP32-CAM online (vista previa del dashboard)"""
+    try:
+        cameras = [d for d in esp32_devices.values() if d.device_type == "esp32-cam" and d.status == "online"]
+        if not cameras:
+            raise HTTPException(status_code=503, detail="No ESP32-CAM online")
+        return await _shared_frame_response(cameras[0].device_id, cameras[0], max_age)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error capturing image: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/esp32-cam/capture/{device_id}")
-async def capture_image_from_device(device_id: str):
-    """Capturar imagen de un ESP32-CAM específico"""
+async def capture_image_from_device(device_id: str, max_age: Optional[float] = None):
+    """Capturar imagen de un ESP32-CAM específico (frame compartido con antigüedad <= max_age segundos)"""
     try:
         if device_id not in esp32_devices:
             raise HTTPException(status_code=404, detail=f"Device {device_id} not found")
@@ -138,21 +186,7 @@ async def capture_image_from_device(device_id: str):
         if device.status != "online":
             raise HTTPException(status_code=503, detail=f"Device {device_id} is offline")
         
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
-            async with session.get(f"http://{device.ip_address}/capture") as response:
-                if response.status == 200:
-                    image_data = await response.read()
-                    
-                    # Actualizar último visto
-                    device.last_seen = datetime.now()
-                    
-                    return StreamingResponse(
-                        io.BytesIO(image_data),
-                        media_type="image/jpeg",
-                        headers={"Content-Disposition": f"attachment; filename=esp32_{device_id}_capture.jpg"}
-                    )
-                else:
-                    raise HTTPException(status_code=response.status, detail="Failed to capture image")
+        return await _shared_frame_response(device_id, device, max_age)
                     
     except HTTPException:
         raise
@@ -214,37 +248,38 @@ async def control_esp32_cam(device_id: str, control: ESP32CamControl):
         logger.error(f"Error controlling ESP32-CAM {device_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def touch_control_device(device_id: str):
+    """Registrar/actualizar un ESP32-CONTROL que acaba de contactar con el backend"""
+    if device_id not in esp32_devices:
+        esp32_devices[device_id] = ESP32Status(
+            device_id=device_id,
+            device_type="esp32-control",
+            ip_address="auto-discovered",
+            status="online",
+            last_seen=datetime.now()
+        )
+    else:
+        esp32_devices[device_id].last_seen = datetime.now()
+        esp32_devices[device_id].status = "online"
+    timeseries_store.save_state("device", device_id, esp32_devices[device_id].dict())
+
 @router.post("/esp32-control/sensors")
 async def update_sensor_data(sensor_data: ESP32SensorData):
     """Endpoint para que ESP32-CONTROL envíe datos de sensores"""
     try:
         # Registrar/actualizar dispositivo
-        if sensor_data.device_id not in esp32_devices:
-            esp32_devices[sensor_data.device_id] = ESP32Status(
-                device_id=sensor_data.device_id,
-                device_type="esp32-control",
-                ip_address="auto-discovered",
-                status="online",
-                last_seen=datetime.now()
-            )
-        else:
-            esp32_devices[sensor_data.device_id].last_seen = datetime.now()
-            esp32_devices[sensor_data.device_id].status = "online"
-        
-        # Guardar datos de sensores
-        sensor_history.append(sensor_data.dict())
+        touch_control_device(sensor_data.device_id)
         
-        # Mantener solo los últimos 1000 registros
-        if len(sensor_history) > 1000:
-            sensor_history.pop(0)
+        # Guardar datos de sensores (ring buffer del dispositivo, O(1)) y en disco por lotes
+        sensor_store.append(sensor_data)
+        timeseries_store.add_sensor_reading(sensor_data)
         
         logger.info(f"Sensor data updated from {sensor_data.device_id}")
         
-        # Retornar comandos pendientes para este dispositivo
-        pending = pending_commands.get(sensor_data.device_id, [])
+        # Retornar comandos pendientes (por prioridad, sin los caducados) salvo que los reciba por un canal push
+        pending = [] if command_queue.has_listener(sensor_data.device_id) else command_queue.drain(sensor_data.device_id)
         if pending:
-            # Limpiar comandos enviados
-            pending_commands[sensor_data.device_id] = []
+            timeseries_store.save_state("commands", sensor_data.device_id, command_queue.snapshot(sensor_data.device_id))
         
         return {
             "status": "success",
@@ -258,52 +293,77 @@ async def update_sensor_data(sensor_data: ESP32SensorData):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/esp32-control/sensors/{device_id}")
-async def get_sensor_data(device_id: str, limit: int = 50):
-    """Obtener datos históricos de sensores"""
+async def get_sensor_data(
+    device_id: str,
+    limit: int = 50,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bucket_seconds: Optional[int] = None
+):
+    """Obtener datos históricos de sensores (rango [start, end] y agregados desde SQLite)"""
     try:
-        device_data = [
-            record for record in sensor_history 
-            if record["device_id"] == device_id
-        ]
-        
-        # Obtener los más recientes
-        recent_data = device_data[-limit:] if device_data else []
+        if bucket_seconds:
+            if bucket_seconds < 1:
+                raise HTTPException(status_code=400, detail="bucket_seconds must be >= 1")
+            records = await asyncio.to_thread(
+                timeseries_store.query_sensor_buckets, device_id, bucket_seconds, start, end
+            )
+            return {
+                "status": "success",
+                "device_id": device_id,
+                "bucket_seconds": bucket_seconds,
+                "records": records,
+                "total_records": len(records),
+                "source": "database"
+            }
+
+        source = "memory"
+        if start is None and end is None:
+            # Obtener los más recientes sin recorrer el historial de otros dispositivos
+            recent_data = sensor_store.latest(device_id, limit)
+        else:
+            recent_data = []
+        if not recent_data and timeseries_store.enabled:
+            # Rango histórico, o memoria vacía tras un reinicio
+            source = "database"
+            recent_data = await asyncio.to_thread(
+                timeseries_store.query_sensor_readings, device_id, start, end, limit
+            )
         
         return {
             "status": "success",
             "device_id": device_id,
             "records": recent_data,
             "total_records": len(recent_data),
-            "latest_timestamp": recent_data[-1]["timestamp"] if recent_data else None
+            "latest_timestamp": recent_data[-1]["timestamp"] if recent_data else None,
+            "source": source
         }
         
+    except HTTPException:
+        raise
+        
     except Exception as e:
         logger.error(f"Error getting sensor data for {device_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/esp32-control/command/{device_id}")
-async def send_command_to_device(device_id: str, command: ESP32Command):
+async def send_command_to_device(device_id: str, command: ESP32Command, classified_at: Optional[float] = None):
     """Enviar comando a un dispositivo ESP32-CONTROL"""
     try:
         if device_id not in esp32_devices:
             raise HTTPException(status_code=404, detail=f"Device {device_id} not found")
         
-        # Agregar comando a la cola
-        if device_id not in pending_commands:
-            pending_commands[device_id] = []
-        
-        command_dict = {
-            "command": command.command,
-            "parameters": command.parameters or {},
-            "priority": command.priority or 1,
-            "timestamp": datetime.now().isoformat(),
-            "id": f"cmd_{len(pending_commands[device_id])}"
-        }
-        
-        pending_commands[device_id].append(command_dict)
-        
-        # Ordenar por prioridad (1 = alta prioridad primero)
-        pending_commands[device_id].sort(key=lambda x: x["priority"])
+        # Agregar comando a la cola de prioridad (1 = alta prioridad primero, FIFO entre iguales);
+        # despierta al instante el WebSocket / long-poll del dispositivo si lo hay
+        command_dict = command_queue.enqueue(
+            device_id,
+            command.command,
+            parameters=command.parameters,
+            priority=command.priority or 1,
+            ttl_seconds=command.ttl_seconds,
+            classified_at=classified_at
+        )
+        timeseries_store.save_state("commands", device_id, command_queue.snapshot(device_id))
         
         logger.info(f"Command queued for {device_id}: {command.command}")
         
@@ -311,21 +371,119 @@ async def send_command_to_device(device_id: str, command: ESP32Command):
             "status": "success",
             "message": f"Command queued for {device_id}",
             "command": command_dict,
-            "queue_size": len(pending_commands[device_id])
+            "queue_size": command_queue.depth(device_id)
         }
         
+    except CommandQueueFullError as e:
+        logger.warning(f"Command backpressure: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error queuing command for {device_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/esp32-control/command/{device_id}")
+async def get_pending_commands(device_id: str):
+    """Comandos pendientes de un dispositivo en orden de entrega"""
+    return {
+        "status": "success",
+        "device_id": device_id,
+        "pending_commands": command_queue.pending(device_id),
+        "queue_size": command_queue.depth(device_id),
+        "inflight": command_queue.inflight(device_id)
+    }
+
+@router.get("/esp32-control/command/{device_id}/poll")
+async def poll_commands(
+    device_id: str,
+    timeout: float = 20.0,
+    ack: Optional[List[str]] = Query(None)
+):
+    """Long-poll de comandos: responde en cuanto se encola uno o al vencer el timeout"""
+    touch_control_device(device_id)
+    # El dispositivo puede confirmar los comandos anteriores en la misma petición
+    acked = command_queue.ack(device_id, ack) if ack else 0
+    timeout = min(max(timeout, 0.0), settings.COMMAND_POLL_TIMEOUT_SECONDS)
+    commands = command_queue.drain(device_id, track_ack=True) if await command_queue.wait(device_id, timeout) else []
+    if acked:
+        timeseries_store.save_state("commands", device_id, command_queue.snapshot(device_id))
+    return {
+        "status": "success",
+        "device_id": device_id,
+        "commands": commands,
+        "acked": acked,
+        "ack_timeout_seconds": command_queue.ack_timeout
+    }
+
+@router.post("/esp32-control/command/{device_id}/ack")
+async def ack_commands(device_id: str, ack: ESP32CommandAck):
+    """Confirmar comandos recibidos por long-poll o WebSocket"""
+    acked = command_queue.ack(device_id, ack.ids)
+    if acked:
+        timeseries_store.save_state("commands", device_id, command_queue.snapshot(device_id))
+    return {"status": "success", "device_id": device_id, "acked": acked}
+
+async def _receive_command_acks(websocket: WebSocket, device_id: str):
+    """Leer acks ({"type": "ack", "ids": [...]}) y pongs del canal de comandos"""
+    try:
+        while True:
+            message = await websocket.receive_json()
+            touch_control_device(device_id)
+            if not isinstance(message, dict) or message.get("type") != "ack":
+                continue
+            ids = message.get("ids") or ([message["id"]] if message.get("id") else [])
+            if command_queue.ack(device_id, [str(command_id) for command_id in ids]):
+                timeseries_store.save_state("commands", device_id, command_queue.snapshot(device_id))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    except ValueError as e:
+        logger.warning(f"Invalid message on command channel of {device_id}: {e}")
+
+@router.websocket("/esp32-control/ws/{device_id}")
+async def command_channel(websocket: WebSocket, device_id: str):
+    """Canal push de comandos para ESP32-CONTROL: entrega inmediata al encolar y ack por comando"""
+    await websocket.accept()
+    touch_control_device(device_id)
+    command_queue.connect(device_id)
+    logger.info(f"Command channel opened for {device_id}")
+    receiver = asyncio.create_task(_receive_command_acks(websocket, device_id))
+    try:
+        while not receiver.done():
+            waiter = asyncio.create_task(command_queue.wait(device_id, settings.COMMAND_WS_HEARTBEAT_SECONDS))
+            await asyncio.wait({waiter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if not waiter.done():
+                waiter.cancel()
+                break
+            commands = command_queue.drain(device_id, track_ack=True) if waiter.result() else []
+            if commands:
+                await websocket.send_json({"type": "commands", "commands": commands})
+            else:
+                await websocket.send_json({"type": "ping", "timestamp": datetime.now().isoformat()})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    except Exception as e:
+        logger.error(f"Error in command channel for {device_id}: {e}")
+    finally:
+        receiver.cancel()
+        # Lo entregado sin ack vuelve a la cola para el siguiente canal (o el sondeo de sensores)
+        command_queue.disconnect(device_id)
+        timeseries_store.save_state("commands", device_id, command_queue.snapshot(device_id))
+        logger.info(f"Command channel closed for {device_id}")
+
 @router.post("/classification/result")
 async def record_classification_result(classification: ESP32Classification):
     """Registrar resultado de clasificación"""
+    # Inicio de la latencia clasificación -> servo (reloj del servidor; el del dispositivo puede ir desfasado)
+    received_at = time.time()
     try:
         # Guardar resultado
         classification_history.append(classification.dict())
+        timeseries_store.add_classification(classification)
+        # Agregados incrementales: las estadísticas no vuelven a recorrer el historial
+        classification_stats.record(
+            classification.material, classification.confidence, classification.device_id, classification.timestamp
+        )
         
         # Mantener solo los últimos 500 registros
         if len(classification_history) > 500:
@@ -343,7 +501,7 @@ async def record_classification_result(classification: ESP32Classification):
             priority=1
         )
         
-        await send_command_to_device(classification.device_id, servo_command)
+        await send_command_to_device(classification.device_id, servo_command, classified_at=received_at)
         
         logger.info(f"Classification recorded: {classification.material} with {classification.confidence:.2f} confidence")
         
@@ -353,26 +511,38 @@ async def record_classification_result(classification: ESP32Classification):
             "classification": classification.dict()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error recording classification: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/classification/history")
-async def get_classification_history(limit: int = 100):
-    """Obtener historial de clasificaciones"""
+async def get_classification_history(
+    limit: int = 100,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    device_id: Optional[str] = None
+):
+    """Obtener historial de clasificaciones (rango [start, end] desde SQLite)
+
+    ``statistics.material_counts`` y ``average_confidence`` describen las clasificaciones devueltas, como
+    antes; los agregados desde el arranque (total, hoy, ventanas, dispositivos) van en el resto de claves.
+    """
     try:
-        recent_classifications = classification_history[-limit:] if classification_history else []
-        
-        # Estadísticas
-        material_counts = {}
-        total_confidence = 0
+        if (start is not None or end is not None or device_id or not classification_history) and timeseries_store.enabled:
+            recent_classifications = await asyncio.to_thread(
+                timeseries_store.query_classifications, start, end, device_id, limit
+            )
+        else:
+            recent_classifications = classification_history[-limit:] if classification_history else []
         
+        material_counts: Dict[str, int] = {}
+        total_confidence = 0.0
         for record in recent_classifications:
-            material = record["material"]
-            material_counts[material] = material_counts.get(material, 0) + 1
+            material_counts[record["material"]] = material_counts.get(record["material"], 0) + 1
             total_confidence += record["confidence"]
-        
-        avg_confidence = total_confidence / len(recent_classifications) if recent_classifications else 0
+        average_confidence = total_confidence / len(recent_classifications) if recent_classifications else 0
         
         return {
             "status": "success",
@@ -380,7 +550,8 @@ async def get_classification_history(limit: int = 100):
             "total_records": len(recent_classifications),
             "statistics": {
                 "material_counts": material_counts,
-                "average_confidence": round(avg_confidence, 3)
+                "average_confidence": round(average_confidence, 3),
+                **classification_stats.snapshot(device_id)
             }
         }
         
@@ -388,6 +559,15 @@ async def get_classification_history(limit: int = 100):
         logger.error(f"Error getting classification history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/classification/stats")
+async def get_classification_stats(device_id: Optional[str] = None):
+    """Estadísticas de clasificación (total, hoy, último minuto/hora) sin devolver el historial"""
+    return {
+        "status": "success",
+        "statistics": classification_stats.snapshot(device_id),
+        "timestamp": datetime.now()
+    }
+
 @router.get("/system/status")
 async def get_system_status():
     """Obtener estado general del sistema"""
@@ -396,7 +576,7 @@ async def get_system_status():
         total_devices = len(esp32_devices)
         
         # Últimos sensores
-        latest_sensors = sensor_history[-1] if sensor_history else None
+        latest_sensors = sensor_store.last_reading()
         
         # Última clasificación
         latest_classification = classification_history[-1] if classification_history else None
@@ -410,8 +590,11 @@ async def get_system_status():
                 "offline": total_devices - online_devices
             },
             "latest_sensor_data": latest_sensors,
+            "sensor_history": sensor_store.get_stats(),
+            "timeseries": timeseries_store.get_stats(),
             "latest_classification": latest_classification,
-            "pending_commands": sum(len(cmds) for cmds in pending_commands.values()),
+            "pending_commands": command_queue.total_depth(),
+            "command_queue": command_queue.get_stats(),
             "uptime_seconds": (datetime.now() - datetime(2024, 1, 1)).total_seconds(),
             "timestamp": datetime.now()
         }
@@ -420,6 +603,32 @@ async def get_system_status():
         logger.error(f"Error getting system status: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+state_restored = False
+
+@router.on_event("startup")
+async def restore_device_state():
+    """Abrir la serie temporal y recuperar dispositivos y comandos pendientes tras un reinicio"""
+    global state_restored
+    if state_restored:
+        return
+    state_restored = True
+    try:
+        await asyncio.to_thread(timeseries_store.open)
+        for device_id, data in (await asyncio.to_thread(timeseries_store.load_state, "device")).items():
+            # Offline hasta que el dispositivo vuelva a reportar
+            esp32_devices.setdefault(device_id, ESP32Status(**{**data, "status": "offline"}))
+        for device_id, commands in (await asyncio.to_thread(timeseries_store.load_state, "commands")).items():
+            command_queue.restore(device_id, commands)
+        # Reconstruir las estadísticas de hoy (y las ventanas) con lo ya guardado
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        classification_stats.replay(
+            await asyncio.to_thread(timeseries_store.query_classifications, today, None, None, 10 ** 6)
+        )
+        if esp32_devices:
+            logger.info(f"Restored {len(esp32_devices)} devices from {timeseries_store.path}")
+    except Exception as e:
+        logger.error(f"Error restoring device state: {e}")
+
 # Funciones de limpieza automática
 @router.on_event("startup")
 async def cleanup_offline_devices():
@@ -432,9 +641,10 @@ async def cleanup_offline_devices():
                 
                 offline_devices = []
                 for device_id, device in esp32_devices.items():
-                    if device.last_seen < cutoff_time:
+                    if device.last_seen < cutoff_time and device.status != "offline":
                         device.status = "offline"
                         offline_devices.append(device_id)
+                        timeseries_store.save_state("device", device_id, device.dict())
                 
                 if offline_devices:
                     logger.info(f"Marked {len(offline_devices)} devices as offline")
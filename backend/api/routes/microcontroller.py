@@ -4,6 +4,8 @@ from typing import Dict, Any, Optional
 import logging
 from datetime import datetime
 
+from config import settings, get_servo_position
+
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
@@ -102,16 +104,10 @@ async def update_classification_result(result: Dict[str, Any]):
         system_state["last_classification"] = predicted_class
         
         # Lógica de separación basada en el material detectado
-        servo_positions = {
-            "glass": 45,      # Posición para vidrio
-            "plastic": 90,    # Posición para plástico
-            "metal": 135      # Posición para metal
-        }
-        
-        target_position = servo_positions.get(predicted_class, 90)
+        target_position = get_servo_position(predicted_class)
         
         # Activar sistema de separación si la confianza es alta
-        if confidence > 0.7:
+        if confidence > settings.MODEL_CONFIDENCE_THRESHOLD:
             system_state["servo_position"] = target_position
             system_state["motor_active"] = True
             
@@ -133,7 +129,7 @@ async def update_classification_result(result: Dict[str, Any]):
                 "status": "low_confidence",
                 "message": "Confianza insuficiente para separación automática",
                 "confidence": confidence,
-                "threshold": 0.7
+                "threshold": settings.MODEL_CONFIDENCE_THRESHOLD
             }
             
     except Exception as e:
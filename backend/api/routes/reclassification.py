@@ -0,0 +1,173 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any
+import asyncio
+import concurrent.futures
+import logging
+import os
+
+from config import get_captured_images_path, settings
+from services.inference_executor import inference_executor
+from services.model_registry import ModelVersion, model_registry
+from services.reclassification import ReclassificationJob, summarize_results
+
+router = APIRouter()
+
+logger = logging.getLogger(__name__)
+
+# Trabajo de re-clasificación en curso (o el último terminado)
+current_job: Optional[ReclassificationJob] = None
+current_task: Optional[asyncio.Task] = None
+
+
+def _images_root() -> str:
+    return settings.IMAGE_ARCHIVE_PATH or get_captured_images_path()
+
+
+def _resolve_under(root: str, relative: Optional[str], what: str) -> str:
+    """Ruta relativa dentro de ``root``; 400 si es absoluta, usa '..' o sale de root (también por symlinks)"""
+    if not root:
+        raise HTTPException(status_code=503, detail=f"No {what} root configured")
+    root = os.path.realpath(root)
+    if not relative:
+        return root
+    if os.path.isabs(relative) or ".." in relative.replace("\\", "/").split("/"):
+        raise HTTPException(status_code=400, detail=f"{what} must be a relative path without '..'")
+    path = os.path.realpath(os.path.join(root, relative))
+    if os.path.commonpath([root, path]) != root:
+        raise HTTPException(status_code=400, detail=f"{what} is outside its root directory")
+    return path
+
+
+async def _run_job(job: ReclassificationJob, pinned: Optional[ModelVersion]) -> Dict:
+    """Ejecutar el trabajo en un hilo; la versión reservada se libera al terminar"""
+    loop = asyncio.get_running_loop()
+
+    def predict(images):
+        # Cada lote pasa por el pool del modelo compartido con /predict, en orden de llegada
+        future = asyncio.run_coroutine_threadsafe(inference_executor.run_model(job.backend.predict, images), loop)
+        try:
+            return future.result(timeout=settings.RECLASSIFY_PREDICT_TIMEOUT_SECONDS)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Model batch did not finish in {settings.RECLASSIFY_PREDICT_TIMEOUT_SECONDS}s")
+
+    job.predict = predict
+    try:
+        return await asyncio.to_thread(job.run)
+    finally:
+        if pinned is not None:
+            model_registry.unpin(pinned)
+
+
+class ReclassificationRequest(BaseModel):
+    output_dir: str = Field(..., description="Subdirectorio de RECLASSIFY_OUTPUT_ROOT; si ya tiene un checkpoint se reanuda")
+    images_dir: Optional[str] = Field(None, description="Subdirectorio del archivo de imágenes (por defecto el archivo completo)")
+    model_name: Optional[str] = Field(None, description="Modelo relativo a MODEL_PATH; por defecto el modelo activo")
+    batch_size: int = Field(32, ge=1, description="Imágenes por lote de inferencia")
+    workers: int = Field(2, ge=1, description="Hilos de decodificación")
+    shard_size: int = Field(10000, ge=1, description="Imágenes por shard de resultados")
+    limit: int = Field(0, ge=0, description="Máximo de imágenes (0 = todas)")
+
+
+@router.post("/start", response_model=Dict[str, Any])
+async def start_reclassification(request: ReclassificationRequest):
+    """
+    Lanzar en segundo plano la re-clasificación del archivo de imágenes
+    """
+    global current_job, current_task
+
+    if current_task is not None and not current_task.done():
+        raise HTTPException(status_code=409, detail="A reclassification job is already running")
+
+    images_dir = _resolve_under(_images_root(), request.images_dir, "images_dir")
+    output_dir = _resolve_under(settings.RECLASSIFY_OUTPUT_ROOT, request.output_dir, "output_dir")
+    if output_dir == os.path.realpath(settings.RECLASSIFY_OUTPUT_ROOT):
+        raise HTTPException(status_code=400, detail="output_dir must name a subdirectory")
+    if not os.path.isdir(images_dir):
+        raise HTTPException(status_code=404, detail=f"Images directory not found: {images_dir}")
+
+    backend = None
+    pinned = None
+    model_path = ""
+    if request.model_name:
+        model_path = _resolve_under(settings.MODEL_PATH, request.model_name, "model_name")
+        if not os.path.exists(model_path):
+            raise HTTPException(status_code=404, detail=f"Model {request.model_name} not found")
+    else:
+        # Reutilizar el modelo servido, reservado para que un cambio de versión no lo expulse a mitad del trabajo
+        try:
+            pinned = model_registry.pin_active()
+        except ValueError:
+            raise HTTPException(status_code=503, detail="No active model; pass model_name")
+        backend = pinned.backend
+
+    try:
+        job = ReclassificationJob(
+            images_dir=images_dir,
+            output_dir=output_dir,
+            model_path=model_path,
+            backend=backend,
+            batch_size=request.batch_size,
+            workers=request.workers,
+            shard_size=request.shard_size,
+            limit=request.limit
+        )
+    except ValueError as e:
+        if pinned is not None:
+            model_registry.unpin(pinned)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    current_job = job
+    current_task = asyncio.create_task(_run_job(job, pinned))
+    logger.info(f"Reclassification started: {images_dir} -> {output_dir}")
+    return {"success": True, "status": job.get_status()}
+
+
+@router.get("/status", response_model=Dict[str, Any])
+async def get_reclassification_status():
+    """
+    Progreso del trabajo de re-clasificación actual
+    """
+    if current_job is None:
+        return {"state": "idle"}
+    return current_job.get_status()
+
+
+@router.post("/cancel", response_model=Dict[str, Any])
+async def cancel_reclassification():
+    """
+    Detener el trabajo tras el lote actual (se puede reanudar con el mismo output_dir)
+    """
+    if current_job is None or current_task is None or current_task.done():
+        raise HTTPException(status_code=409, detail="No reclassification job is running")
+    current_job.cancel()
+    return {"success": True, "status": await current_task}
+
+
+@router.get("/summary", response_model=Dict[str, Any])
+async def get_reclassification_summary(output_dir: Optional[str] = None):
+    """
+    Distribución de clases y acuerdo con la clase archivada de un trabajo
+    """
+    if output_dir:
+        output_dir = _resolve_under(settings.RECLASSIFY_OUTPUT_ROOT, output_dir, "output_dir")
+    elif current_job is not None:
+        output_dir = current_job.output_dir
+    else:
+        raise HTTPException(status_code=404, detail="No reclassification output to summarize")
+    try:
+        return await asyncio.to_thread(summarize_results, output_dir)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"No reclassification results in {output_dir}")
+
+
+async def shutdown_reclassification():
+    """Cancelar el trabajo en curso y esperar a que guarde su último shard (llamar antes de parar el ejecutor)"""
+    if current_job is None or current_task is None or current_task.done():
+        return
+    current_job.cancel()
+    try:
+        await asyncio.wait_for(asyncio.shield(current_task), settings.RECLASSIFY_SHUTDOWN_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"Reclassification job still running after {settings.RECLASSIFY_SHUTDOWN_TIMEOUT_SECONDS}s")
@@ -3,7 +3,6 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, List, Any
 import requests
-import boto3
 import json
 import logging
 from datetime import datetime, timedelta
@@ -0,0 +1,387 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set
+
+import aiohttp
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Ventana para calcular los fps recibidos de cada cámara
+FPS_WINDOW_SECONDS = 10.0
+# Ventana para las tasas de peticiones al dispositivo y de lecturas de consumidores
+RATE_WINDOW_SECONDS = 60.0
+# Espera entre reconexiones al stream (se duplica hasta el máximo)
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
+
+@dataclass
+class Frame:
+    seq: int
+    data: bytes
+    timestamp: datetime
+    received_at: float
+
+
+async def iter_mjpeg_frames(content: Any) -> AsyncIterator[bytes]:
+    """JPEGs de un multipart/x-mixed-replace (StreamReader de aiohttp) tal cual llegan, sin decodificar"""
+    while True:
+        line = await content.readline()
+        if not line:
+            return
+        if not line.startswith(b"--"):
+            continue
+        headers = {}
+        while True:
+            line = await content.readline()
+            if not line:
+                return
+            line = line.strip()
+            if not line:
+                break
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get(b"content-length", b"0") or 0)
+        # El CameraWebServer siempre manda Content-Length; si falta, leer hasta el fin de JPEG
+        yield await content.readexactly(length) if length else await content.readuntil(b"\xff\xd9")
+
+
+class StreamClient:
+    """Consumidor de un stream: una ranura con el último frame, así un cliente lento salta frames en vez de acumularlos"""
+
+    def __init__(self, websocket: Any, fps: float, send_timeout: float):
+        self.websocket = websocket
+        self.fps = fps
+        self.send_timeout = send_timeout
+        self.pending: Optional[Frame] = None
+        # Mensajes de control (JSON) que se envían antes del siguiente frame
+        self.messages: Deque[Dict] = deque()
+        self.ready = asyncio.Event()
+        self.connected_at = datetime.now()
+        self.sent = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+        self.last_lag_ms = 0.0
+
+    def offer(self, frame: Frame):
+        """Dejar el frame en la ranura; el que no llegó a enviarse se descarta"""
+        if self.pending is not None:
+            self.skipped += 1
+        self.pending = frame
+        self.ready.set()
+
+    def notify(self, message: Dict):
+        """Encolar un mensaje de texto por el mismo escritor que los frames"""
+        self.messages.append(message)
+        self.ready.set()
+
+    def set_fps(self, fps: float):
+        self.fps = fps
+        self.notify({"type": "stream_config", "fps": fps})
+
+    async def run(self):
+        next_send = 0.0
+        while True:
+            await self.ready.wait()
+            while self.messages:
+                await asyncio.wait_for(self.websocket.send_json(self.messages.popleft()), self.send_timeout)
+            # Limitar a los fps negociados; lo que llegue mientras tanto sustituye al frame pendiente
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            frame = self.pending
+            self.pending = None
+            if not self.messages:
+                self.ready.clear()
+            if frame is None:
+                continue
+            started = time.monotonic()
+            await asyncio.wait_for(self.websocket.send_bytes(frame.data), self.send_timeout)
+            next_send = started + 1.0 / self.fps
+            self.sent += 1
+            self.bytes_sent += len(frame.data)
+            self.last_lag_ms = round((time.monotonic() - frame.received_at) * 1000, 2)
+
+    def get_stats(self) -> Dict:
+        return {
+            "fps": self.fps,
+            "connected_at": self.connected_at.isoformat(),
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "bytes_sent": self.bytes_sent,
+            "last_lag_ms": self.last_lag_ms
+        }
+
+
+def _rate_per_minute(events: Deque[float], now: float) -> float:
+    while events and now - events[0] > RATE_WINDOW_SECONDS:
+        events.popleft()
+    return round(len(events) * 60.0 / RATE_WINDOW_SECONDS, 2)
+
+
+class CameraFeed:
+    """Lector único de un ESP32-CAM: reparte cada frame a los clientes del stream y lo deja en la ranura
+    del último frame (con su secuencia) para los consumidores de imágenes sueltas"""
+
+    def __init__(self, camera_ip: str, idle_seconds: float = 10.0):
+        self.camera_ip = camera_ip
+        self.idle_seconds = idle_seconds
+        self.url = f"http://{camera_ip}:{settings.CAMERA_STREAM_PORT}{settings.CAMERA_STREAM_PATH}"
+        self.capture_url = f"http://{camera_ip}/capture"
+        self.clients: Set[StreamClient] = set()
+        self.latest: Optional[Frame] = None
+        self.streaming = False
+        self.connecting = False
+        self._reader: Optional[asyncio.Task] = None
+        self._capture: Optional[asyncio.Task] = None
+        self._waiters: List[asyncio.Future] = []
+        self._idle_since: Optional[float] = None
+        self._last_demand = 0.0
+        self._recent: Deque[float] = deque()
+        self._device_requests: Deque[float] = deque()
+        self._reads: Deque[float] = deque()
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.connects = 0
+        self.captures = 0
+        self.reads = 0
+        self.slot_hits = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def ensure_running(self):
+        self._idle_since = None
+        if self._reader is None or self._reader.done():
+            self.connecting = True
+            self._reader = asyncio.create_task(self._run())
+
+    async def get_frame(self, max_age: float, timeout: float) -> Optional[Frame]:
+        """Último frame si no supera ``max_age`` segundos; si no, el siguiente del stream.
+
+        Sin stream disponible se hace una única petición /capture compartida por todos los que esperan.
+        """
+        now = time.monotonic()
+        self.reads += 1
+        self._reads.append(now)
+        self._last_demand = now
+        self.ensure_running()
+        latest = self.latest
+        if latest is not None and now - latest.received_at <= max_age:
+            self.slot_hits += 1
+            return latest
+        if self.streaming or self.connecting:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                frame = await asyncio.wait_for(waiter, timeout)
+                if frame is not None:
+                    return frame
+            except asyncio.TimeoutError:
+                logger.warning(f"No frame from {self.url} in {timeout}s, falling back to /capture")
+        return await self._capture_once()
+
+    async def _capture_once(self) -> Optional[Frame]:
+        if self._capture is None or self._capture.done():
+            self._capture = asyncio.create_task(self._fetch_capture())
+        return await asyncio.shield(self._capture)
+
+    async def _fetch_capture(self) -> Optional[Frame]:
+        self.captures += 1
+        self._device_requests.append(time.monotonic())
+        try:
+            timeout = aiohttp.ClientTimeout(total=settings.ESP32_TIMEOUT)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(self.capture_url) as response:
+                    if response.status != 200:
+                        logger.warning(f"HTTP {response.status} from {self.capture_url}")
+                        return None
+                    return self._publish(await response.read())
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e) or type(e).__name__
+            logger.error(f"Error capturing from {self.capture_url}: {self.last_error}")
+            return None
+
+    def _publish(self, data: bytes) -> Frame:
+        now = time.monotonic()
+        self.frames_received += 1
+        self.bytes_received += len(data)
+        frame = Frame(self.frames_received, data, datetime.now(), now)
+        self.latest = frame
+        self._recent.append(now)
+        while self._recent and now - self._recent[0] > FPS_WINDOW_SECONDS:
+            self._recent.popleft()
+        for client in self.clients:
+            client.offer(frame)
+        self._release_waiters(frame)
+        return frame
+
+    def _release_waiters(self, frame: Optional[Frame]):
+        # None: el stream ha fallado y los que esperaban pasan a /capture
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(frame)
+
+    def _idle(self) -> bool:
+        if self.clients or time.monotonic() - self._last_demand < self.idle_seconds:
+            self._idle_since = None
+            return False
+        if self._idle_since is None:
+            self._idle_since = time.monotonic()
+        return time.monotonic() - self._idle_since >= self.idle_seconds
+
+    async def _run(self):
+        delay = RECONNECT_DELAY
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=settings.ESP32_TIMEOUT, sock_read=settings.ESP32_TIMEOUT)
+        while not self._idle():
+            try:
+                self.connecting = True
+                async with aiohttp.ClientSession(timeout=timeout) as session:
+                    self._device_requests.append(time.monotonic())
+                    async with session.get(self.url) as response:
+                        if response.status != 200:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, (), status=response.status, message="stream unavailable"
+                            )
+                        self.connects += 1
+                        self.connecting = False
+                        self.streaming = True
+                        logger.info(f"Camera stream connected: {self.url}")
+                        delay = RECONNECT_DELAY
+                        async for data in iter_mjpeg_frames(response.content):
+                            self._publish(data)
+                            if self._idle():
+                                break
+            except asyncio.CancelledError:
+                self.streaming = self.connecting = False
+                raise
+            except Exception as e:
+                self.streaming = self.connecting = False
+                self._release_waiters(None)
+                self.errors += 1
+                self.last_error = str(e) or type(e).__name__
+                logger.warning(f"Camera stream {self.url} failed: {self.last_error}; retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+        self.streaming = self.connecting = False
+        logger.info(f"Camera stream closed (idle): {self.url}")
+
+    def stop(self):
+        if self._reader is not None:
+            self._reader.cancel()
+
+    def get_stats(self) -> Dict:
+        now = time.monotonic()
+        recent = [t for t in self._recent if now - t <= FPS_WINDOW_SECONDS]
+        return {
+            "url": self.url,
+            "running": self._reader is not None and not self._reader.done(),
+            "frames_received": self.frames_received,
+            "bytes_received": self.bytes_received,
+            "upstream_fps": round(len(recent) / FPS_WINDOW_SECONDS, 2),
+            "latest_seq": self.latest.seq if self.latest else None,
+            "latest_age_ms": round((now - self.latest.received_at) * 1000, 1) if self.latest else None,
+            "streaming": self.streaming,
+            "connects": self.connects,
+            "captures": self.captures,
+            "reads": self.reads,
+            "slot_hits": self.slot_hits,
+            # Peticiones HTTP al ESP32 (conexiones de stream + /capture) frente a lecturas de los consumidores
+            "device_requests_per_minute": _rate_per_minute(self._device_requests, now),
+            "consumer_reads_per_minute": _rate_per_minute(self._reads, now),
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "clients": [client.get_stats() for client in self.clients]
+        }
+
+
+class CameraHub:
+    """Un CameraFeed por ESP32-CAM: la cámara se lee una vez sin importar cuántos clientes o consumidores haya"""
+
+    def __init__(self,
+                 default_fps: float = 5.0,
+                 max_fps: float = 15.0,
+                 idle_seconds: float = 10.0,
+                 send_timeout: float = 10.0,
+                 max_age: float = 0.5,
+                 frame_timeout: float = 2.0):
+        self.default_fps = default_fps
+        self.max_fps = max_fps
+        self.idle_seconds = idle_seconds
+        self.send_timeout = send_timeout
+        self.max_age = max_age
+        self.frame_timeout = frame_timeout
+        self.feeds: Dict[str, CameraFeed] = {}
+
+    def feed(self, camera_ip: str) -> CameraFeed:
+        feed = self.feeds.get(camera_ip)
+        if feed is None:
+            feed = self.feeds[camera_ip] = CameraFeed(camera_ip, self.idle_seconds)
+        return feed
+
+    async def get_frame(self, camera_ip: str, max_age: Optional[float] = None) -> Optional[Frame]:
+        """Frame de la cámara con antigüedad máxima ``max_age`` (por defecto CAMERA_FRAME_MAX_AGE) sin pedirlo al dispositivo si ya está"""
+        return await self.feed(camera_ip).get_frame(
+            self.max_age if max_age is None else max_age, self.frame_timeout
+        )
+
+    def negotiate_fps(self, requested: Optional[float]) -> float:
+        """fps pedidos por el cliente acotados a (0, CAMERA_STREAM_MAX_FPS]"""
+        if requested is None or requested <= 0:
+            return min(self.default_fps, self.max_fps)
+        return min(float(requested), self.max_fps)
+
+    def subscribe(self, camera_ip: str, websocket: Any, fps: Optional[float] = None) -> StreamClient:
+        """Registrar un cliente y arrancar el lector de la cámara si no estaba activo"""
+        client = StreamClient(websocket, self.negotiate_fps(fps), self.send_timeout)
+        client.notify({
+            "type": "stream_config",
+            "camera": camera_ip,
+            "fps": client.fps,
+            "max_fps": self.max_fps,
+            "format": "image/jpeg"
+        })
+        feed = self.feed(camera_ip)
+        feed.clients.add(client)
+        feed.ensure_running()
+        if feed.latest is not None:
+            # Imagen inmediata para el cliente nuevo
+            client.offer(feed.latest)
+        return client
+
+    def unsubscribe(self, camera_ip: str, client: StreamClient):
+        """Quitar un cliente; el lector se cierra tras idle_seconds sin consumidores"""
+        feed = self.feeds.get(camera_ip)
+        if feed is not None:
+            feed.clients.discard(client)
+
+    def close(self):
+        for feed in self.feeds.values():
+            feed.stop()
+
+    def get_stats(self) -> Dict:
+        """Obtener fps de subida, peticiones al dispositivo, lecturas y clientes por cámara"""
+        return {
+            "max_age": self.max_age,
+            "default_fps": self.default_fps,
+            "max_fps": self.max_fps,
+            "cameras": {camera_ip: feed.get_stats() for camera_ip, feed in self.feeds.items()}
+        }
+
+
+# Instancia global del hub de cámaras
+camera_hub = CameraHub(
+    default_fps=settings.CAMERA_STREAM_DEFAULT_FPS,
+    max_fps=settings.CAMERA_STREAM_MAX_FPS,
+    idle_seconds=settings.CAMERA_STREAM_IDLE_SECONDS,
+    send_timeout=settings.WS_MESSAGE_TIMEOUT,
+    max_age=settings.CAMERA_FRAME_MAX_AGE,
+    frame_timeout=settings.CAMERA_FRAME_TIMEOUT
+)
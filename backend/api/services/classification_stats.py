@@ -0,0 +1,165 @@
+import logging
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Histograma de confianza en 10 intervalos de 0.1
+HISTOGRAM_BINS = 10
+
+
+class RunningStats:
+    """Contadores acumulados de clasificaciones: totales, por material e histograma de confianza"""
+
+    __slots__ = ("count", "confidence_sum", "materials", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.confidence_sum = 0.0
+        # material -> [clasificaciones, suma de confianza]
+        self.materials: Dict[str, List[float]] = {}
+        self.histogram = [0] * HISTOGRAM_BINS
+
+    def add(self, material: str, confidence: float, sign: int = 1):
+        self.count += sign
+        self.confidence_sum += sign * confidence
+        entry = self.materials.get(material)
+        if entry is None:
+            entry = self.materials[material] = [0, 0.0]
+        entry[0] += sign
+        entry[1] += sign * confidence
+        self.histogram[min(max(int(confidence * HISTOGRAM_BINS), 0), HISTOGRAM_BINS - 1)] += sign
+
+    def merge(self, other: "RunningStats", sign: int = 1):
+        """Sumar (o restar con sign=-1) otro acumulado"""
+        self.count += sign * other.count
+        self.confidence_sum += sign * other.confidence_sum
+        for material, (count, confidence_sum) in other.materials.items():
+            entry = self.materials.setdefault(material, [0, 0.0])
+            entry[0] += sign * count
+            entry[1] += sign * confidence_sum
+        for i, count in enumerate(other.histogram):
+            self.histogram[i] += sign * count
+        if self.count == 0:
+            # Evitar que los errores de redondeo de las restas se acumulen
+            self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.confidence_sum = 0.0
+        self.materials.clear()
+        self.histogram = [0] * HISTOGRAM_BINS
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "average_confidence": round(self.confidence_sum / self.count, 3) if self.count else 0,
+            "material_counts": {material: int(count) for material, (count, _) in self.materials.items() if count},
+            "material_confidence": {
+                material: round(confidence_sum / count, 3)
+                for material, (count, confidence_sum) in self.materials.items() if count
+            },
+            "confidence_histogram": list(self.histogram)
+        }
+
+
+class SlidingWindow:
+    """Ventana deslizante en N ranuras de tiempo; al avanzar se restan sólo las ranuras caducadas"""
+
+    def __init__(self, seconds: int, slots: int = 60):
+        self.seconds = seconds
+        self.slot_seconds = seconds / slots
+        self.slots = [RunningStats() for _ in range(slots)]
+        self.total = RunningStats()
+        self._current: Optional[int] = None
+
+    def _advance(self, now: float):
+        current = int(now // self.slot_seconds)
+        if self._current is None:
+            self._current = current
+            return
+        if current <= self._current:
+            return
+        # Como mucho una vuelta completa: O(ranuras) en el peor caso, O(1) amortizado
+        for slot_id in range(max(self._current + 1, current - len(self.slots) + 1), current + 1):
+            slot = self.slots[slot_id % len(self.slots)]
+            if slot.count:
+                self.total.merge(slot, sign=-1)
+                slot.reset()
+        self._current = current
+
+    def add(self, material: str, confidence: float, timestamp: float, now: float):
+        self._advance(now)
+        slot_id = int(timestamp // self.slot_seconds)
+        if slot_id <= self._current - len(self.slots):
+            return
+        self.slots[slot_id % len(self.slots)].add(material, confidence)
+        self.total.add(material, confidence)
+
+    def snapshot(self, now: float) -> Dict:
+        self._advance(now)
+        return {"window_seconds": self.seconds, **self.total.to_dict()}
+
+
+class ClassificationStats:
+    """Agregados incrementales de clasificaciones: total, hoy, ventanas deslizantes y por dispositivo"""
+
+    def __init__(self, windows: Optional[Dict[str, int]] = None):
+        windows = windows or {"last_minute": 60, "last_hour": 3600}
+        self.windows = {name: SlidingWindow(seconds) for name, seconds in windows.items()}
+        self.total = RunningStats()
+        self.today = RunningStats()
+        self.today_date: date = date.today()
+        self.devices: Dict[str, RunningStats] = {}
+        self.started_at = datetime.now()
+
+    def _roll_day(self, today: date):
+        if today != self.today_date:
+            self.today.reset()
+            self.today_date = today
+
+    def record(self, material: str, confidence: float, device_id: str, timestamp: Optional[datetime] = None):
+        """Sumar una clasificación a todos los agregados (O(ventanas))"""
+        now = time.time()
+        # Relojes de dispositivo adelantados: la clasificación cuenta como ocurrida ahora
+        ts = min(timestamp.timestamp(), now) if timestamp is not None else now
+        self.total.add(material, confidence)
+        self.devices.setdefault(device_id, RunningStats()).add(material, confidence)
+        self._roll_day(date.today())
+        if date.fromtimestamp(ts) == self.today_date:
+            self.today.add(material, confidence)
+        for window in self.windows.values():
+            window.add(material, confidence, ts, now)
+
+    def snapshot(self, device_id: Optional[str] = None) -> Dict:
+        """Estadísticas actuales sin recorrer el historial"""
+        now = time.time()
+        self._roll_day(date.today())
+        total = self.total.to_dict()
+        stats = {
+            "since": self.started_at.isoformat(),
+            "total": total,
+            "today": {"date": self.today_date.isoformat(), **self.today.to_dict()},
+            "windows": {name: window.snapshot(now) for name, window in self.windows.items()}
+        }
+        if device_id is not None:
+            device = self.devices.get(device_id)
+            stats["device"] = {"device_id": device_id, **(device or RunningStats()).to_dict()}
+        else:
+            stats["devices"] = {
+                name: {"count": device.count, "material_counts": device.to_dict()["material_counts"]}
+                for name, device in self.devices.items()
+            }
+        return stats
+
+    def replay(self, records: List[Dict]):
+        """Reconstruir hoy y las ventanas a partir de clasificaciones guardadas (al arrancar)"""
+        for record in records:
+            self.record(record["material"], record["confidence"], record["device_id"], record["timestamp"])
+        if records:
+            logger.info(f"Classification statistics rebuilt from {len(records)} stored records")
+
+
+# Instancia global de agregados de clasificación
+classification_stats = ClassificationStats()
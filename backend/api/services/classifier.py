@@ -0,0 +1,176 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from config import settings, get_servo_position
+from services.inference_engine import inference_engine
+from services.inference_executor import inference_executor, InferenceOverloadedError
+from services.ingestion import tensor_pool
+from services.preprocessing import INPUT_SIZE, ImageSource, preprocess_image_bytes
+from services.result_cache import result_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class ClassificationResult:
+    """Resultado compacto de clasificación de una imagen"""
+
+    class_index: int
+    predicted_class: str
+    confidence: float
+    probabilities: Tuple[float, ...]
+    servo_position: int
+    actionable: bool
+
+    def to_dict(self, class_names: Sequence[str]) -> Dict:
+        return {
+            "predicted_class": self.predicted_class,
+            "confidence": self.confidence,
+            "confidence_percentage": f"{self.confidence * 100:.1f}%",
+            "all_probabilities": dict(zip(class_names, self.probabilities)),
+            "servo_position": self.servo_position,
+            "material_type": self.predicted_class.title()
+        }
+
+
+def preprocess_many(images: Sequence[ImageSource],
+                    out: Optional[List[np.ndarray]] = None) -> Tuple[List[np.ndarray], List[Optional[str]]]:
+    """Preprocesar N imágenes en tensores (H, W, 3) preasignados; los errores se devuelven por imagen"""
+    if out is None:
+        out = list(np.empty((len(images), *INPUT_SIZE[::-1], 3), dtype=np.float32))
+    errors: List[Optional[str]] = [None] * len(images)
+    for i, image_data in enumerate(images):
+        try:
+            preprocess_image_bytes(image_data, out[i])
+        except Exception as e:
+            errors[i] = f"Error al procesar imagen: {e}"
+    return out, errors
+
+
+class ClassifierService:
+    """Servicio único de clasificación: preprocesado, inferencia y mapeo a servo para N imágenes"""
+
+    def __init__(self):
+        # Configuración leída una sola vez de config.Settings
+        self.class_names: Tuple[str, ...] = tuple(settings.MODEL_CLASSES)
+        self.input_size: Tuple[int, int] = INPUT_SIZE
+        self.threshold: float = settings.MODEL_CONFIDENCE_THRESHOLD
+        self.servo_positions = np.array([get_servo_position(name) for name in self.class_names])
+
+    @property
+    def ready(self) -> bool:
+        return inference_engine.model is not None
+
+    def interpret(self, probabilities: np.ndarray) -> List[ClassificationResult]:
+        """Convertir probabilidades (N, C) en resultados con argmax/servo vectorizados"""
+        probabilities = np.atleast_2d(probabilities)
+        indices = probabilities.argmax(axis=1)
+        confidences = probabilities[np.arange(len(indices)), indices]
+        servos = self.servo_positions[indices]
+        rows = probabilities.tolist()
+        return [
+            ClassificationResult(
+                class_index=int(index),
+                predicted_class=self.class_names[index],
+                confidence=float(confidence),
+                probabilities=tuple(row),
+                servo_position=int(servo),
+                actionable=bool(confidence > self.threshold)
+            )
+            for index, confidence, servo, row in zip(indices.tolist(), confidences.tolist(), servos.tolist(), rows)
+        ]
+
+    async def _preprocess_parallel(self,
+                                   images: List[ImageSource],
+                                   out: Optional[List[np.ndarray]]) -> Tuple[List[np.ndarray], List[Optional[str]]]:
+        """Repartir la decodificación de N imágenes entre los workers de preprocesado"""
+        groups = max(min(inference_executor.preprocess_workers, len(images)), 1)
+        bounds = [len(images) * g // groups for g in range(groups + 1)]
+        parts = await asyncio.gather(*(
+            inference_executor.run_preprocess(
+                preprocess_many,
+                images[start:end],
+                out[start:end] if out is not None else None
+            )
+            for start, end in zip(bounds, bounds[1:])
+        ), return_exceptions=True)
+        # Esperar a todos los grupos antes de propagar: ninguno debe seguir escribiendo en tensores del pool
+        for part in parts:
+            if isinstance(part, BaseException):
+                raise part
+        tensors = [tensor for part, _ in parts for tensor in part]
+        errors = [error for _, part in parts for error in part]
+        return tensors, errors
+
+    async def classify_many(self, images: Sequence[ImageSource]) -> List[Union[ClassificationResult, str]]:
+        """Clasificar N imágenes (bytes o memoryview); cada posición es un resultado o el mensaje de error"""
+        if not images:
+            return []
+
+        # Frames repetidos (cinta parada, objeto quieto bajo la cámara) no vuelven a pasar por la CNN
+        model_version = inference_engine.model_version
+        outputs: List[Union[ClassificationResult, str, None]] = [None] * len(images)
+        keys = [None] * len(images)
+        for i, image_data in enumerate(images):
+            outputs[i], keys[i] = result_cache.lookup(image_data, model_version)
+        misses = [i for i, output in enumerate(outputs) if output is None]
+        if not misses:
+            return outputs
+
+        if inference_executor.preprocess_kind == "process":
+            # Otro proceso no puede escribir en el pool: se envían bytes y se reciben tensores nuevos
+            pooled = None
+            pending = [bytes(images[i]) for i in misses]
+        else:
+            # Los hilos decodifican y normalizan directamente sobre tensores del pool
+            pooled = tensor_pool.acquire_many(len(misses))
+            pending = [images[i] for i in misses]
+
+        try:
+            tensors, errors = await self._preprocess_parallel(pending, pooled)
+            valid = [j for j, error in enumerate(errors) if error is None]
+
+            # Cada tensor se envía al motor compartido, que lo copia en su lote junto a otras peticiones
+            predictions = await asyncio.gather(
+                *(inference_engine.predict(tensors[j]) for j in valid),
+                return_exceptions=True
+            )
+        finally:
+            if pooled is not None:
+                tensor_pool.release_many(pooled)
+        for prediction in predictions:
+            if isinstance(prediction, InferenceOverloadedError):
+                raise prediction
+
+        for j, error in enumerate(errors):
+            outputs[misses[j]] = error
+        succeeded = []
+        for j, prediction in zip(valid, predictions):
+            if isinstance(prediction, BaseException):
+                outputs[misses[j]] = str(prediction)
+            else:
+                succeeded.append((misses[j], prediction))
+        if succeeded:
+            results = self.interpret(np.stack([p for _, p in succeeded]))
+            for (i, _), result in zip(succeeded, results):
+                outputs[i] = result
+                result_cache.store(keys[i], result, model_version)
+        return outputs
+
+    async def classify(self, image_data: ImageSource) -> ClassificationResult:
+        """Clasificar una imagen; lanza ValueError si no se puede procesar"""
+        (result,) = await self.classify_many([image_data])
+        if isinstance(result, str):
+            raise ValueError(result)
+        return result
+
+    def to_dict(self, result: ClassificationResult) -> Dict:
+        return result.to_dict(self.class_names)
+
+
+# Instancia global compartida por todos los endpoints de clasificación
+classifier = ClassifierService()
@@ -0,0 +1,318 @@
+import asyncio
+import heapq
+import logging
+import re
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# (prioridad, secuencia, encolado, caduca, comando): la secuencia desempata en orden FIFO
+QueueEntry = Tuple[int, int, float, Optional[float], Dict]
+
+
+def _percentiles(samples: Deque[float]) -> Optional[Dict[str, float]]:
+    if not samples:
+        return None
+    values = np.array(samples) * 1000
+    return {
+        "count": len(values),
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "max": round(float(values.max()), 2)
+    }
+
+
+class CommandQueueFullError(Exception):
+    """La cola de comandos del dispositivo está llena; el cliente debe reintentar más tarde"""
+
+
+class CommandQueue:
+    """Colas de prioridad por dispositivo (heap): encolar O(log n), FIFO entre iguales y caducidad por TTL.
+
+    Los canales push (WebSocket / long-poll) esperan con wait() y se despiertan al encolar; lo que
+    entregan queda en vuelo hasta el ack y se reentrega si no llega a tiempo.
+    """
+
+    def __init__(self,
+                 max_depth: int = 64,
+                 default_ttl: float = 300.0,
+                 ttl_by_command: Optional[Dict[str, float]] = None,
+                 ack_timeout: float = 5.0,
+                 max_attempts: int = 3):
+        self.max_depth = max_depth
+        self.default_ttl = default_ttl
+        self.ttl_by_command = ttl_by_command or {}
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        self._queues: Dict[str, List[QueueEntry]] = {}
+        # device_id -> id del comando -> (entrada, entregado, intentos)
+        self._inflight: Dict[str, Dict[str, Tuple[QueueEntry, float, int]]] = {}
+        # Intentos de entrega previos de los comandos devueltos a la cola
+        self._attempts: Dict[str, int] = {}
+        # Futures de los canales que esperan comandos de cada dispositivo
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._channels: Dict[str, int] = {}
+        self._last_id = 0
+        # Segundos entre encolar y entregar de los últimos comandos entregados
+        self._waits: Deque[float] = deque(maxlen=1000)
+        # Segundos entre entregar y recibir el ack
+        self._ack_waits: Deque[float] = deque(maxlen=1000)
+        # Segundos entre la clasificación y el ack del servo
+        self._servo_latencies: Deque[float] = deque(maxlen=1000)
+        self.enqueued = 0
+        self.delivered = 0
+        self.expired = 0
+        self.rejected = 0
+        self.acked = 0
+        self.redelivered = 0
+        self.unacked_dropped = 0
+
+    def _purge_expired(self, device_id: str, now: float):
+        heap = self._queues.get(device_id)
+        if not heap:
+            return
+        alive = [entry for entry in heap if entry[3] is None or entry[3] > now]
+        if len(alive) != len(heap):
+            self.expired += len(heap) - len(alive)
+            for entry in heap:
+                if entry[3] is not None and entry[3] <= now:
+                    self._attempts.pop(entry[4]["id"], None)
+            heapq.heapify(alive)
+            self._queues[device_id] = alive
+
+    def enqueue(self,
+                device_id: str,
+                command: str,
+                parameters: Optional[Dict] = None,
+                priority: int = 1,
+                ttl_seconds: Optional[float] = None,
+                classified_at: Optional[float] = None) -> Dict:
+        """Encolar un comando (1 = prioridad alta); lanza CommandQueueFullError si la cola está llena"""
+        now = time.time()
+        self._requeue_unacked(device_id, now)
+        heap = self._queues.setdefault(device_id, [])
+        if len(heap) >= self.max_depth:
+            # Antes de rechazar, liberar los comandos ya caducados
+            self._purge_expired(device_id, now)
+            heap = self._queues[device_id]
+            if len(heap) >= self.max_depth:
+                self.rejected += 1
+                raise CommandQueueFullError(f"Command queue for {device_id} is full ({self.max_depth} pending)")
+
+        self._last_id += 1
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_by_command.get(command, self.default_ttl)
+        expires_at = now + ttl if ttl > 0 else None
+        command_dict = {
+            "command": command,
+            "parameters": parameters or {},
+            "priority": priority,
+            "timestamp": datetime.fromtimestamp(now).isoformat(),
+            "expires_at": datetime.fromtimestamp(expires_at).isoformat() if expires_at else None,
+            "id": f"cmd_{self._last_id}"
+        }
+        if classified_at is not None:
+            # Origen de la latencia clasificación -> servo (se mide al recibir el ack)
+            command_dict["classified_at"] = datetime.fromtimestamp(classified_at).isoformat()
+        heapq.heappush(heap, (priority, self._last_id, now, expires_at, command_dict))
+        self.enqueued += 1
+        self._wake(device_id)
+        return command_dict
+
+    def _wake(self, device_id: str):
+        for waiter in self._waiters.pop(device_id, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _requeue(self, device_id: str, entry: QueueEntry, attempts: int, now: float):
+        command_id = entry[4]["id"]
+        if entry[3] is not None and entry[3] <= now:
+            self.expired += 1
+        elif attempts >= self.max_attempts:
+            self.unacked_dropped += 1
+            logger.warning(f"Command {command_id} for {device_id} dropped after {attempts} unacknowledged deliveries")
+        else:
+            heapq.heappush(self._queues.setdefault(device_id, []), entry)
+            self._attempts[command_id] = attempts
+            self.redelivered += 1
+
+    def _requeue_unacked(self, device_id: str, now: float):
+        """Devolver a la cola los comandos en vuelo sin ack tras ack_timeout"""
+        inflight = self._inflight.get(device_id)
+        if not inflight:
+            return
+        for command_id, (entry, delivered_at, attempts) in list(inflight.items()):
+            if now - delivered_at >= self.ack_timeout:
+                del inflight[command_id]
+                self._requeue(device_id, entry, attempts, now)
+
+    def drain(self, device_id: str, limit: Optional[int] = None, track_ack: bool = False) -> List[Dict]:
+        """Sacar los comandos pendientes por prioridad, descartando los caducados
+
+        Con ``track_ack`` los comandos quedan en vuelo hasta ack(); sin él (sondeo de sensores) se dan por entregados.
+        En ambos casos se reentregan antes los comandos en vuelo cuyo ack no llegó a tiempo.
+        """
+        now = time.time()
+        self._requeue_unacked(device_id, now)
+        heap = self._queues.get(device_id)
+        commands: List[Dict] = []
+        while heap and (limit is None or len(commands) < limit):
+            entry = heapq.heappop(heap)
+            _, _, enqueued_at, expires_at, command = entry
+            attempts = self._attempts.pop(command["id"], 0)
+            if expires_at is not None and expires_at <= now:
+                self.expired += 1
+                continue
+            if attempts == 0:
+                self._waits.append(now - enqueued_at)
+            if track_ack:
+                self._inflight.setdefault(device_id, {})[command["id"]] = (entry, now, attempts + 1)
+            commands.append(command)
+        self.delivered += len(commands)
+        return commands
+
+    async def wait(self, device_id: str, timeout: float) -> bool:
+        """Esperar (sin sondear) a que haya comandos para el dispositivo; False si vence el timeout"""
+        self._requeue_unacked(device_id, time.time())
+        if not self._queues.get(device_id):
+            inflight = self._inflight.get(device_id)
+            if inflight:
+                # Despertar a tiempo para reentregar el primer comando sin ack
+                oldest = min(delivered_at for _, delivered_at, _ in inflight.values())
+                timeout = min(timeout, max(oldest + self.ack_timeout - time.time(), 0.0))
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.setdefault(device_id, set()).add(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                waiters = self._waiters.get(device_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[device_id]
+            self._requeue_unacked(device_id, time.time())
+        return bool(self._queues.get(device_id))
+
+    def ack(self, device_id: str, command_ids: List[str]) -> int:
+        """Confirmar comandos entregados; devuelve cuántos estaban en vuelo"""
+        inflight = self._inflight.get(device_id)
+        if not inflight:
+            return 0
+        now = time.time()
+        acked = 0
+        for command_id in command_ids:
+            record = inflight.pop(command_id, None)
+            if record is None:
+                continue
+            (_, _, _, _, command), delivered_at, _ = record
+            self._ack_waits.append(now - delivered_at)
+            classified_at = command.get("classified_at")
+            if classified_at:
+                self._servo_latencies.append(now - datetime.fromisoformat(classified_at).timestamp())
+            acked += 1
+        self.acked += acked
+        return acked
+
+    def connect(self, device_id: str):
+        """Registrar un canal push abierto para el dispositivo"""
+        self._channels[device_id] = self._channels.get(device_id, 0) + 1
+
+    def disconnect(self, device_id: str):
+        """Cerrar un canal push; si era el último, lo que quedaba sin ack vuelve a la cola"""
+        remaining = self._channels.get(device_id, 0) - 1
+        if remaining > 0:
+            self._channels[device_id] = remaining
+            return
+        self._channels.pop(device_id, None)
+        inflight = self._inflight.pop(device_id, None)
+        if inflight:
+            now = time.time()
+            for entry, _, attempts in inflight.values():
+                self._requeue(device_id, entry, attempts, now)
+
+    def has_listener(self, device_id: str) -> bool:
+        """El dispositivo tiene un WebSocket abierto o un long-poll esperando"""
+        return device_id in self._channels or device_id in self._waiters
+
+    def depth(self, device_id: str) -> int:
+        return len(self._queues.get(device_id, ()))
+
+    def total_depth(self) -> int:
+        return sum(len(heap) for heap in self._queues.values())
+
+    def inflight(self, device_id: str) -> int:
+        return len(self._inflight.get(device_id, ()))
+
+    def pending(self, device_id: str) -> List[Dict]:
+        """Comandos pendientes en orden de entrega (sin sacarlos)"""
+        return [entry[4] for entry in sorted(self._queues.get(device_id, ()))]
+
+    def snapshot(self, device_id: str) -> Optional[List[List[Any]]]:
+        """Estado serializable de la cola (None si está vacía) para persistirlo; incluye los comandos sin ack"""
+        entries = list(self._queues.get(device_id, ()))
+        entries.extend(entry for entry, _, _ in self._inflight.get(device_id, {}).values())
+        return [list(entry) for entry in entries] if entries else None
+
+    def restore(self, device_id: str, entries: List[Any]):
+        """Recuperar una cola guardada con snapshot() (o la lista de comandos del formato anterior)"""
+        now = time.time()
+        heap: List[QueueEntry] = []
+        for entry in entries:
+            if isinstance(entry, dict):
+                # Formato anterior: lista ordenada de dicts sin secuencia ni caducidad
+                self._last_id += 1
+                entry = [entry.get("priority", 1), self._last_id, now, None, entry]
+            priority, sequence, enqueued_at, expires_at, command = entry
+            heap.append((priority, sequence, enqueued_at, expires_at, command))
+        heapq.heapify(heap)
+        self._queues[device_id] = heap
+        # Los IDs siguen siendo únicos tras un reinicio
+        for _, sequence, _, _, command in heap:
+            match = re.fullmatch(r"cmd_(\d+)", str(command.get("id", "")))
+            self._last_id = max(self._last_id, sequence, int(match.group(1)) if match else 0)
+
+    def get_stats(self) -> Dict:
+        """Obtener profundidad y antigüedad de las colas y la espera hasta la entrega"""
+        now = time.time()
+        return {
+            "max_depth": self.max_depth,
+            "total_depth": self.total_depth(),
+            "devices": {
+                device_id: {
+                    "depth": len(heap),
+                    "oldest_age_seconds": round(now - min(entry[2] for entry in heap), 3)
+                }
+                for device_id, heap in self._queues.items() if heap
+            },
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "expired": self.expired,
+            "rejected": self.rejected,
+            "inflight": sum(len(inflight) for inflight in self._inflight.values()),
+            "acked": self.acked,
+            "redelivered": self.redelivered,
+            "unacked_dropped": self.unacked_dropped,
+            "push_channels": dict(self._channels),
+            "delivery_wait_ms": _percentiles(self._waits),
+            "ack_ms": _percentiles(self._ack_waits),
+            "classify_to_servo_ms": _percentiles(self._servo_latencies)
+        }
+
+
+# Instancia global de la cola de comandos
+command_queue = CommandQueue(
+    max_depth=settings.COMMAND_QUEUE_MAX_DEPTH,
+    default_ttl=settings.COMMAND_DEFAULT_TTL_SECONDS,
+    ttl_by_command={"move_servo": settings.COMMAND_SERVO_TTL_SECONDS},
+    ack_timeout=settings.COMMAND_ACK_TIMEOUT_SECONDS,
+    max_attempts=settings.COMMAND_MAX_DELIVERY_ATTEMPTS
+)
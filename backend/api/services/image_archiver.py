@@ -0,0 +1,256 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from config import get_captured_images_path, load_project_config, settings
+from services.preprocessing import ImageSource
+
+logger = logging.getLogger(__name__)
+
+DROP_POLICIES = ("drop_newest", "drop_oldest")
+# Ventana para calcular el throughput de escritura
+THROUGHPUT_WINDOW_SECONDS = 60.0
+
+
+@dataclass
+class ArchivedFrame:
+    data: bytes
+    material: str
+    confidence: float
+    source: str
+    timestamp: datetime
+
+
+def _safe_name(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", value).strip("-") or "unknown"
+
+
+def _extension(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "png"
+    if data.startswith(b"BM"):
+        return "bmp"
+    return "jpg"
+
+
+class ImageArchiver:
+    """Archivo write-behind de frames clasificados: cola acotada y un hilo escritor con fsync por lotes"""
+
+    def __init__(self,
+                 root: str,
+                 enabled: bool = True,
+                 max_queue: int = 256,
+                 drop_policy: str = "drop_newest",
+                 fsync_batch: int = 32,
+                 fsync_interval: float = 1.0):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.root = root
+        self.enabled = enabled and bool(root)
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self._queue: Deque[ArchivedFrame] = deque()
+        self._condition = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
+        self._closing = False
+        self._writing = 0
+        self._sequence = 0
+        self._known_dirs: Set[str] = set()
+        # (instante, ficheros, bytes) de cada lote escrito dentro de la ventana
+        self._recent: Deque[Tuple[float, int, int]] = deque()
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.batches = 0
+        self.peak_queue_depth = 0
+        self.last_batch_ms = 0.0
+
+    def path_for(self, frame: ArchivedFrame, sequence: int) -> str:
+        """<raíz>/<fecha>/<material>/conf_<decena>/<hora>_<origen>_<secuencia>.<ext>"""
+        band = min(max(int(frame.confidence * 10), 0), 9) * 10
+        file_name = (
+            f"{frame.timestamp:%H%M%S_%f}_{_safe_name(frame.source)}_{sequence:06d}.{_extension(frame.data)}"
+        )
+        return os.path.join(
+            self.root,
+            f"{frame.timestamp:%Y-%m-%d}",
+            _safe_name(frame.material.lower()),
+            f"conf_{band:02d}",
+            file_name
+        )
+
+    def submit(self, image_data: ImageSource, material: str, confidence: float, source: str = "api") -> bool:
+        """Encolar un frame sin bloquear; devuelve False si se descarta"""
+        if not self.enabled or self._closing:
+            return False
+        if self.drop_policy == "drop_newest" and len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return False
+
+        # Copia propia: el buffer del upload vuelve al pool al terminar la petición
+        frame = ArchivedFrame(bytes(image_data), material, float(confidence), source, datetime.now())
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                if self.drop_policy == "drop_newest":
+                    self.dropped += 1
+                    return False
+                self._queue.popleft()
+                self.dropped += 1
+            self._queue.append(frame)
+            self.enqueued += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, len(self._queue))
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="image-archiver", daemon=True)
+                self._writer.start()
+            self._condition.notify()
+        return True
+
+    def _next_batch(self) -> Optional[List[ArchivedFrame]]:
+        with self._condition:
+            while not self._queue and not self._closing:
+                self._condition.wait()
+            if not self._queue:
+                return None
+            # Esperar a completar el lote, como mucho fsync_interval
+            deadline = time.monotonic() + self.fsync_interval
+            while len(self._queue) < self.fsync_batch and not self._closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.fsync_batch))]
+            self._writing = len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._write_batch(batch)
+            finally:
+                with self._condition:
+                    self._writing = 0
+                    self._condition.notify_all()
+
+    def _write_batch(self, batch: List[ArchivedFrame]):
+        """Escribir el lote y hacer fsync de ficheros y directorios una sola vez al final"""
+        started = time.perf_counter()
+        pending = []
+        directories: Set[str] = set()
+        for frame in batch:
+            self._sequence += 1
+            path = self.path_for(frame, self._sequence)
+            directory = os.path.dirname(path)
+            tmp_path = f"{path}.tmp"
+            try:
+                if directory not in self._known_dirs:
+                    os.makedirs(directory, exist_ok=True)
+                    self._known_dirs.add(directory)
+                file = open(tmp_path, "wb")
+                file.write(frame.data)
+                pending.append((file, tmp_path, path, len(frame.data)))
+                directories.add(directory)
+            except OSError as e:
+                self.errors += 1
+                logger.error(f"Error archiving frame {path}: {e}")
+
+        files = 0
+        size = 0
+        for file, tmp_path, path, length in pending:
+            try:
+                with file:
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, path)
+                files += 1
+                size += length
+            except OSError as e:
+                self.errors += 1
+                logger.error(f"Error archiving frame {path}: {e}")
+        for directory in directories:
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+
+        now = time.monotonic()
+        self.written += files
+        self.bytes_written += size
+        self.batches += 1
+        self.last_batch_ms = round((time.perf_counter() - started) * 1000, 2)
+        self._recent.append((now, files, size))
+        while self._recent and now - self._recent[0][0] > THROUGHPUT_WINDOW_SECONDS:
+            self._recent.popleft()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Esperar a que la cola quede escrita en disco"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._condition.notify_all()
+            while self._queue or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._writer is None:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Dejar de aceptar frames, escribir lo pendiente y parar el hilo escritor"""
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        if self._writer is not None:
+            self._writer.join(timeout)
+            if self._writer.is_alive():
+                logger.warning(f"Image archiver still had {len(self._queue)} frames queued after {timeout}s")
+
+    def get_stats(self) -> Dict:
+        """Obtener profundidad de la cola, descartes y throughput de escritura"""
+        now = time.monotonic()
+        recent = [entry for entry in self._recent if now - entry[0] <= THROUGHPUT_WINDOW_SECONDS]
+        span = max(now - recent[0][0], 1.0) if recent else 0.0
+        return {
+            "enabled": self.enabled,
+            "root": self.root,
+            "queue_depth": len(self._queue),
+            "max_queue": self.max_queue,
+            "peak_queue_depth": self.peak_queue_depth,
+            "drop_policy": self.drop_policy,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "bytes_written": self.bytes_written,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0.0,
+            "last_batch_ms": self.last_batch_ms,
+            "files_per_second": round(sum(entry[1] for entry in recent) / span, 2) if recent else 0.0,
+            "bytes_per_second": round(sum(entry[2] for entry in recent) / span, 1) if recent else 0.0
+        }
+
+
+# Instancia global del archivo de imágenes (config.yaml monitoring.save_images)
+image_archiver = ImageArchiver(
+    root=settings.IMAGE_ARCHIVE_PATH or get_captured_images_path(),
+    enabled=bool(load_project_config().get("monitoring", {}).get("save_images", False)),
+    max_queue=settings.IMAGE_ARCHIVE_QUEUE_SIZE,
+    drop_policy=settings.IMAGE_ARCHIVE_DROP_POLICY,
+    fsync_batch=settings.IMAGE_ARCHIVE_FSYNC_BATCH,
+    fsync_interval=settings.IMAGE_ARCHIVE_FSYNC_INTERVAL
+)
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from services.inference_executor import inference_executor
+
+logger = logging.getLogger(__name__)
+
+
+class BatchStats:
+    """Métricas de latencia y throughput agrupadas por tamaño de lote"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.batches: Dict[int, int] = {}
+        self.images: Dict[int, int] = {}
+        self.busy_seconds: Dict[int, float] = {}
+        self.batch_latencies: Dict[int, Deque[float]] = {}
+        self.request_latencies: Dict[int, Deque[float]] = {}
+
+    def record(self, batch_size: int, inference_seconds: float, request_seconds: List[float]):
+        if batch_size not in self.batches:
+            self.batches[batch_size] = 0
+            self.images[batch_size] = 0
+            self.busy_seconds[batch_size] = 0.0
+            self.batch_latencies[batch_size] = deque(maxlen=self.window)
+            self.request_latencies[batch_size] = deque(maxlen=self.window)
+
+        self.batches[batch_size] += 1
+        self.images[batch_size] += batch_size
+        self.busy_seconds[batch_size] += inference_seconds
+        self.batch_latencies[batch_size].append(inference_seconds * 1000)
+        self.request_latencies[batch_size].extend(s * 1000 for s in request_seconds)
+
+    def seconds_per_image(self) -> float:
+        """Tiempo medio del modelo por imagen, medido sólo en las llamadas predict() de los lotes"""
+        images = sum(self.images.values())
+        return sum(self.busy_seconds.values()) / images if images else 0.0
+
+    @staticmethod
+    def _percentiles(values: Deque[float]) -> Dict[str, float]:
+        if not values:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+        p50, p95, p99 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 95, 99])
+        return {
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "max": round(max(values), 3)
+        }
+
+    def summary(self) -> Dict[str, Dict]:
+        return {
+            str(size): {
+                "batches": self.batches[size],
+                "images": self.images[size],
+                "inference_latency_ms": self._percentiles(self.batch_latencies[size]),
+                "request_latency_ms": self._percentiles(self.request_latencies[size]),
+                "throughput_images_per_s": round(
+                    self.images[size] / self.busy_seconds[size], 2
+                ) if self.busy_seconds[size] > 0 else 0.0
+            }
+            for size in sorted(self.batches)
+        }
+
+
+class InferenceEngine:
+    """Motor de inferencia compartido que agrupa peticiones concurrentes en lotes"""
+
+    def __init__(self, max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.model = None
+        self.model_version = 0
+        self.stats = BatchStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._batch_buffer: Optional[np.ndarray] = None
+        # id(modelo) -> lotes en ejecución, para drenar un modelo retirado
+        self._running: Dict[int, int] = {}
+
+    def set_model(self, model):
+        """Asignar el modelo usado por los próximos lotes (debe exponer predict(batch))"""
+        self.model = model
+        self.model_version += 1
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._batch_loop())
+
+    async def predict(self, image: np.ndarray) -> np.ndarray:
+        """Clasificar una imagen preprocesada (H, W, 3) y devolver sus probabilidades"""
+        if self.model is None:
+            raise RuntimeError("Model not loaded")
+
+        inference_executor.reserve()
+        try:
+            self._ensure_worker()
+            future = asyncio.get_running_loop().create_future()
+            self._queue.put_nowait((image, future, time.perf_counter()))
+            return await future
+        finally:
+            inference_executor.release()
+
+    def _stack(self, images: List[np.ndarray]) -> np.ndarray:
+        """Apilar las imágenes en un buffer de lote reutilizado entre lotes"""
+        shape = (self.max_batch_size, *images[0].shape)
+        if self._batch_buffer is None or self._batch_buffer.shape != shape:
+            self._batch_buffer = np.empty(shape, dtype=np.float32)
+        return np.stack(images, out=self._batch_buffer[:len(images)])
+
+    async def _collect_batch(self) -> List[Tuple[np.ndarray, asyncio.Future, float]]:
+        """Esperar la primera petición y agrupar las siguientes hasta llenar el lote o agotar la espera"""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _batch_loop(self):
+        while True:
+            batch = await self._collect_batch()
+            pending = [item for item in batch if not item[1].cancelled()]
+            if not pending:
+                continue
+
+            # El lote completo se ejecuta con el modelo vigente al formarse, aunque se cambie a mitad
+            model = self.model
+            self._running[id(model)] = self._running.get(id(model), 0) + 1
+            try:
+                inputs = self._stack([item[0] for item in pending])
+                started = time.perf_counter()
+                predictions = await inference_executor.run_model(model.predict, inputs)
+                finished = time.perf_counter()
+            except Exception as e:
+                logger.error(f"Batch inference failed ({len(pending)} images): {e}")
+                for _, future, _ in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self._running[id(model)] -= 1
+                if not self._running[id(model)]:
+                    del self._running[id(model)]
+
+            for i, (_, future, _) in enumerate(pending):
+                if not future.done():
+                    future.set_result(predictions[i])
+
+            self.stats.record(
+                len(pending),
+                finished - started,
+                [finished - enqueued for _, _, enqueued in pending]
+            )
+
+    async def drain(self, model, timeout: float = 10.0) -> bool:
+        """Esperar a que terminen los lotes que aún se ejecutan con ``model``"""
+        deadline = time.perf_counter() + timeout
+        while self._running.get(id(model)):
+            if time.perf_counter() > deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    def get_stats(self) -> Dict:
+        """Obtener configuración y métricas por tamaño de lote"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queued_requests": self._queue.qsize() if self._queue else 0,
+            "executor": inference_executor.get_stats(),
+            "by_batch_size": self.stats.summary()
+        }
+
+
+# Instancia global del motor de inferencia
+inference_engine = InferenceEngine(
+    max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=settings.INFERENCE_MAX_WAIT_MS
+)
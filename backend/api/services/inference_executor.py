@@ -0,0 +1,140 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceOverloadedError(Exception):
+    """La cola de inferencia está llena; el cliente debe reintentar más tarde"""
+
+
+async def run_to_completion(future: asyncio.Future) -> Any:
+    """Esperar un future de run_in_executor; si se cancela, esperar igualmente a que el hilo termine.
+
+    Cancelar el future no detiene el hilo: sin esto el llamador devolvería a su pool buffers y tensores
+    en los que el worker sigue escribiendo.
+    """
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        while not future.done():
+            try:
+                await asyncio.wait([future])
+            except asyncio.CancelledError:
+                pass
+        if not future.cancelled():
+            # Marcar la excepción como recuperada; lo que se propaga es la cancelación
+            future.exception()
+        raise
+
+
+class InferenceExecutor:
+    """Ejecutor dedicado para el trabajo CNN, fuera del event loop de asyncio"""
+
+    def __init__(self,
+                 preprocess_kind: str = "thread",
+                 preprocess_workers: int = 2,
+                 model_workers: int = 1,
+                 max_pending: int = 64):
+        if preprocess_kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {preprocess_kind}")
+        # El preprocesamiento puede ir a hilos o procesos; el modelo siempre usa
+        # hilos porque TensorFlow libera el GIL y no se comparte entre procesos
+        self.preprocess_kind = preprocess_kind
+        self.preprocess_workers = preprocess_workers
+        self.model_workers = model_workers
+        self.max_pending = max_pending
+        self._preprocess_pool: Optional[Executor] = None
+        self._model_pool: Optional[Executor] = None
+        self._pending = 0
+        self.rejected = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+
+    def _get_preprocess_pool(self) -> Executor:
+        if self._preprocess_pool is None:
+            if self.preprocess_kind == "process":
+                self._preprocess_pool = ProcessPoolExecutor(max_workers=self.preprocess_workers)
+            else:
+                self._preprocess_pool = ThreadPoolExecutor(
+                    max_workers=self.preprocess_workers,
+                    thread_name_prefix="cnn-preprocess"
+                )
+        return self._preprocess_pool
+
+    def _get_model_pool(self) -> Executor:
+        if self._model_pool is None:
+            self._model_pool = ThreadPoolExecutor(
+                max_workers=self.model_workers,
+                thread_name_prefix="cnn-model"
+            )
+        return self._model_pool
+
+    def reserve(self):
+        """Reservar un hueco en la cola o lanzar InferenceOverloadedError"""
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise InferenceOverloadedError(
+                f"Inference queue full ({self._pending}/{self.max_pending} pending)"
+            )
+        self._pending += 1
+
+    def release(self):
+        self._pending -= 1
+
+    async def _submit(self, pool: Executor, func: Callable, *args, **kwargs) -> Any:
+        started = time.perf_counter()
+        try:
+            return await run_to_completion(asyncio.get_running_loop().run_in_executor(
+                pool, functools.partial(func, *args, **kwargs)
+            ))
+        finally:
+            self.completed += 1
+            self.busy_seconds += time.perf_counter() - started
+
+    async def run_preprocess(self, func: Callable, *args) -> Any:
+        """Ejecutar decodificación/preprocesamiento con control de backpressure"""
+        self.reserve()
+        try:
+            return await self._submit(self._get_preprocess_pool(), func, *args)
+        finally:
+            self.release()
+
+    async def run_model(self, func: Callable, *args, **kwargs) -> Any:
+        """Ejecutar una llamada al modelo en el pool de hilos dedicado"""
+        return await self._submit(self._get_model_pool(), func, *args, **kwargs)
+
+    def shutdown(self):
+        for pool in (self._preprocess_pool, self._model_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._preprocess_pool = None
+        self._model_pool = None
+
+    def get_stats(self) -> Dict:
+        """Obtener ocupación y rechazos del ejecutor"""
+        return {
+            "preprocess_kind": self.preprocess_kind,
+            "preprocess_workers": self.preprocess_workers,
+            "model_workers": self.model_workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "busy_seconds": round(self.busy_seconds, 3)
+        }
+
+
+# Instancia global compartida por todos los puntos de clasificación CNN
+inference_executor = InferenceExecutor(
+    preprocess_kind=settings.INFERENCE_EXECUTOR,
+    preprocess_workers=settings.INFERENCE_PREPROCESS_WORKERS,
+    model_workers=settings.INFERENCE_MODEL_WORKERS,
+    max_pending=settings.INFERENCE_MAX_PENDING
+)
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Tuple
+
+import numpy as np
+from starlette.datastructures import UploadFile
+
+from config import settings
+from services.inference_executor import run_to_completion
+from services.preprocessing import INPUT_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class BufferPool:
+    """Pool de bytearrays reutilizables para recibir uploads sin crear un bytes por petición"""
+
+    def __init__(self, max_buffers: int = 16, max_buffer_bytes: int = 8 * 1024 * 1024, min_buffer_bytes: int = 256 * 1024):
+        self.max_buffers = max_buffers
+        self.max_buffer_bytes = max_buffer_bytes
+        self.min_buffer_bytes = min_buffer_bytes
+        self._free: List[bytearray] = []
+        self.reused = 0
+        self.allocated = 0
+
+    def acquire(self, size: int) -> bytearray:
+        for i, buffer in enumerate(self._free):
+            if len(buffer) >= size:
+                self.reused += 1
+                return self._free.pop(i)
+        self.allocated += 1
+        # Redondear a potencia de dos para que el buffer sirva a uploads parecidos
+        return bytearray(max(self.min_buffer_bytes, 1 << max(size - 1, 0).bit_length()))
+
+    def release(self, buffer: bytearray):
+        if len(buffer) <= self.max_buffer_bytes and len(self._free) < self.max_buffers:
+            self._free.append(buffer)
+
+    def get_stats(self) -> Dict:
+        return {
+            "free": len(self._free),
+            "pooled_bytes": sum(len(buffer) for buffer in self._free),
+            "reused": self.reused,
+            "allocated": self.allocated
+        }
+
+
+class TensorPool:
+    """Pool de tensores float32 (H, W, 3) preasignados donde se decodifica y normaliza cada imagen"""
+
+    def __init__(self, shape: Tuple[int, ...], max_tensors: int = 32):
+        self.shape = shape
+        self.max_tensors = max_tensors
+        self._free: List[np.ndarray] = []
+        self.reused = 0
+        self.allocated = 0
+
+    def acquire_many(self, count: int) -> List[np.ndarray]:
+        reused = min(count, len(self._free))
+        tensors = [self._free.pop() for _ in range(reused)]
+        tensors.extend(np.empty(self.shape, dtype=np.float32) for _ in range(count - reused))
+        self.reused += reused
+        self.allocated += count - reused
+        return tensors
+
+    def release_many(self, tensors: List[np.ndarray]):
+        for tensor in tensors:
+            if len(self._free) >= self.max_tensors:
+                break
+            self._free.append(tensor)
+
+    def get_stats(self) -> Dict:
+        return {
+            "free": len(self._free),
+            "reused": self.reused,
+            "allocated": self.allocated
+        }
+
+
+def _upload_size(upload: UploadFile) -> int:
+    size = getattr(upload, "size", None)
+    if size is not None:
+        return size
+    position = upload.file.tell()
+    size = upload.file.seek(0, os.SEEK_END)
+    upload.file.seek(position)
+    return size
+
+
+def _readinto(fileobj, view: memoryview) -> int:
+    """Copiar el fichero del upload en ``view``: readinto() si existe, si no read() y copia"""
+    # SpooledTemporaryFile sólo implementa readinto() desde Python 3.11
+    readinto = getattr(fileobj, "readinto", None)
+    total = 0
+    while total < len(view):
+        if readinto is not None:
+            read = readinto(view[total:])
+        else:
+            chunk = fileobj.read(len(view) - total)
+            read = len(chunk)
+            view[total:total + read] = chunk
+        if not read:
+            break
+        total += read
+    return total
+
+
+@asynccontextmanager
+async def ingest_upload(upload: UploadFile) -> AsyncIterator[memoryview]:
+    """Leer un upload en un buffer del pool y exponerlo como memoryview hasta salir del bloque"""
+    size = _upload_size(upload)
+    buffer = buffer_pool.acquire(size)
+    view = memoryview(buffer)
+    try:
+        await upload.seek(0)
+        # El buffer vuelve al pool sólo cuando el hilo ha terminado, aunque se cancele la petición
+        read = await run_to_completion(
+            asyncio.get_running_loop().run_in_executor(None, _readinto, upload.file, view[:size])
+        )
+        data = view[:read]
+        try:
+            yield data
+        finally:
+            data.release()
+    finally:
+        view.release()
+        buffer_pool.release(buffer)
+
+
+def get_ingestion_stats() -> Dict:
+    """Obtener reutilización de los pools de uploads y tensores"""
+    return {
+        "upload_buffers": buffer_pool.get_stats(),
+        "tensors": tensor_pool.get_stats()
+    }
+
+
+# Pools globales compartidos por los endpoints de clasificación
+buffer_pool = BufferPool(
+    max_buffers=settings.INGEST_BUFFER_POOL_SIZE,
+    max_buffer_bytes=settings.INGEST_MAX_POOLED_BYTES
+)
+tensor_pool = TensorPool(
+    shape=(*INPUT_SIZE[::-1], 3),
+    max_tensors=settings.INGEST_TENSOR_POOL_SIZE
+)
@@ -0,0 +1,88 @@
+import copy
+from typing import Any, Dict, List
+
+# Operaciones JSON Patch (RFC 6902) que genera diff(): add, remove y replace
+
+
+def _escape(key: Any) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _equal(old: Any, new: Any) -> bool:
+    """Igualdad JSON estricta: 1, 1.0 y True son valores distintos (== de Python los considera iguales)"""
+    if type(old) is not type(new):
+        return False
+    if isinstance(old, dict):
+        return old.keys() == new.keys() and all(_equal(value, new[key]) for key, value in old.items())
+    if isinstance(old, list):
+        return len(old) == len(new) and all(_equal(a, b) for a, b in zip(old, new))
+    return old == new
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[Dict]:
+    """Patch que transforma ``old`` en ``new`` (documentos JSON ya normalizados)
+
+    Los dicts se comparan campo a campo y las listas elemento a elemento por posición
+    (los elementos que sobran se quitan desde el final y los nuevos se añaden al final).
+    """
+    if _equal(old, new):
+        return []
+    patch: List[Dict] = []
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                patch.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                patch.append({"op": "add", "path": child, "value": value})
+            else:
+                patch.extend(diff(old[key], value, child))
+        return patch
+    if isinstance(old, list) and isinstance(new, list):
+        common = min(len(old), len(new))
+        for index in range(common):
+            patch.extend(diff(old[index], new[index], f"{path}/{index}"))
+        for index in range(len(old) - 1, common - 1, -1):
+            patch.append({"op": "remove", "path": f"{path}/{index}"})
+        for value in new[common:]:
+            patch.append({"op": "add", "path": f"{path}/-", "value": value})
+        return patch
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def get(document: Any, path: str) -> Any:
+    """Valor en un JSON Pointer; KeyError/IndexError si no existe"""
+    for token in [_unescape(token) for token in path.split("/")[1:]]:
+        document = document[int(token)] if isinstance(document, list) else document[token]
+    return document
+
+
+def apply(document: Any, patch: List[Dict]) -> Any:
+    """Aplicar un patch de diff() sobre una copia del documento"""
+    document = copy.deepcopy(document)
+    for operation in patch:
+        if operation["path"] == "":
+            document = copy.deepcopy(operation["value"])
+            continue
+        parent, _, last = operation["path"].rpartition("/")
+        target = get(document, parent)
+        last = _unescape(last)
+        if isinstance(target, list):
+            if operation["op"] == "add":
+                value = copy.deepcopy(operation["value"])
+                if last == "-":
+                    target.append(value)
+                else:
+                    target.insert(int(last), value)
+                continue
+            last = int(last)
+        if operation["op"] == "remove":
+            del target[last]
+        else:
+            target[last] = copy.deepcopy(operation["value"])
+    return document
@@ -0,0 +1,275 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Type
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# TensorFlow se importa dentro de _load(): importar este módulo (y arrancar la API) no lo carga
+
+
+class ModelBackend:
+    """Backend de inferencia intercambiable: carga un artefacto y expone predict(batch)"""
+
+    name = "base"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.load_seconds = 0.0
+        self.warmup_seconds = 0.0
+        self.images_served = 0
+        self.image_latencies: Deque[float] = deque(maxlen=1000)
+
+    def load(self) -> "ModelBackend":
+        """Cargar el artefacto midiendo el tiempo de carga"""
+        started = time.perf_counter()
+        self._load()
+        self.load_seconds = time.perf_counter() - started
+        logger.info(f"{self.name} backend loaded from {self.path} in {self.load_seconds * 1000:.1f}ms")
+        return self
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _predict(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Clasificar un lote (N, H, W, 3) y devolver probabilidades (N, C)"""
+        started = time.perf_counter()
+        probabilities = self._predict(np.asarray(batch, dtype=np.float32))
+        elapsed = time.perf_counter() - started
+        self.images_served += len(batch)
+        self.image_latencies.append(elapsed / max(len(batch), 1))
+        return probabilities
+
+    def warmup(self):
+        """Ejecutar una inferencia en vacío antes de servir tráfico"""
+        started = time.perf_counter()
+        self._predict(np.zeros((1, *settings.MODEL_INPUT_SIZE, 3), dtype=np.float32))
+        self.warmup_seconds = time.perf_counter() - started
+
+    @property
+    def input_shape(self):
+        return (None, *settings.MODEL_INPUT_SIZE, 3)
+
+    @property
+    def output_shape(self):
+        return (None, len(settings.MODEL_CLASSES))
+
+    def get_info(self) -> Dict:
+        """Obtener backend, tiempo de carga y latencia por imagen"""
+        latencies = np.fromiter(self.image_latencies, dtype=np.float64) * 1000
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "load_ms": round(self.load_seconds * 1000, 2),
+            "warmup_ms": round(self.warmup_seconds * 1000, 2),
+            "images_served": self.images_served,
+            "per_image_latency_ms": {
+                "p50": round(float(np.percentile(latencies, 50)), 3),
+                "p95": round(float(np.percentile(latencies, 95)), 3)
+            } if len(latencies) else None
+        }
+
+
+class KerasBackend(ModelBackend):
+    """Modelo Keras (.keras/.h5) servido con firmas tf.function calientes"""
+
+    name = "keras"
+
+    def __init__(self, path: str, model=None):
+        super().__init__(path)
+        self.model = model
+        self.serving = None
+
+    def _load(self):
+        import tensorflow as tf
+        from services.model_serving import ServingModel, serving_batch_sizes
+
+        if self.model is None:
+            self.model = tf.keras.models.load_model(self.path)
+        self.serving = ServingModel(
+            self.model,
+            batch_sizes=serving_batch_sizes(),
+            input_size=settings.MODEL_INPUT_SIZE
+        )
+
+    def _predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.serving.predict(batch)
+
+    def warmup(self):
+        started = time.perf_counter()
+        self.serving.warmup()
+        self.warmup_seconds = time.perf_counter() - started
+
+    @property
+    def input_shape(self):
+        return self.serving.input_shape
+
+    @property
+    def output_shape(self):
+        return self.serving.output_shape
+
+    def count_params(self) -> int:
+        return self.model.count_params()
+
+    def get_info(self) -> Dict:
+        info = super().get_info()
+        info["serving"] = self.serving.get_info()
+        return info
+
+
+class SavedModelBackend(ModelBackend):
+    """SavedModel exportado, invocado directamente por su firma serving_default"""
+
+    name = "saved_model"
+
+    def _load(self):
+        import tensorflow as tf
+
+        self._to_tensor = tf.convert_to_tensor
+        self._loaded = tf.saved_model.load(self.path)
+        self._signature = self._loaded.signatures[settings.MODEL_SIGNATURE]
+        _, input_specs = self._signature.structured_input_signature
+        self._input_name, self._input_spec = next(iter(input_specs.items()))
+        self._output_name = next(iter(self._signature.structured_outputs))
+
+    def _predict(self, batch: np.ndarray) -> np.ndarray:
+        fixed_size = self._input_spec.shape[0]
+        if fixed_size is None or fixed_size == len(batch):
+            outputs = self._signature(**{self._input_name: self._to_tensor(batch)})
+            return outputs[self._output_name].numpy()
+
+        # Firma con tamaño de lote fijo: trocear y rellenar
+        results = []
+        for start in range(0, len(batch), fixed_size):
+            chunk = batch[start:start + fixed_size]
+            padded = np.zeros((fixed_size, *batch.shape[1:]), dtype=np.float32)
+            padded[:len(chunk)] = chunk
+            outputs = self._signature(**{self._input_name: self._to_tensor(padded)})
+            results.append(outputs[self._output_name].numpy()[:len(chunk)])
+        return np.concatenate(results)
+
+    @property
+    def input_shape(self):
+        return tuple(self._input_spec.shape.as_list())
+
+    @property
+    def output_shape(self):
+        return tuple(self._signature.structured_outputs[self._output_name].shape.as_list())
+
+
+class TFLiteBackend(ModelBackend):
+    """Modelo TFLite ejecutado con el intérprete (tflite_runtime si está instalado)"""
+
+    name = "tflite"
+
+    def _load(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=self.path, num_threads=settings.MODEL_TFLITE_THREADS)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        # Modelos cuantizados int8/uint8: escala y punto cero de entrada y salida
+        self._input_dtype = self._input["dtype"]
+        self._input_scale, self._input_zero_point = self._input["quantization"]
+        self._output_scale, self._output_zero_point = self._output["quantization"]
+        # El intérprete no es reentrante
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size: int):
+        if batch_size != self._batch_size:
+            self.interpreter.resize_tensor_input(
+                self._input["index"], [batch_size, *self._input["shape"][1:]]
+            )
+            self.interpreter.allocate_tensors()
+            self._batch_size = batch_size
+
+    def _quantize(self, batch: np.ndarray) -> np.ndarray:
+        if self._input_dtype == np.float32:
+            return batch
+        limits = np.iinfo(self._input_dtype)
+        quantized = np.round(batch / self._input_scale + self._input_zero_point)
+        return np.clip(quantized, limits.min, limits.max).astype(self._input_dtype)
+
+    def _dequantize(self, outputs: np.ndarray) -> np.ndarray:
+        if outputs.dtype == np.float32:
+            return outputs.copy()
+        return (outputs.astype(np.float32) - self._output_zero_point) * self._output_scale
+
+    def _predict(self, batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self._resize(len(batch))
+            self.interpreter.set_tensor(self._input["index"], self._quantize(batch))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self._output["index"]))
+
+    @property
+    def input_shape(self):
+        return (None, *self._input["shape"][1:].tolist())
+
+    @property
+    def output_shape(self):
+        return (None, *self._output["shape"][1:].tolist())
+
+    def get_info(self) -> Dict:
+        info = super().get_info()
+        info["input_dtype"] = np.dtype(self._input_dtype).name
+        info["threads"] = settings.MODEL_TFLITE_THREADS
+        return info
+
+
+BACKENDS: Dict[str, Type[ModelBackend]] = {
+    KerasBackend.name: KerasBackend,
+    SavedModelBackend.name: SavedModelBackend,
+    TFLiteBackend.name: TFLiteBackend,
+}
+
+
+def detect_backend(path: str) -> Type[ModelBackend]:
+    """Elegir el backend según el tipo de artefacto"""
+    if os.path.isdir(path) and os.path.exists(os.path.join(path, "saved_model.pb")):
+        return SavedModelBackend
+    if path.endswith(".tflite"):
+        return TFLiteBackend
+    if path.endswith((".keras", ".h5")):
+        return KerasBackend
+    raise ValueError(f"Unsupported model artifact: {path}")
+
+
+def load_backend(path: str, backend: str = "") -> ModelBackend:
+    """Cargar y calentar un artefacto con el backend indicado o detectado"""
+    backend_cls = BACKENDS[backend] if backend else detect_backend(path)
+    instance = backend_cls(path).load()
+    instance.warmup()
+    return instance
+
+
+def wrap_keras_model(model, path: str = "<in-memory>") -> KerasBackend:
+    """Servir un modelo Keras ya construido (p. ej. el modelo dummy)"""
+    instance = KerasBackend(path, model=model).load()
+    instance.warmup()
+    return instance
+
+
+def is_model_artifact(path: str) -> bool:
+    """Comprobar si una ruta es un artefacto que algún backend puede servir"""
+    try:
+        detect_backend(path)
+        return True
+    except ValueError:
+        return False
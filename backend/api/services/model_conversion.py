@@ -0,0 +1,151 @@
+import logging
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from config import settings
+from services.model_backends import TFLiteBackend, detect_backend, ModelBackend
+from services.preprocessing import preprocess_image_bytes
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ("none", "dynamic", "float16", "int8")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def list_images(folder: str) -> List[str]:
+    """Listar imágenes de una carpeta de forma recursiva y ordenada"""
+    paths = []
+    for root, _, names in os.walk(folder):
+        paths.extend(os.path.join(root, name) for name in names if name.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def load_image_array(path: str) -> np.ndarray:
+    """Cargar una imagen como tensor float32 (H, W, 3) normalizado a [0, 1]"""
+    return preprocess_image_bytes(path)
+
+
+def representative_dataset(calibration_dir: str, num_samples: int = 200):
+    """Generador de calibración para la cuantización int8 post-entrenamiento"""
+    paths = list_images(calibration_dir)
+    if not paths:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+    step = max(len(paths) // num_samples, 1)
+
+    def generator() -> Iterator[List[np.ndarray]]:
+        for path in paths[::step][:num_samples]:
+            yield [load_image_array(path)[np.newaxis]]
+
+    return generator
+
+
+def _make_converter(source_path: str) -> tf.lite.TFLiteConverter:
+    if os.path.isdir(source_path):
+        return tf.lite.TFLiteConverter.from_saved_model(source_path)
+    return tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(source_path))
+
+
+def convert_to_tflite(source_path: str,
+                      output_path: str,
+                      quantization: str = "none",
+                      calibration_dir: Optional[str] = None,
+                      num_calibration: int = 200) -> Dict:
+    """Convertir un modelo Keras o SavedModel a TFLite con la cuantización indicada"""
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {quantization}")
+
+    converter = _make_converter(source_path)
+    if quantization == "dynamic":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif quantization == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        if not calibration_dir:
+            raise ValueError("int8 quantization requires a calibration image folder")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(calibration_dir, num_calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Entrada/salida enteras: la API cuantiza la imagen y decuantiza las probabilidades
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    started = time.perf_counter()
+    tflite_model = converter.convert()
+    elapsed = time.perf_counter() - started
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "wb") as file:
+        file.write(tflite_model)
+
+    logger.info(f"TFLite model ({quantization}) written to {output_path}: {len(tflite_model)} bytes")
+    return {
+        "quantization": quantization,
+        "path": output_path,
+        "size_bytes": len(tflite_model),
+        "conversion_seconds": round(elapsed, 2)
+    }
+
+
+def load_labeled_images(eval_dir: str, limit: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Cargar un conjunto de evaluación organizado como eval_dir/<clase>/*.jpg"""
+    images, labels = [], []
+    for class_idx, class_name in enumerate(settings.MODEL_CLASSES):
+        class_dir = os.path.join(eval_dir, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        paths = list_images(class_dir)
+        if limit:
+            paths = paths[:limit]
+        for path in paths:
+            images.append(load_image_array(path))
+            labels.append(class_idx)
+    if not images:
+        raise ValueError(f"No labeled images found in {eval_dir} (expected {settings.MODEL_CLASSES} subfolders)")
+    return np.stack(images), np.array(labels)
+
+
+def evaluate_backend(backend: ModelBackend,
+                     images: np.ndarray,
+                     labels: np.ndarray,
+                     reference: Optional[np.ndarray] = None) -> Tuple[Dict, np.ndarray]:
+    """Medir accuracy, acuerdo con el modelo de referencia y latencia por imagen"""
+    latencies, predictions = [], []
+    for image in images:
+        started = time.perf_counter()
+        predictions.append(backend.predict(image[np.newaxis])[0])
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    predicted = np.argmax(np.stack(predictions), axis=1)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    report = {
+        "backend": backend.name,
+        "path": backend.path,
+        "size_bytes": os.path.getsize(backend.path) if os.path.isfile(backend.path) else None,
+        "accuracy": round(float(np.mean(predicted == labels)), 4),
+        "latency_ms": {"p50": round(float(p50), 3), "p95": round(float(p95), 3)}
+    }
+    if reference is not None:
+        report["agreement_with_reference"] = round(float(np.mean(predicted == reference)), 4)
+    return report, predicted
+
+
+def accuracy_latency_report(reference_path: str, tflite_paths: List[str], eval_dir: str, limit: int = 0) -> List[Dict]:
+    """Comparar el modelo original contra sus variantes TFLite sobre un conjunto etiquetado"""
+    images, labels = load_labeled_images(eval_dir, limit)
+
+    reference = detect_backend(reference_path)(reference_path).load()
+    reference.warmup()
+    reference_report, reference_predicted = evaluate_backend(reference, images, labels)
+    reports = [reference_report]
+
+    for path in tflite_paths:
+        backend = TFLiteBackend(path).load()
+        backend.warmup()
+        report, _ = evaluate_backend(backend, images, labels, reference_predicted)
+        reports.append(report)
+    return reports
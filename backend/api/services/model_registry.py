@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from config import settings
+from services.inference_engine import inference_engine
+from services.model_backends import ModelBackend, load_backend
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ModelVersion:
+    """Versión de modelo registrada: artefacto, estado y tiempos de carga/calentamiento"""
+
+    version: int
+    name: str
+    path: str
+    status: str = "loading"  # loading, ready, active, failed
+    backend: Optional[ModelBackend] = None
+    error: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    activated_at: Optional[str] = None
+    load_ms: float = 0.0
+    warmup_ms: float = 0.0
+    activations: int = 0
+    # Trabajos largos (re-clasificación) que usan esta versión; no se expulsa mientras tenga alguno
+    pins: int = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": self.version,
+            "name": self.name,
+            "path": self.path,
+            "status": self.status,
+            "backend": self.backend.name if self.backend else None,
+            "load_ms": self.load_ms,
+            "warmup_ms": self.warmup_ms,
+            "created_at": self.created_at,
+            "activated_at": self.activated_at,
+            "activations": self.activations,
+            "pins": self.pins,
+            "error": self.error
+        }
+
+
+class ModelRegistry:
+    """Registro versionado de modelos: carga en segundo plano, cambio atómico y rollback"""
+
+    def __init__(self, keep_versions: int = 2, drain_timeout: float = 10.0):
+        self.keep_versions = keep_versions
+        self.drain_timeout = drain_timeout
+        self.versions: "OrderedDict[int, ModelVersion]" = OrderedDict()
+        self.active_version: Optional[int] = None
+        self._next_version = 1
+        self._swap_lock: Optional[asyncio.Lock] = None
+        self._tasks: Set[asyncio.Task] = set()
+        # Hilo propio para cargar: no ocupa los workers de inferencia del modelo activo
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+
+    @property
+    def active_model(self) -> Optional[ModelBackend]:
+        return inference_engine.model
+
+    @property
+    def loading(self) -> List[ModelVersion]:
+        return [v for v in self.versions.values() if v.status == "loading"]
+
+    def _lock(self) -> asyncio.Lock:
+        if self._swap_lock is None:
+            self._swap_lock = asyncio.Lock()
+        return self._swap_lock
+
+    def _new_version(self, path: str, name: Optional[str] = None) -> ModelVersion:
+        version = ModelVersion(self._next_version, name or os.path.basename(path.rstrip("/")), path)
+        self._next_version += 1
+        self.versions[version.version] = version
+        return version
+
+    async def _load_version(self, version: ModelVersion, backend: str = "", activate: bool = True) -> ModelVersion:
+        try:
+            # Carga y calentamiento fuera del event loop; el modelo activo sigue sirviendo mientras tanto
+            instance = await asyncio.get_running_loop().run_in_executor(
+                self._loader, load_backend, version.path, backend
+            )
+        except Exception as e:
+            version.status = "failed"
+            version.error = str(e)
+            logger.error(f"Model version {version.version} ({version.path}) failed to load: {e}")
+            return version
+
+        version.backend = instance
+        version.load_ms = round(instance.load_seconds * 1000, 2)
+        version.warmup_ms = round(instance.warmup_seconds * 1000, 2)
+        version.status = "ready"
+        logger.info(f"Model version {version.version} ready: load {version.load_ms}ms, warm-up {version.warmup_ms}ms")
+        if activate:
+            await self.activate(version.version)
+        return version
+
+    async def load(self, path: str, name: Optional[str] = None, backend: str = "", activate: bool = True) -> ModelVersion:
+        """Cargar, calentar y (opcionalmente) activar una versión, esperando a que termine"""
+        return await self._load_version(self._new_version(path, name), backend, activate)
+
+    def load_in_background(self, path: str, name: Optional[str] = None, backend: str = "", activate: bool = True) -> ModelVersion:
+        """Registrar una versión y cargarla en segundo plano; se activa al terminar el calentamiento"""
+        version = self._new_version(path, name)
+        task = asyncio.get_running_loop().create_task(self._load_version(version, backend, activate))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return version
+
+    async def register(self, instance: ModelBackend, name: str, activate: bool = True) -> ModelVersion:
+        """Registrar un backend ya cargado (p. ej. el modelo dummy)"""
+        version = self._new_version(instance.path, name)
+        version.backend = instance
+        version.load_ms = round(instance.load_seconds * 1000, 2)
+        version.warmup_ms = round(instance.warmup_seconds * 1000, 2)
+        version.status = "ready"
+        if activate:
+            await self.activate(version.version)
+        return version
+
+    async def activate(self, version_id: int) -> ModelVersion:
+        """Cambiar atómicamente el modelo servido y drenar los lotes en curso del anterior"""
+        async with self._lock():
+            version = self.versions.get(version_id)
+            if version is None or version.backend is None:
+                raise ValueError(f"Model version {version_id} is not loaded")
+            if version_id == self.active_version:
+                return version
+
+            previous = self.versions.get(self.active_version) if self.active_version else None
+            # Las peticiones en cola se agrupan ya con el nuevo modelo
+            inference_engine.set_model(version.backend)
+            version.status = "active"
+            version.activated_at = datetime.now().isoformat()
+            version.activations += 1
+            self.active_version = version_id
+            logger.info(f"Model version {version_id} ({version.name}) is now active")
+
+            if previous is not None:
+                previous.status = "ready"
+                drained = await inference_engine.drain(previous.backend, self.drain_timeout)
+                if not drained:
+                    logger.warning(f"Model version {previous.version} still had batches running after {self.drain_timeout}s")
+            self._evict()
+            return version
+
+    async def rollback(self, version_id: Optional[int] = None) -> ModelVersion:
+        """Volver a una versión residente (por defecto la activada más recientemente antes de la actual)"""
+        if version_id is None:
+            candidates = [
+                v for v in self.versions.values()
+                if v.version != self.active_version and v.status == "ready" and v.activated_at
+            ]
+            if not candidates:
+                raise ValueError("No resident model version to roll back to")
+            version_id = max(candidates, key=lambda v: v.activated_at).version
+        return await self.activate(version_id)
+
+    def pin_active(self) -> ModelVersion:
+        """Reservar la versión activa para un trabajo largo: sigue residente aunque se active otra"""
+        version = self.versions.get(self.active_version) if self.active_version else None
+        if version is None or version.backend is None:
+            raise ValueError("No active model version")
+        version.pins += 1
+        return version
+
+    def unpin(self, version: ModelVersion):
+        """Liberar la reserva de pin_active() y expulsar lo que sobre"""
+        version.pins = max(version.pins - 1, 0)
+        self._evict()
+
+    def _evict(self):
+        """Mantener residentes sólo las keep_versions versiones usadas más recientemente"""
+        resident = sorted(
+            (v for v in self.versions.values() if v.status in ("ready", "active")),
+            key=lambda v: v.activated_at or v.created_at
+        )
+        excess = len(resident) - self.keep_versions
+        for version in resident:
+            if excess <= 0:
+                break
+            if version.version == self.active_version or version.pins:
+                continue
+            del self.versions[version.version]
+            excess -= 1
+            logger.info(f"Model version {version.version} ({version.name}) evicted from memory")
+        failed = [v for v in self.versions.values() if v.status == "failed"]
+        for version in failed[:max(len(failed) - self.keep_versions, 0)]:
+            del self.versions[version.version]
+
+    def shutdown(self):
+        """Liberar el hilo de carga"""
+        self._loader.shutdown(wait=False, cancel_futures=True)
+
+    def get_info(self) -> Dict:
+        """Obtener versión activa y versiones residentes con sus tiempos de carga"""
+        return {
+            "active_version": self.active_version,
+            "keep_versions": self.keep_versions,
+            "versions": [version.to_dict() for version in reversed(self.versions.values())]
+        }
+
+
+# Instancia global del registro de modelos
+model_registry = ModelRegistry(
+    keep_versions=settings.MODEL_REGISTRY_KEEP_VERSIONS,
+    drain_timeout=settings.MODEL_REGISTRY_DRAIN_TIMEOUT
+)
@@ -0,0 +1,103 @@
+import logging
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ServingModel:
+    """Modelo Keras servido mediante tf.function con una firma fija por tamaño de lote"""
+
+    def __init__(self,
+                 model,
+                 batch_sizes: Sequence[int] = (1, 2, 4, 8, 16),
+                 input_size: Tuple[int, int] = (224, 224)):
+        self.model = model
+        self.batch_sizes: List[int] = sorted(set(batch_sizes))
+        self.input_size = tuple(input_size)
+        self.warmup_seconds: Dict[int, float] = {}
+
+        # Una única tf.function con una función concreta trazada por tamaño de lote;
+        # llamar a la función concreta evita el pipeline tf.data de model.predict
+        serve = tf.function(self._serve)
+        self._concrete = {
+            size: serve.get_concrete_function(
+                tf.TensorSpec([size, *self.input_size, 3], tf.float32, name="images")
+            )
+            for size in self.batch_sizes
+        }
+
+    def _serve(self, images):
+        return self.model(images, training=False)
+
+    @property
+    def input_shape(self):
+        return getattr(self.model, "input_shape", (None, *self.input_size, 3))
+
+    @property
+    def output_shape(self):
+        return getattr(self.model, "output_shape", None)
+
+    def _bucket(self, n: int) -> int:
+        for size in self.batch_sizes:
+            if size >= n:
+                return size
+        return self.batch_sizes[-1]
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        n = len(batch)
+        size = self._bucket(n)
+        if n < size:
+            # Rellenar hasta el tamaño trazado más cercano para no volver a trazar
+            padded = np.zeros((size, *batch.shape[1:]), dtype=np.float32)
+            padded[:n] = batch
+            batch = padded
+        outputs = self._concrete[size](tf.convert_to_tensor(batch, dtype=tf.float32))
+        return outputs.numpy()[:n]
+
+    def predict(self, inputs: np.ndarray) -> np.ndarray:
+        """Clasificar un lote (N, H, W, 3) y devolver probabilidades (N, C)"""
+        inputs = np.asarray(inputs, dtype=np.float32)
+        largest = self.batch_sizes[-1]
+        if len(inputs) <= largest:
+            return self._run(inputs)
+        return np.concatenate([
+            self._run(inputs[start:start + largest])
+            for start in range(0, len(inputs), largest)
+        ])
+
+    def warmup(self) -> Dict[int, float]:
+        """Ejecutar cada firma una vez para que la primera imagen real no pague la inicialización"""
+        for size in self.batch_sizes:
+            started = time.perf_counter()
+            self._concrete[size](tf.zeros([size, *self.input_size, 3], dtype=tf.float32))
+            self.warmup_seconds[size] = time.perf_counter() - started
+        logger.info(
+            "Serving model warmed up: " +
+            ", ".join(f"bs={size} {secs * 1000:.1f}ms" for size, secs in self.warmup_seconds.items())
+        )
+        return self.warmup_seconds
+
+    def get_info(self) -> Dict:
+        """Obtener firmas trazadas y tiempos de calentamiento"""
+        return {
+            "batch_sizes": self.batch_sizes,
+            "input_size": list(self.input_size),
+            "warmup_ms": {
+                str(size): round(secs * 1000, 2) for size, secs in self.warmup_seconds.items()
+            }
+        }
+
+
+def serving_batch_sizes() -> List[int]:
+    """Tamaños de lote a trazar: configurados y limitados por el tamaño máximo del motor"""
+    sizes = [size for size in settings.SERVING_BATCH_SIZES if size <= settings.INFERENCE_MAX_BATCH_SIZE]
+    if settings.INFERENCE_MAX_BATCH_SIZE not in sizes:
+        sizes.append(settings.INFERENCE_MAX_BATCH_SIZE)
+    return sorted(sizes)
+
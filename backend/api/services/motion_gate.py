@@ -0,0 +1,177 @@
+import io
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import settings
+from services.inference_engine import inference_engine
+from services.inference_executor import inference_executor
+
+logger = logging.getLogger(__name__)
+
+# Miniatura en gris usada para comparar frames consecutivos
+THUMBNAIL_SIZE = (32, 24)
+
+
+def frame_thumbnail(image_data: bytes) -> Optional[np.ndarray]:
+    """Miniatura en gris (24x32) decodificada a 1/8 de resolución con draft()"""
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        if image.format == "JPEG":
+            image.draft("L", THUMBNAIL_SIZE)
+        return np.asarray(image.convert("L").resize(THUMBNAIL_SIZE, Image.BILINEAR), dtype=np.int16)
+    except Exception:
+        return None
+
+
+def timed_thumbnail(image_data: bytes) -> Tuple[Optional[np.ndarray], float]:
+    """frame_thumbnail() en el worker, con la CPU de ese hilo (thread_time no incluye al resto del proceso)"""
+    started = time.thread_time()
+    thumbnail = frame_thumbnail(image_data)
+    return thumbnail, time.thread_time() - started
+
+
+@dataclass
+class CameraState:
+    thumbnail: Optional[np.ndarray] = None
+    last_result: Optional[Dict] = None
+    last_classified_at: float = 0.0
+    model_version: int = 0
+
+
+@dataclass
+class GateDecision:
+    run: bool
+    reason: str
+    difference: Optional[float] = None
+    last_result: Optional[Dict] = None
+
+
+@dataclass
+class GateStats:
+    frames: int = 0
+    classified: int = 0
+    skipped: int = 0
+    reasons: Dict[str, int] = field(default_factory=dict)
+    gate_cpu_seconds: float = 0.0
+
+
+class MotionGate:
+    """Prefiltro barato por cámara: sólo deja pasar a la CNN frames con cambios y objeto presente"""
+
+    def __init__(self,
+                 threshold: float = 6.0,
+                 max_skip_seconds: float = 30.0,
+                 sensor_max_age_seconds: float = 10.0,
+                 min_weight: float = 0.1,
+                 enabled: bool = True):
+        self.threshold = threshold
+        self.max_skip_seconds = max_skip_seconds
+        self.sensor_max_age_seconds = sensor_max_age_seconds
+        self.min_weight = min_weight
+        self.enabled = enabled
+        self.cameras: Dict[str, CameraState] = {}
+        self.stats = GateStats()
+
+    def object_present(self, sensor_data: Optional[Dict]) -> Optional[bool]:
+        """PIR/peso recientes -> True/False; None si no hay datos de sensores recientes"""
+        if not sensor_data or not sensor_data.get("last_update"):
+            return None
+        try:
+            updated = datetime.fromisoformat(str(sensor_data["last_update"]))
+        except ValueError:
+            return None
+        age = (datetime.now(updated.tzinfo) - updated).total_seconds()
+        if age > self.sensor_max_age_seconds:
+            return None
+        return bool(sensor_data.get("pir_sensor")) or float(sensor_data.get("weight") or 0.0) > self.min_weight
+
+    async def evaluate(self,
+                       camera_id: str,
+                       image_data: bytes,
+                       sensor_data: Optional[Dict] = None,
+                       model_version: int = 0) -> GateDecision:
+        """Decidir si el frame debe clasificarse o si basta con el último resultado"""
+        # La decodificación de la miniatura va al pool de preprocesado, no al event loop
+        thumbnail, cpu_seconds = await inference_executor.run_preprocess(timed_thumbnail, image_data)
+        started = time.thread_time()
+        state = self.cameras.setdefault(camera_id, CameraState())
+
+        difference = None
+        if thumbnail is not None and state.thumbnail is not None and thumbnail.shape == state.thumbnail.shape:
+            difference = float(np.mean(np.abs(thumbnail - state.thumbnail)))
+        if thumbnail is not None:
+            state.thumbnail = thumbnail
+
+        present = self.object_present(sensor_data)
+        if not self.enabled or state.last_result is None:
+            decision = GateDecision(True, "no_previous_result", difference)
+        elif state.model_version != model_version:
+            decision = GateDecision(True, "model_changed", difference)
+        elif time.monotonic() - state.last_classified_at > self.max_skip_seconds:
+            decision = GateDecision(True, "refresh", difference)
+        elif present is False:
+            decision = GateDecision(False, "no_object", difference, state.last_result)
+        elif difference is None or difference > self.threshold:
+            decision = GateDecision(True, "scene_changed", difference)
+        else:
+            decision = GateDecision(False, "scene_unchanged", difference, state.last_result)
+
+        self.stats.frames += 1
+        self.stats.reasons[decision.reason] = self.stats.reasons.get(decision.reason, 0) + 1
+        if decision.run:
+            self.stats.classified += 1
+        else:
+            self.stats.skipped += 1
+        self.stats.gate_cpu_seconds += cpu_seconds + time.thread_time() - started
+        return decision
+
+    def record_result(self, camera_id: str, result: Dict, model_version: int = 0):
+        """Guardar el último resultado de la cámara"""
+        state = self.cameras.setdefault(camera_id, CameraState())
+        state.last_result = result
+        state.last_classified_at = time.monotonic()
+        state.model_version = model_version
+
+    def reset(self, camera_id: Optional[str] = None):
+        """Olvidar el estado de una cámara (o de todas)"""
+        if camera_id is None:
+            self.cameras.clear()
+        else:
+            self.cameras.pop(camera_id, None)
+
+    def get_stats(self) -> Dict:
+        """Obtener ratio de frames omitidos y tiempo de modelo ahorrado estimado"""
+        stats = self.stats
+        # Coste por clasificación según los tiempos de lote del motor, no la CPU de todo el proceso
+        model_seconds_per_image = inference_engine.stats.seconds_per_image()
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "cameras": len(self.cameras),
+            "frames": stats.frames,
+            "classified": stats.classified,
+            "skipped": stats.skipped,
+            "skip_ratio": round(stats.skipped / stats.frames, 4) if stats.frames else 0.0,
+            "reasons": dict(stats.reasons),
+            "model_ms_per_image": round(model_seconds_per_image * 1000, 3),
+            "gate_cpu_ms": round(stats.gate_cpu_seconds * 1000, 3),
+            "estimated_model_seconds_saved": round(
+                stats.skipped * model_seconds_per_image - stats.gate_cpu_seconds, 3
+            )
+        }
+
+
+# Instancia global del prefiltro de movimiento
+motion_gate = MotionGate(
+    threshold=settings.MOTION_GATE_THRESHOLD,
+    max_skip_seconds=settings.MOTION_GATE_MAX_SKIP_SECONDS,
+    sensor_max_age_seconds=settings.MOTION_GATE_SENSOR_MAX_AGE_SECONDS,
+    min_weight=settings.MOTION_GATE_MIN_WEIGHT,
+    enabled=settings.MOTION_GATE_ENABLED
+)
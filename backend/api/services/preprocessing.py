@@ -0,0 +1,101 @@
+import io
+import logging
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+RESAMPLE_FILTERS = {
+    "nearest": Image.NEAREST,
+    "bilinear": Image.BILINEAR,
+    "bicubic": Image.BICUBIC,
+}
+
+INPUT_SIZE: Tuple[int, int] = tuple(settings.MODEL_INPUT_SIZE)
+RESAMPLE = RESAMPLE_FILTERS[settings.PREPROCESS_RESAMPLE]
+SCALE = np.float32(255.0)
+
+ImageSource = Union[bytes, bytearray, memoryview, str]
+
+
+class MemoryViewReader(io.RawIOBase):
+    """Fichero de sólo lectura sobre un buffer existente; a diferencia de io.BytesIO no lo copia"""
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview]):
+        super().__init__()
+        self._view = data if isinstance(data, memoryview) else memoryview(data)
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(self._position + size, len(self._view))
+        chunk = self._view[self._position:end].tobytes()
+        self._position = max(end, self._position)
+        return chunk
+
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._position:self._position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(base + offset, 0)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+def open_image(source: ImageSource) -> Image.Image:
+    """Abrir una imagen desde bytes, un buffer/memoryview (sin copiarlo) o una ruta"""
+    return Image.open(source if isinstance(source, str) else MemoryViewReader(source))
+
+
+def decode_image(source: ImageSource, size: Tuple[int, int] = INPUT_SIZE) -> Image.Image:
+    """Decodificar una imagen a RGB del tamaño del modelo
+
+    Para JPEG se usa draft(): libjpeg escala la DCT a 1/2, 1/4 o 1/8 durante la
+    decodificación, de modo que un frame UXGA nunca se decodifica a resolución completa.
+    """
+    image = open_image(source)
+    if settings.PREPROCESS_JPEG_DRAFT and image.format == "JPEG":
+        image.draft("RGB", size)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if image.size != size:
+        image = image.resize(size, RESAMPLE)
+    return image
+
+
+def image_to_array(image: Image.Image, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Normalizar una imagen RGB a float32 [0, 1] escribiendo directamente en ``out``"""
+    pixels = np.asarray(image, dtype=np.uint8)
+    if out is None:
+        out = np.empty(pixels.shape, dtype=np.float32)
+    np.divide(pixels, SCALE, out=out)
+    return out
+
+
+def preprocess_image_bytes(image_data: ImageSource, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Bytes JPEG/PNG (buffer o ruta) -> tensor float32 (H, W, 3) listo para el modelo, normalizado en ``out``"""
+    return image_to_array(decode_image(image_data), out)
+
+
+def preprocess_batch(images: Sequence[ImageSource], out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Preprocesar N imágenes dentro de un único buffer float32 (N, H, W, 3) preasignado"""
+    if out is None:
+        out = np.empty((len(images), *INPUT_SIZE[::-1], 3), dtype=np.float32)
+    for i, image_data in enumerate(images):
+        preprocess_image_bytes(image_data, out[i])
+    return out[:len(images)]
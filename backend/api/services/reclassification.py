@@ -0,0 +1,312 @@
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from services.model_backends import ModelBackend, load_backend
+from services.preprocessing import INPUT_SIZE, preprocess_image_bytes
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+MANIFEST_FILE = "manifest.txt"
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def iter_images(folder: str) -> Iterator[str]:
+    """Recorrer el archivo de imágenes con os.scandir (sin cargar stat de cada fichero)"""
+    stack = [folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield entry.path
+
+
+def decode_batch(paths: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Decodificar un lote de rutas a (N, H, W, 3) float32 y una máscara de imágenes válidas"""
+    batch = np.zeros((len(paths), *INPUT_SIZE[::-1], 3), dtype=np.float32)
+    valid = np.ones(len(paths), dtype=bool)
+    for i, path in enumerate(paths):
+        try:
+            preprocess_image_bytes(path, batch[i])
+        except Exception:
+            valid[i] = False
+    return batch, valid
+
+
+def recorded_label(path: str, images_dir: str, class_names: List[str]) -> int:
+    """Clase con la que se archivó la imagen (una carpeta <clase> en su ruta) o -1 si no consta"""
+    parts = os.path.relpath(path, images_dir).lower().split(os.sep)[:-1]
+    for index, name in enumerate(class_names):
+        if name.lower() in parts:
+            return index
+    return -1
+
+
+def _write_json_atomic(path: str, data: Dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_results(output_dir: str) -> Dict[str, np.ndarray]:
+    """Concatenar las columnas de todos los shards completados de un trabajo"""
+    with open(os.path.join(output_dir, CHECKPOINT_FILE), "r", encoding="utf-8") as file:
+        checkpoint = json.load(file)
+    columns: Dict[str, List[np.ndarray]] = {}
+    for shard in checkpoint["shards"]:
+        with np.load(os.path.join(output_dir, shard["file"])) as data:
+            for name in data.files:
+                columns.setdefault(name, []).append(data[name])
+    return {name: np.concatenate(parts) for name, parts in columns.items()}
+
+
+class ReclassificationJob:
+    """Re-clasificación masiva y reanudable del archivo de imágenes capturadas con un modelo dado"""
+
+    def __init__(self,
+                 images_dir: str,
+                 output_dir: str,
+                 model_path: str = "",
+                 backend: Optional[ModelBackend] = None,
+                 batch_size: int = 32,
+                 workers: int = 4,
+                 executor: str = "thread",
+                 shard_size: int = 10000,
+                 limit: int = 0,
+                 predict: Optional[Callable[[np.ndarray], np.ndarray]] = None):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {executor}")
+        self.images_dir = images_dir
+        self.output_dir = output_dir
+        self.model_path = model_path or (backend.path if backend else "")
+        self.backend = backend
+        self.batch_size = batch_size
+        self.workers = workers
+        self.executor = executor
+        # El shard debe contener un número entero de lotes
+        self.shard_size = max(shard_size // batch_size, 1) * batch_size
+        self.limit = limit
+        # Llamada al modelo por lote; por defecto backend.predict en el hilo del trabajo
+        self.predict = predict
+        self.class_names = list(settings.MODEL_CLASSES)
+        self.cancel_event = threading.Event()
+        self.state = "pending"  # pending, running, finished, cancelled, failed
+        self.error: Optional[str] = None
+        self.total = 0
+        self.processed = 0
+        self.failed_images = 0
+        self.started_at: Optional[float] = None
+        self.images_per_second = 0.0
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.output_dir, MANIFEST_FILE)
+
+    @property
+    def checkpoint_path(self) -> str:
+        return os.path.join(self.output_dir, CHECKPOINT_FILE)
+
+    def _load_manifest(self) -> List[str]:
+        """Listado fijo de imágenes: se crea una vez para que reanudar use el mismo orden"""
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                return file.read().splitlines()
+        paths = sorted(iter_images(self.images_dir))
+        if self.limit:
+            paths = paths[:self.limit]
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write("\n".join(paths))
+        os.replace(tmp_path, self.manifest_path)
+        return paths
+
+    def _load_checkpoint(self) -> Dict:
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "r", encoding="utf-8") as file:
+                checkpoint = json.load(file)
+            if checkpoint.get("shard_size") != self.shard_size:
+                raise ValueError(
+                    f"Checkpoint in {self.output_dir} uses shard_size={checkpoint.get('shard_size')}; "
+                    f"resume with the same shard size or use a new output directory"
+                )
+            return checkpoint
+        return {
+            "images_dir": self.images_dir,
+            "model_path": self.model_path,
+            "class_names": self.class_names,
+            "shard_size": self.shard_size,
+            "next_index": 0,
+            "processed": 0,
+            "failed_images": 0,
+            "shards": [],
+            "finished": False,
+            "created_at": datetime.now().isoformat()
+        }
+
+    def _make_executor(self) -> Executor:
+        if self.executor == "process":
+            # Ctrl+C lo gestiona el proceso principal (cancel()); los workers lo ignoran
+            return ProcessPoolExecutor(
+                max_workers=self.workers, initializer=signal.signal, initargs=(signal.SIGINT, signal.SIG_IGN)
+            )
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="reclassify-decode")
+
+    def _write_shard(self, index: int, start: int, paths: List[str], probabilities: np.ndarray, valid: np.ndarray) -> Dict:
+        """Guardar un shard columnar (.npz) con una fila por imagen"""
+        predicted = probabilities.argmax(axis=1).astype(np.int8)
+        predicted[~valid] = -1
+        confidence = probabilities.max(axis=1).astype(np.float32)
+        confidence[~valid] = 0.0
+        file_name = f"shard_{index:05d}.npz"
+        tmp_path = os.path.join(self.output_dir, f"{file_name}.tmp.npz")
+        np.savez_compressed(
+            tmp_path,
+            path=np.array(paths),
+            predicted=predicted,
+            confidence=confidence,
+            probabilities=probabilities.astype(np.float16),
+            recorded=np.array([recorded_label(p, self.images_dir, self.class_names) for p in paths], dtype=np.int8),
+            valid=valid
+        )
+        os.replace(tmp_path, os.path.join(self.output_dir, file_name))
+        return {"file": file_name, "start": start, "count": len(paths)}
+
+    def run(self, on_progress: Optional[Callable[["ReclassificationJob"], None]] = None) -> Dict:
+        """Ejecutar (o reanudar) el trabajo hasta terminar o hasta que se cancele"""
+        self.state = "running"
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            paths = self._load_manifest()
+            checkpoint = self._load_checkpoint()
+            self.total = len(paths)
+            self.processed = checkpoint["processed"]
+            self.failed_images = checkpoint["failed_images"]
+            if self.backend is None:
+                self.backend = load_backend(self.model_path)
+
+            self.started_at = time.perf_counter()
+            resumed_from = self.processed
+            start = checkpoint["next_index"]
+            if start:
+                logger.info(f"Resuming reclassification at image {start}/{self.total}")
+            with self._make_executor() as executor:
+                for shard_start in range(start, self.total, self.shard_size):
+                    if self.cancel_event.is_set():
+                        break
+                    shard_paths = paths[shard_start:shard_start + self.shard_size]
+                    probabilities, valid = self._classify_shard(executor, shard_paths, resumed_from, on_progress)
+                    if probabilities is None:
+                        break
+
+                    checkpoint["shards"].append(
+                        self._write_shard(len(checkpoint["shards"]), shard_start, shard_paths, probabilities, valid)
+                    )
+                    checkpoint["next_index"] = shard_start + len(shard_paths)
+                    checkpoint["processed"] = self.processed
+                    checkpoint["failed_images"] = self.failed_images
+                    checkpoint["updated_at"] = datetime.now().isoformat()
+                    _write_json_atomic(self.checkpoint_path, checkpoint)
+
+            # Un shard a medias no se guarda: al reanudar se repite entero
+            self.processed = checkpoint["processed"]
+            self.failed_images = checkpoint["failed_images"]
+            checkpoint["finished"] = checkpoint["next_index"] >= self.total
+            _write_json_atomic(self.checkpoint_path, checkpoint)
+            self.state = "finished" if checkpoint["finished"] else "cancelled"
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"Reclassification job failed: {e}")
+        logger.info(f"Reclassification {self.state}: {self.processed}/{self.total} images")
+        return self.get_status()
+
+    def _classify_shard(self, executor: Executor, paths: List[str], resumed_from: int, on_progress) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """Decodificar lotes en paralelo (con lotes por delante) mientras el modelo clasifica el actual"""
+        batches = [paths[i:i + self.batch_size] for i in range(0, len(paths), self.batch_size)]
+        probabilities = np.zeros((len(paths), len(self.class_names)), dtype=np.float32)
+        valid = np.zeros(len(paths), dtype=bool)
+        pending: Deque = deque()
+        next_batch = 0
+        for position in range(len(batches)):
+            while next_batch < len(batches) and len(pending) < self.workers * 2:
+                pending.append(executor.submit(decode_batch, batches[next_batch]))
+                next_batch += 1
+            if self.cancel_event.is_set():
+                for future in pending:
+                    future.cancel()
+                return None, valid
+
+            images, batch_valid = pending.popleft().result()
+            offset = position * self.batch_size
+            if batch_valid.any():
+                predictions = (self.predict or self.backend.predict)(images[batch_valid])
+                probabilities[offset:offset + len(images)][batch_valid] = predictions
+            valid[offset:offset + len(images)] = batch_valid
+
+            self.processed += len(images)
+            self.failed_images += int((~batch_valid).sum())
+            elapsed = time.perf_counter() - self.started_at
+            self.images_per_second = (self.processed - resumed_from) / elapsed if elapsed > 0 else 0.0
+            if on_progress is not None:
+                on_progress(self)
+        return probabilities, valid
+
+    def cancel(self):
+        """Detener el trabajo tras el lote actual; el último shard completo queda guardado"""
+        self.cancel_event.set()
+
+    def get_status(self) -> Dict:
+        """Obtener progreso, velocidad y tiempo restante estimado"""
+        remaining = self.total - self.processed
+        return {
+            "state": self.state,
+            "images_dir": self.images_dir,
+            "output_dir": self.output_dir,
+            "model_path": self.model_path,
+            "total": self.total,
+            "processed": self.processed,
+            "failed_images": self.failed_images,
+            "progress": round(self.processed / self.total, 4) if self.total else 0.0,
+            "images_per_second": round(self.images_per_second, 2),
+            "eta_seconds": round(remaining / self.images_per_second, 1) if self.images_per_second else None,
+            "error": self.error
+        }
+
+
+def summarize_results(output_dir: str) -> Dict:
+    """Distribución de clases y acuerdo con la clase archivada en el trabajo completado"""
+    results = load_results(output_dir)
+    if not results:
+        # Checkpoint sin shards completados (trabajo cancelado antes del primero)
+        raise FileNotFoundError(f"No completed shards in {output_dir}")
+    class_names = list(settings.MODEL_CLASSES)
+    valid = results["valid"]
+    predicted = results["predicted"][valid]
+    recorded = results["recorded"][valid]
+    labeled = recorded >= 0
+    return {
+        "images": int(len(valid)),
+        "failed_images": int((~valid).sum()),
+        "predicted_distribution": {
+            name: int((predicted == index).sum()) for index, name in enumerate(class_names)
+        },
+        "labeled_images": int(labeled.sum()),
+        "agreement_with_recorded": round(float(np.mean(predicted[labeled] == recorded[labeled])), 4) if labeled.any() else None,
+        "mean_confidence": round(float(results["confidence"][valid].mean()), 4) if valid.any() else None
+    }
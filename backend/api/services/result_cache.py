@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import settings
+from services.preprocessing import ImageSource, open_image
+
+logger = logging.getLogger(__name__)
+
+# dHash de 64 bits: 9x8 píxeles en gris, comparando cada píxel con su vecino derecho
+DHASH_SIZE = (9, 8)
+
+
+def content_hash(image_data: ImageSource) -> bytes:
+    """Hash del contenido exacto de los bytes JPEG"""
+    return hashlib.blake2b(image_data, digest_size=16).digest()
+
+
+def perceptual_hash(image_data: ImageSource) -> Optional[int]:
+    """dHash de 64 bits, robusto al ruido de compresión entre frames casi idénticos"""
+    try:
+        image = open_image(image_data)
+        if image.format == "JPEG":
+            # Decodificar a 1/8 de resolución: basta para un hash de 9x8
+            image.draft("L", DHASH_SIZE)
+        pixels = np.asarray(image.convert("L").resize(DHASH_SIZE, Image.BILINEAR), dtype=np.int16)
+    except Exception:
+        return None
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+@dataclass(frozen=True)
+class CacheKey:
+    digest: bytes
+    phash: Optional[int] = None
+
+
+class ResultCache:
+    """Caché LRU/TTL de resultados de clasificación por hash de contenido (y opcionalmente perceptual)"""
+
+    def __init__(self,
+                 max_entries: int = 256,
+                 ttl_seconds: float = 30.0,
+                 perceptual: bool = False,
+                 perceptual_distance: int = 4,
+                 enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.perceptual = perceptual
+        self.perceptual_distance = perceptual_distance
+        self.enabled = enabled
+        # digest -> (resultado, instante de inserción)
+        self._entries: "OrderedDict[bytes, Tuple[Any, float]]" = OrderedDict()
+        # dHash -> digest, para búsquedas aproximadas
+        self._phashes: "OrderedDict[int, bytes]" = OrderedDict()
+        self._model_version: Optional[int] = None
+        self.exact_hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def invalidate(self, reason: str = "manual"):
+        """Vaciar la caché (p. ej. al cambiar de modelo)"""
+        if self._entries:
+            logger.info(f"Result cache invalidated ({reason}): {len(self._entries)} entries dropped")
+        self._entries.clear()
+        self._phashes.clear()
+        self.invalidations += 1
+
+    def _sync_model(self, model_version: int):
+        if model_version != self._model_version:
+            if self._model_version is not None:
+                self.invalidate("model changed")
+            self._model_version = model_version
+
+    def _remove(self, digest: bytes):
+        self._entries.pop(digest, None)
+        for phash, owner in list(self._phashes.items()):
+            if owner == digest:
+                del self._phashes[phash]
+
+    def _get_entry(self, digest: bytes) -> Optional[Any]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        result, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            self._remove(digest)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(digest)
+        return result
+
+    def _find_similar(self, phash: int) -> Optional[Any]:
+        for candidate, digest in reversed(self._phashes.items()):
+            if (candidate ^ phash).bit_count() <= self.perceptual_distance:
+                result = self._get_entry(digest)
+                if result is not None:
+                    return result
+        return None
+
+    def lookup(self, image_data: ImageSource, model_version: int) -> Tuple[Optional[Any], Optional[CacheKey]]:
+        """Buscar un resultado para estos bytes; devuelve (resultado o None, clave para store())"""
+        if not self.enabled:
+            return None, None
+        self._sync_model(model_version)
+
+        digest = content_hash(image_data)
+        result = self._get_entry(digest)
+        if result is not None:
+            self.exact_hits += 1
+            return result, CacheKey(digest)
+
+        phash = perceptual_hash(image_data) if self.perceptual else None
+        if phash is not None:
+            result = self._find_similar(phash)
+            if result is not None:
+                self.perceptual_hits += 1
+                return result, CacheKey(digest, phash)
+
+        self.misses += 1
+        return None, CacheKey(digest, phash)
+
+    def store(self, key: Optional[CacheKey], result: Any, model_version: int):
+        """Guardar el resultado calculado para una clave obtenida con lookup()"""
+        if key is None or model_version != self._model_version:
+            return
+        self._entries[key.digest] = (result, time.monotonic())
+        self._entries.move_to_end(key.digest)
+        if key.phash is not None:
+            self._phashes[key.phash] = key.digest
+            self._phashes.move_to_end(key.phash)
+        while len(self._entries) > self.max_entries:
+            digest, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            for phash, owner in list(self._phashes.items()):
+                if owner == digest:
+                    del self._phashes[phash]
+
+    def get_stats(self) -> Dict:
+        """Obtener tamaño y tasa de aciertos de la caché"""
+        hits = self.exact_hits + self.perceptual_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "perceptual": self.perceptual,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": hits,
+            "exact_hits": self.exact_hits,
+            "perceptual_hits": self.perceptual_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+
+# Instancia global de la caché de resultados
+result_cache = ResultCache(
+    max_entries=settings.RESULT_CACHE_SIZE,
+    ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+    perceptual=settings.RESULT_CACHE_PERCEPTUAL,
+    perceptual_distance=settings.RESULT_CACHE_PERCEPTUAL_DISTANCE,
+    enabled=settings.RESULT_CACHE_ENABLED
+)
@@ -0,0 +1,150 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+PIR_FIELDS = ("pir1", "pir2", "pir3")
+WEIGHT_FIELDS = ("weight1", "weight2", "weight3")
+# Valor de "sin dato" en las columnas enteras (los pesos usan NaN)
+MISSING = -1
+
+
+def _flag(value: Optional[bool]) -> int:
+    return MISSING if value is None else int(value)
+
+
+def _unflag(value: int) -> Optional[bool]:
+    return None if value == MISSING else bool(value)
+
+
+class SensorRingBuffer:
+    """Últimas lecturas de un dispositivo en columnas numéricas de tamaño fijo (append O(1))"""
+
+    def __init__(self, device_id: str, capacity: int):
+        self.device_id = device_id
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.tz_aware = np.zeros(capacity, dtype=bool)
+        self.pir = np.full((capacity, len(PIR_FIELDS)), MISSING, dtype=np.int8)
+        self.weight = np.full((capacity, len(WEIGHT_FIELDS)), np.nan, dtype=np.float32)
+        self.conveyor = np.full(capacity, MISSING, dtype=np.int8)
+        # Las posiciones de servo son un dict opcional y poco frecuente: se guardan tal cual
+        self.servo_positions: List[Optional[Dict[str, int]]] = [None] * capacity
+        self.next = 0
+        self.size = 0
+        self.total = 0
+
+    def append(self, reading: Any):
+        """Guardar una lectura (objeto con los campos de ESP32SensorData) sobrescribiendo la más antigua"""
+        i = self.next
+        timestamp: datetime = reading.timestamp
+        self.timestamps[i] = timestamp.timestamp()
+        self.tz_aware[i] = timestamp.tzinfo is not None
+        self.pir[i] = [_flag(getattr(reading, name)) for name in PIR_FIELDS]
+        self.weight[i] = [np.nan if getattr(reading, name) is None else getattr(reading, name) for name in WEIGHT_FIELDS]
+        self.conveyor[i] = _flag(reading.conveyor_active)
+        self.servo_positions[i] = reading.servo_positions
+        self.next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.total += 1
+
+    def _records(self, indices: np.ndarray) -> List[Dict]:
+        # Extraer cada columna una vez (tolist) y montar los dicts en Python puro
+        timestamps = self.timestamps[indices].tolist()
+        tz_aware = self.tz_aware[indices].tolist()
+        pir = self.pir[indices].tolist()
+        weight = np.round(self.weight[indices].astype(np.float64), 4).tolist()
+        conveyor = self.conveyor[indices].tolist()
+        records = []
+        for row, i in enumerate(indices.tolist()):
+            record = {
+                "device_id": self.device_id,
+                "timestamp": (
+                    datetime.fromtimestamp(timestamps[row], timezone.utc) if tz_aware[row]
+                    else datetime.fromtimestamp(timestamps[row])
+                )
+            }
+            for name, value in zip(PIR_FIELDS, pir[row]):
+                record[name] = _unflag(value)
+            for name, value in zip(WEIGHT_FIELDS, weight[row]):
+                record[name] = None if value != value else value
+            record["conveyor_active"] = _unflag(conveyor[row])
+            record["servo_positions"] = self.servo_positions[i]
+            records.append(record)
+        return records
+
+    def latest(self, limit: int) -> List[Dict]:
+        """Las ``limit`` lecturas más recientes, de la más antigua a la más nueva (O(limit))"""
+        count = min(max(limit, 0), self.size)
+        return self._records(np.arange(self.next - count, self.next) % self.capacity)
+
+    def last(self) -> Optional[Dict]:
+        return self.latest(1)[0] if self.size else None
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.tz_aware.nbytes + self.pir.nbytes + self.weight.nbytes + self.conveyor.nbytes
+
+
+class SensorHistoryStore:
+    """Historial de sensores por dispositivo: un ring buffer por ESP32-CONTROL"""
+
+    def __init__(self, capacity_per_device: int = 1000, max_devices: int = 64):
+        self.capacity_per_device = capacity_per_device
+        self.max_devices = max_devices
+        # device_id -> buffer, ordenado del dispositivo menos al más recientemente actualizado
+        self._buffers: "OrderedDict[str, SensorRingBuffer]" = OrderedDict()
+        self.evicted_devices = 0
+
+    def append(self, reading: Any):
+        """Añadir una lectura en O(1)"""
+        buffer = self._buffers.get(reading.device_id)
+        if buffer is None:
+            if len(self._buffers) >= self.max_devices:
+                device_id, _ = self._buffers.popitem(last=False)
+                self.evicted_devices += 1
+                logger.warning(f"Sensor history full ({self.max_devices} devices): dropped {device_id}")
+            buffer = SensorRingBuffer(reading.device_id, self.capacity_per_device)
+            self._buffers[reading.device_id] = buffer
+        else:
+            self._buffers.move_to_end(reading.device_id)
+        buffer.append(reading)
+
+    def latest(self, device_id: str, limit: int = 50) -> List[Dict]:
+        """Últimas ``limit`` lecturas de un dispositivo"""
+        buffer = self._buffers.get(device_id)
+        return buffer.latest(limit) if buffer else []
+
+    def last_reading(self) -> Optional[Dict]:
+        """Lectura más reciente de cualquier dispositivo"""
+        if not self._buffers:
+            return None
+        return next(reversed(self._buffers.values())).last()
+
+    def devices(self) -> List[str]:
+        return list(self._buffers)
+
+    def get_stats(self) -> Dict:
+        """Obtener dispositivos, lecturas guardadas y memoria de las columnas"""
+        return {
+            "devices": len(self._buffers),
+            "max_devices": self.max_devices,
+            "capacity_per_device": self.capacity_per_device,
+            "stored_readings": sum(buffer.size for buffer in self._buffers.values()),
+            "total_readings": sum(buffer.total for buffer in self._buffers.values()),
+            "column_bytes": sum(buffer.nbytes for buffer in self._buffers.values()),
+            "evicted_devices": self.evicted_devices
+        }
+
+
+# Instancia global del historial de sensores
+sensor_store = SensorHistoryStore(
+    capacity_per_device=settings.SENSOR_HISTORY_LIMIT,
+    max_devices=settings.SENSOR_HISTORY_MAX_DEVICES
+)
@@ -0,0 +1,73 @@
+import dataclasses
+import json
+from collections import deque
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from pathlib import PurePath
+from typing import Any
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Sin orjson se usa la librería estándar con las mismas reglas
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """Tipos que no son JSON nativo; mismas reglas con orjson y con json"""
+    if isinstance(obj, (datetime, date, time)):
+        # Igual que jsonable_encoder y orjson: ISO 8601 (naive sin zona, aware con +HH:MM)
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset, deque, tuple)):
+        return list(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, PurePath):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", errors="replace")
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, "dict") and callable(obj.dict):
+        # Modelos pydantic
+        return obj.dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(data: Any) -> bytes:
+        """Serializar a JSON (bytes UTF-8) con orjson"""
+        return orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps(data: Any) -> bytes:
+        """Serializar a JSON (bytes UTF-8) con la librería estándar"""
+        return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+if orjson is not None:
+    loads = orjson.loads
+else:
+    loads = json.loads
+
+
+def dumps_text(data: Any) -> str:
+    """JSON como str para WebSocket.send_text"""
+    return dumps(data).decode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializada con dumps(): mismo formato de fechas que los eventos WebSocket"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
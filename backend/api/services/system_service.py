@@ -4,16 +4,21 @@ import logging
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import json
-import io
-from PIL import Image
-import numpy as np
+
+from routes.microcontroller import system_state
+from services.camera_hub import camera_hub
+from services.classifier import classifier
+from services.inference_engine import inference_engine
+from services.inference_executor import InferenceOverloadedError
+from services.motion_gate import motion_gate
 
 logger = logging.getLogger(__name__)
 
 class SystemService:
     def __init__(self):
-        self.esp32_cam_ips = []  # Se llenarn dinmicamente
+        self.esp32_cam_ips = []  # Se llenarán dinámicamente
         self.esp32_control_ips = []
+        self.last_capture_ip: Optional[str] = None
         self.default_timeout = 10
         self.retry_attempts = 3
         
@@ -24,8 +29,8 @@ class SystemService:
             "esp32_control": []
         }
         
-        # Rango de IPs comn para dispositivos locales
-        base_ip = "192.168.1."  # Ajustar segn la red
+        # Rango de IPs común para dispositivos locales
+        base_ip = "192.168.1."  # Ajustar según la red
         
         async def check_device(ip: str):
             try:
@@ -44,7 +49,7 @@ class SystemService:
             except Exception:
                 pass  # Dispositivo no disponible
         
-        # Verificar rango de IPs comn
+        # Verificar rango de IPs común
         tasks = []
         for i in range(1, 255):
             ip = f"{base_ip}{i}"
@@ -60,8 +65,8 @@ class SystemService:
         
         return discovered
     
-    async def capture_image_from_esp32(self, device_ip: Optional[str] = None) -> Optional[bytes]:
-        """Capturar imagen desde ESP32-CAM"""
+    async def capture_image_from_esp32(self, device_ip: Optional[str] = None, max_age: Optional[float] = None) -> Optional[bytes]:
+        """Capturar imagen desde ESP32-CAM (último frame con antigüedad <= max_age segundos)"""
         if not device_ip:
             if not self.esp32_cam_ips:
                 await self.discover_esp32_devices()
@@ -71,22 +76,14 @@ class SystemService:
             logger.error("No ESP32-CAM devices found")
             return None
         
+        # Frame compartido del hub: un solo lector por cámara aunque haya varios consumidores
         for attempt in range(self.retry_attempts):
-            try:
-                timeout = aiohttp.ClientTimeout(total=self.default_timeout)
-                async with aiohttp.ClientSession(timeout=timeout) as session:
-                    async with session.get(f"http://{device_ip}/capture") as response:
-                        if response.status == 200:
-                            image_data = await response.read()
-                            logger.info(f"Image captured from {device_ip}, size: {len(image_data)} bytes")
-                            return image_data
-                        else:
-                            logger.warning(f"HTTP {response.status} from {device_ip}/capture")
-                            
-            except asyncio.TimeoutError:
-                logger.warning(f"Timeout capturing from {device_ip}, attempt {attempt + 1}")
-            except Exception as e:
-                logger.error(f"Error capturing from {device_ip}: {e}")
+            frame = await camera_hub.get_frame(device_ip, max_age)
+            if frame is not None:
+                self.last_capture_ip = device_ip
+                logger.info(f"Image captured from {device_ip}, size: {len(frame.data)} bytes, seq: {frame.seq}")
+                return frame.data
+            logger.warning(f"No frame from {device_ip}, attempt {attempt + 1}")
                 
         return None
     
@@ -165,7 +162,7 @@ class SystemService:
                                         device_ip: Optional[str] = None,
                                         material: str = "plastic",
                                         servo_position: int = 90) -> bool:
-        """Enviar comando de clasificacin a ESP32-CONTROL"""
+        """Enviar comando de clasificación a ESP32-CONTROL"""
         if not device_ip:
             if not self.esp32_control_ips:
                 await self.discover_esp32_devices()
@@ -190,7 +187,7 @@ class SystemService:
                 ) as response:
                     success = response.status == 200
                     if success:
-                        logger.info(f"Classification command sent: {material} -> {servo_position}")
+                        logger.info(f"Classification command sent: {material} -> {servo_position}°")
                     else:
                         logger.warning(f"Classification command failed: HTTP {response.status}")
                     return success
@@ -200,7 +197,7 @@ class SystemService:
             return False
     
     async def get_system_metrics(self) -> Dict:
-        """Obtener mtricas del sistema completo"""
+        """Obtener métricas del sistema completo"""
         metrics = {
             "timestamp": datetime.now().isoformat(),
             "devices": {
@@ -283,70 +280,40 @@ class SystemService:
         
         return metrics
     
-    def preprocess_image_for_classification(self, image_data: bytes) -> Optional[np.ndarray]:
-        """Preprocesar imagen para clasificacin CNN"""
-        try:
-            image = Image.open(io.BytesIO(image_data))
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-                
-            # Redimensionar a 224x224 para el modelo CNN
-            image = image.resize((224, 224))
-            
-            # Convertir a numpy array y normalizar
-            img_array = np.array(image)
-            img_array = img_array.astype('float32') / 255.0
-            img_array = np.expand_dims(img_array, axis=0)
-            
-            return img_array
-            
-        except Exception as e:
-            logger.error(f"Error preprocessing image: {e}")
-            return None
-    
-    async def classify_image(self, image_data: bytes, model=None) -> Optional[Dict]:
-        """Clasificar imagen usando modelo CNN"""
-        if model is None:
-            logger.error("No model provided for classification")
+    async def classify_image(self, image_data: bytes, camera_id: Optional[str] = None) -> Optional[Dict]:
+        """Clasificar imagen usando el servicio de clasificación compartido, filtrando frames estáticos"""
+        if not classifier.ready:
+            logger.error("No model loaded for classification")
             return None
+        
+        camera_id = camera_id or "default"
+        model_version = inference_engine.model_version
+        decision = await motion_gate.evaluate(camera_id, image_data, system_state["sensor_data"], model_version)
+        if not decision.run:
+            logger.debug(f"Motion gate skipped frame from {camera_id}: {decision.reason}")
+            return {
+                **decision.last_result,
+                "gated": {"skipped": True, "reason": decision.reason, "difference": decision.difference}
+            }
             
         try:
-            processed_image = self.preprocess_image_for_classification(image_data)
-            if processed_image is None:
-                return None
-            
-            # Realizar prediccin
-            predictions = model.predict(processed_image)
-            predicted_class_idx = int(np.argmax(predictions[0]))
-            
-            class_names = ['glass', 'metal', 'plastic']  # Orden del modelo
-            predicted_class = class_names[predicted_class_idx]
-            confidence = float(predictions[0][predicted_class_idx])
-            
-            # Mapear posiciones de servo
-            servo_positions = {
-                'glass': 45,
-                'plastic': 90,
-                'metal': 135
-            }
+            classification = await classifier.classify(image_data)
             
             result = {
-                "predicted_class": predicted_class,
-                "confidence": confidence,
-                "confidence_percentage": f"{confidence * 100:.1f}%",
-                "all_probabilities": {
-                    class_names[i]: float(predictions[0][i])
-                    for i in range(len(class_names))
-                },
-                "servo_position": servo_positions.get(predicted_class, 90),
-                "material_type": predicted_class.title(),
+                **classifier.to_dict(classification),
                 "timestamp": datetime.now().isoformat()
             }
+            motion_gate.record_result(camera_id, result, model_version)
             
-            logger.info(f"Image classified as {predicted_class} with {confidence:.3f} confidence")
+            logger.info(f"Image classified as {classification.predicted_class} with {classification.confidence:.3f} confidence")
             
-            return result
+            return {
+                **result,
+                "gated": {"skipped": False, "reason": decision.reason, "difference": decision.difference}
+            }
             
+        except InferenceOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Error in image classification: {e}")
-            return None
\ No newline at end of file
+            return None
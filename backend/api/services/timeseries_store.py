@@ -0,0 +1,511 @@
+import calendar
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import get_database_path, settings
+
+logger = logging.getLogger(__name__)
+
+# Tabla lógica -> columnas; cada mes (UTC) vive en su propia tabla <tabla>_<AAAAMM>
+TABLES: Dict[str, Tuple[str, ...]] = {
+    "sensor_readings": (
+        "device_id", "ts", "pir1", "pir2", "pir3", "weight1", "weight2", "weight3", "conveyor_active", "servo_positions"
+    ),
+    "classifications": (
+        "device_id", "ts", "material", "confidence", "servo_position", "processing_time"
+    )
+}
+COLUMN_TYPES = {
+    "device_id": "TEXT NOT NULL",
+    "ts": "REAL NOT NULL",
+    "material": "TEXT",
+    "servo_positions": "TEXT",
+    "servo_position": "INTEGER"
+}
+BOOLEAN_COLUMNS = {"pir1", "pir2", "pir3", "conveyor_active"}
+for _name in BOOLEAN_COLUMNS:
+    COLUMN_TYPES[_name] = "INTEGER"
+# Agregados por (dispositivo, minuto) mantenidos al insertar: las consultas por intervalos
+# de semanas leen ~1 fila por minuto en lugar de cada lectura
+ROLLUP_TABLE = "sensor_rollup"
+ROLLUP_COLUMNS = (
+    "readings", "weight1_sum", "weight1_n", "weight2_sum", "weight2_n", "weight3_sum", "weight3_n",
+    "pir1_max", "pir2_max", "pir3_max"
+)
+RETENTION_CHECK_SECONDS = 3600.0
+
+
+def partition_name(table: str, ts: float) -> str:
+    """Partición mensual (UTC) de una fila"""
+    moment = time.gmtime(ts)
+    return f"{table}_{moment.tm_year}{moment.tm_mon:02d}"
+
+
+def _partition_end(partition: str) -> float:
+    """Instante en que empieza el mes siguiente a la partición"""
+    year, month = int(partition[-6:-2]), int(partition[-2:])
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return float(calendar.timegm((year, month, 1, 0, 0, 0)))
+
+
+def _to_epoch(value: Optional[datetime], default: float) -> float:
+    return value.timestamp() if value is not None else default
+
+
+class TimeSeriesStore:
+    """Serie temporal embebida en SQLite (WAL): inserciones por lotes y particiones mensuales"""
+
+    def __init__(self,
+                 path: str,
+                 enabled: bool = True,
+                 flush_interval: float = 1.0,
+                 batch_size: int = 500,
+                 max_pending: int = 20000,
+                 retention_days: int = 30):
+        self.path = path
+        self.enabled = enabled and bool(path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.retention_days = retention_days
+        # Filas pendientes de escribir: (tabla, valores)
+        self._rows: List[Tuple[str, Tuple]] = []
+        # (tipo, clave) -> JSON (o None para borrar); sólo cuenta el último valor
+        self._state: Dict[Tuple[str, str], Optional[str]] = {}
+        self._condition = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
+        self._opened = False
+        self._closing = False
+        self._flush_requested = False
+        self._writing = False
+        self._partitions: Dict[str, List[str]] = {table: [] for table in (*TABLES, ROLLUP_TABLE)}
+        self._readers = threading.local()
+        self._last_retention_check = 0.0
+        self.inserted = {table: 0 for table in TABLES}
+        self.dropped_rows = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.dropped_partitions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # En WAL, NORMAL sólo puede perder la última transacción ante un corte de luz
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def open(self):
+        """Crear la base de datos y arrancar el hilo escritor"""
+        if not self.enabled or self._opened:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS device_state ("
+                    "kind TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL, "
+                    "PRIMARY KEY (kind, key))"
+                )
+            self._load_partitions(connection)
+        finally:
+            connection.close()
+        self._opened = True
+        self._writer = threading.Thread(target=self._run, name="timeseries-writer", daemon=True)
+        self._writer.start()
+        logger.info(f"Time-series store opened at {self.path}")
+
+    def _load_partitions(self, connection: sqlite3.Connection):
+        names = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        for table in self._partitions:
+            prefix = f"{table}_"
+            self._partitions[table] = sorted(
+                name for name in names if name.startswith(prefix) and name[len(prefix):].isdigit()
+            )
+
+    # Escritura -----------------------------------------------------------
+
+    def _enqueue(self, table: str, values: Tuple):
+        if not self._opened or self._closing:
+            return
+        with self._condition:
+            if len(self._rows) >= self.max_pending:
+                self.dropped_rows += 1
+                return
+            self._rows.append((table, values))
+            if len(self._rows) >= self.batch_size:
+                self._condition.notify()
+
+    def add_sensor_reading(self, reading: Any):
+        """Encolar una lectura (objeto con los campos de ESP32SensorData)"""
+        self._enqueue("sensor_readings", (
+            reading.device_id,
+            reading.timestamp.timestamp(),
+            reading.pir1, reading.pir2, reading.pir3,
+            reading.weight1, reading.weight2, reading.weight3,
+            reading.conveyor_active,
+            json.dumps(reading.servo_positions) if reading.servo_positions is not None else None
+        ))
+
+    def add_classification(self, classification: Any):
+        """Encolar una clasificación (objeto con los campos de ESP32Classification)"""
+        self._enqueue("classifications", (
+            classification.device_id,
+            classification.timestamp.timestamp(),
+            classification.material,
+            classification.confidence,
+            classification.servo_position,
+            classification.processing_time
+        ))
+
+    def save_state(self, kind: str, key: str, data: Optional[Any]):
+        """Guardar (o borrar con None) el estado de un dispositivo; se escribe en el siguiente lote"""
+        if not self._opened or self._closing:
+            return
+        with self._condition:
+            self._state[(kind, key)] = json.dumps(data, default=str) if data is not None else None
+
+    def _ensure_partition(self, connection: sqlite3.Connection, table: str, partition: str):
+        if partition in self._partitions[table]:
+            return
+        if table == ROLLUP_TABLE:
+            columns = ", ".join(f"{name} {'INTEGER' if name.endswith(('_n', '_max')) or name == 'readings' else 'REAL'}"
+                                for name in ROLLUP_COLUMNS)
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {partition} (device_id TEXT NOT NULL, minute INTEGER NOT NULL, "
+                f"{columns}, PRIMARY KEY (device_id, minute)) WITHOUT ROWID"
+            )
+            self._partitions[table] = sorted(self._partitions[table] + [partition])
+            return
+        columns = ", ".join(f"{name} {COLUMN_TYPES.get(name, 'REAL')}" for name in TABLES[table])
+        connection.execute(f"CREATE TABLE IF NOT EXISTS {partition} ({columns})")
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {partition}_device_ts ON {partition} (device_id, ts)")
+        if table == "classifications":
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {partition}_ts ON {partition} (ts)")
+        self._partitions[table] = sorted(self._partitions[table] + [partition])
+
+    def _write(self, connection: sqlite3.Connection, rows: List[Tuple[str, Tuple]], state: Dict):
+        started = time.perf_counter()
+        grouped: Dict[Tuple[str, str], List[Tuple]] = {}
+        for table, values in rows:
+            grouped.setdefault((table, partition_name(table, values[1])), []).append(values)
+        # Un lote = una transacción (un único fsync del WAL)
+        with connection:
+            for (table, partition), values in grouped.items():
+                self._ensure_partition(connection, table, partition)
+                placeholders = ", ".join("?" for _ in TABLES[table])
+                connection.executemany(
+                    f"INSERT INTO {partition} ({', '.join(TABLES[table])}) VALUES ({placeholders})", values
+                )
+            self._write_rollup(connection, grouped)
+            for (kind, key), data in state.items():
+                if data is None:
+                    connection.execute("DELETE FROM device_state WHERE kind = ? AND key = ?", (kind, key))
+                else:
+                    connection.execute(
+                        "INSERT INTO device_state (kind, key, data, updated_at) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (kind, key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                        (kind, key, data, time.time())
+                    )
+        # Contar sólo lo confirmado: si la transacción se deshace no se llega aquí
+        for (table, _), values in grouped.items():
+            self.inserted[table] += len(values)
+        self.flushes += 1
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def _write_rollup(self, connection: sqlite3.Connection, grouped: Dict[Tuple[str, str], List[Tuple]]):
+        """Sumar las lecturas del lote a los agregados por minuto"""
+        minutes: Dict[Tuple[str, int], List] = {}
+        for (table, _), values in grouped.items():
+            if table != "sensor_readings":
+                continue
+            for device_id, ts, pir1, pir2, pir3, weight1, weight2, weight3, *_ in values:
+                aggregate = minutes.get((device_id, int(ts // 60)))
+                if aggregate is None:
+                    aggregate = minutes[(device_id, int(ts // 60))] = [0, 0.0, 0, 0.0, 0, 0.0, 0, None, None, None]
+                aggregate[0] += 1
+                for i, weight in enumerate((weight1, weight2, weight3)):
+                    if weight is not None:
+                        aggregate[1 + 2 * i] += weight
+                        aggregate[2 + 2 * i] += 1
+                for i, pir in enumerate((pir1, pir2, pir3)):
+                    if pir is not None:
+                        aggregate[7 + i] = max(aggregate[7 + i] or 0, int(pir))
+
+        by_partition: Dict[str, List[Tuple]] = {}
+        for (device_id, minute), aggregate in minutes.items():
+            by_partition.setdefault(partition_name(ROLLUP_TABLE, minute * 60), []).append((device_id, minute, *aggregate))
+        updates = ", ".join(
+            f"{name} = CASE WHEN excluded.{name} IS NULL THEN {name} WHEN {name} IS NULL THEN excluded.{name} "
+            f"ELSE MAX({name}, excluded.{name}) END" if name.endswith("_max") else f"{name} = {name} + excluded.{name}"
+            for name in ROLLUP_COLUMNS
+        )
+        for partition, values in by_partition.items():
+            self._ensure_partition(connection, ROLLUP_TABLE, partition)
+            connection.executemany(
+                f"INSERT INTO {partition} (device_id, minute, {', '.join(ROLLUP_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in range(len(ROLLUP_COLUMNS) + 2))}) "
+                f"ON CONFLICT (device_id, minute) DO UPDATE SET {updates}",
+                values
+            )
+
+    def _drop_expired_partitions(self, connection: sqlite3.Connection):
+        """La retención borra particiones enteras (DROP TABLE) en lugar de filas sueltas"""
+        cutoff = time.time() - self.retention_days * 86400
+        for table in list(self._partitions):
+            for partition in list(self._partitions[table]):
+                if _partition_end(partition) < cutoff:
+                    connection.execute(f"DROP TABLE IF EXISTS {partition}")
+                    # Listas nuevas en vez de mutarlas: los lectores las recorren desde otros hilos
+                    self._partitions[table] = [p for p in self._partitions[table] if p != partition]
+                    self.dropped_partitions += 1
+                    logger.info(f"Dropped expired time-series partition {partition}")
+
+    def _run(self):
+        connection = self._connect()
+        try:
+            while True:
+                with self._condition:
+                    deadline = time.monotonic() + self.flush_interval
+                    while (len(self._rows) < self.batch_size and not self._flush_requested
+                           and not self._closing):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    rows, self._rows = self._rows, []
+                    state, self._state = self._state, {}
+                    self._flush_requested = False
+                    closing = self._closing
+                    self._writing = bool(rows or state)
+
+                try:
+                    if rows or state:
+                        self._write(connection, rows, state)
+                    if time.monotonic() - self._last_retention_check > RETENTION_CHECK_SECONDS:
+                        self._last_retention_check = time.monotonic()
+                        self._drop_expired_partitions(connection)
+                except sqlite3.Error as e:
+                    self.errors += 1
+                    logger.error(f"Time-series write failed ({len(rows)} rows lost): {e}")
+                    # La transacción se deshizo: volver a leer qué particiones existen
+                    self._load_partitions(connection)
+                finally:
+                    with self._condition:
+                        self._writing = False
+                        self._condition.notify_all()
+                if closing:
+                    return
+        finally:
+            connection.close()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Forzar la escritura de lo pendiente y esperar a que termine"""
+        if not self._opened:
+            return True
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            while self._rows or self._state or self._writing or self._flush_requested:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Escribir lo pendiente y parar el hilo escritor"""
+        if not self._opened:
+            return
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        if self._writer is not None:
+            self._writer.join(timeout)
+
+    # Lectura -------------------------------------------------------------
+
+    def _reader(self) -> sqlite3.Connection:
+        # Una conexión por hilo: en WAL los lectores no bloquean al escritor
+        connection = getattr(self._readers, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10.0)
+            connection.execute("PRAGMA query_only=1")
+            self._readers.connection = connection
+        return connection
+
+    def _partitions_between(self, table: str, start: float, end: float) -> List[str]:
+        first = partition_name(table, max(start, 0.0))
+        last = partition_name(table, end)
+        return [p for p in self._partitions[table] if first <= p <= last]
+
+    def _latest_rows(self, table: str, where: str, params: Tuple, start: float, end: float, limit: int) -> List[Tuple]:
+        """Últimas ``limit`` filas del rango, recorriendo las particiones de la más nueva a la más antigua"""
+        rows: List[Tuple] = []
+        connection = self._reader()
+        for partition in reversed(self._partitions_between(table, start, end)):
+            remaining = limit - len(rows)
+            if remaining <= 0:
+                break
+            try:
+                rows.extend(connection.execute(
+                    f"SELECT {', '.join(TABLES[table])} FROM {partition} "
+                    f"WHERE {where} ts >= ? AND ts <= ? ORDER BY ts DESC LIMIT ?",
+                    (*params, start, end, remaining)
+                ).fetchall())
+            except sqlite3.OperationalError:
+                # Partición borrada por la retención mientras tanto
+                continue
+        rows.reverse()
+        return rows
+
+    @staticmethod
+    def _row_to_dict(table: str, row: Tuple) -> Dict:
+        record = dict(zip(TABLES[table], row))
+        record["timestamp"] = datetime.fromtimestamp(record.pop("ts"))
+        for name in BOOLEAN_COLUMNS.intersection(record):
+            if record[name] is not None:
+                record[name] = bool(record[name])
+        if record.get("servo_positions") is not None:
+            record["servo_positions"] = json.loads(record["servo_positions"])
+        return record
+
+    def query_sensor_readings(self,
+                              device_id: str,
+                              start: Optional[datetime] = None,
+                              end: Optional[datetime] = None,
+                              limit: int = 1000) -> List[Dict]:
+        """Lecturas de un dispositivo en [start, end] (las ``limit`` más recientes, en orden cronológico)"""
+        if not self._opened:
+            return []
+        rows = self._latest_rows(
+            "sensor_readings", "device_id = ? AND", (device_id,),
+            _to_epoch(start, 0.0), _to_epoch(end, time.time()), limit
+        )
+        return [self._row_to_dict("sensor_readings", row) for row in rows]
+
+    def query_sensor_buckets(self,
+                             device_id: str,
+                             bucket_seconds: int,
+                             start: Optional[datetime] = None,
+                             end: Optional[datetime] = None) -> List[Dict]:
+        """Lecturas agregadas por intervalos de ``bucket_seconds`` (pesos medios, PIR activado alguna vez)"""
+        if not self._opened:
+            return []
+        start_ts, end_ts = _to_epoch(start, 0.0), _to_epoch(end, time.time())
+        buckets: Dict[int, List[float]] = {}
+        connection = self._reader()
+        if bucket_seconds % 60 == 0:
+            # Intervalos de minutos completos: leer los agregados (rango alineado a minutos)
+            table = ROLLUP_TABLE
+            query = (
+                "SELECT minute * 60 / ?, SUM(readings), SUM(weight1_sum), SUM(weight1_n), SUM(weight2_sum), "
+                "SUM(weight2_n), SUM(weight3_sum), SUM(weight3_n), MAX(pir1_max), MAX(pir2_max), MAX(pir3_max) "
+                "FROM {partition} WHERE device_id = ? AND minute >= ? AND minute <= ? GROUP BY 1"
+            )
+            params = (bucket_seconds, device_id, int(start_ts // 60), int(end_ts // 60))
+        else:
+            table = "sensor_readings"
+            query = (
+                "SELECT CAST(ts / ? AS INTEGER), COUNT(*), "
+                "SUM(weight1), COUNT(weight1), SUM(weight2), COUNT(weight2), SUM(weight3), COUNT(weight3), "
+                "MAX(pir1), MAX(pir2), MAX(pir3) FROM {partition} "
+                "WHERE device_id = ? AND ts >= ? AND ts <= ? GROUP BY 1"
+            )
+            params = (bucket_seconds, device_id, start_ts, end_ts)
+        for partition in self._partitions_between(table, start_ts, end_ts):
+            try:
+                rows = connection.execute(query.format(partition=partition), params).fetchall()
+            except sqlite3.OperationalError:
+                continue
+            # Un intervalo puede cruzar el cambio de mes: se suman las partes
+            for bucket, *values in rows:
+                current = buckets.get(bucket)
+                if current is None:
+                    buckets[bucket] = [v if v is not None else 0 for v in values[:7]] + list(values[7:])
+                    continue
+                for i in range(7):
+                    current[i] += values[i] or 0
+                for i in range(7, 10):
+                    if values[i] is not None:
+                        current[i] = max(current[i] or 0, values[i])
+
+        result = []
+        for bucket in sorted(buckets):
+            count, w1, n1, w2, n2, w3, n3, pir1, pir2, pir3 = buckets[bucket]
+            result.append({
+                "device_id": device_id,
+                "timestamp": datetime.fromtimestamp(bucket * bucket_seconds),
+                "readings": count,
+                "weight1": round(w1 / n1, 4) if n1 else None,
+                "weight2": round(w2 / n2, 4) if n2 else None,
+                "weight3": round(w3 / n3, 4) if n3 else None,
+                "pir1": bool(pir1) if pir1 is not None else None,
+                "pir2": bool(pir2) if pir2 is not None else None,
+                "pir3": bool(pir3) if pir3 is not None else None
+            })
+        return result
+
+    def query_classifications(self,
+                              start: Optional[datetime] = None,
+                              end: Optional[datetime] = None,
+                              device_id: Optional[str] = None,
+                              limit: int = 1000) -> List[Dict]:
+        """Clasificaciones en [start, end], opcionalmente de un dispositivo"""
+        if not self._opened:
+            return []
+        where, params = ("device_id = ? AND", (device_id,)) if device_id else ("", ())
+        rows = self._latest_rows(
+            "classifications", where, params, _to_epoch(start, 0.0), _to_epoch(end, time.time()), limit
+        )
+        return [self._row_to_dict("classifications", row) for row in rows]
+
+    def load_state(self, kind: str) -> Dict[str, Any]:
+        """Estado guardado de todos los dispositivos de un tipo"""
+        if not self._opened:
+            return {}
+        rows = self._reader().execute("SELECT key, data FROM device_state WHERE kind = ?", (kind,)).fetchall()
+        return {key: json.loads(data) for key, data in rows}
+
+    def get_stats(self) -> Dict:
+        """Obtener filas pendientes/insertadas, particiones y tamaño de la base de datos"""
+        size = 0
+        for suffix in ("", "-wal"):
+            try:
+                size += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "pending_rows": len(self._rows),
+            "max_pending": self.max_pending,
+            "inserted": dict(self.inserted),
+            "dropped_rows": self.dropped_rows,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_flush_ms,
+            "errors": self.errors,
+            "partitions": {table: list(partitions) for table, partitions in self._partitions.items()},
+            "dropped_partitions": self.dropped_partitions,
+            "retention_days": self.retention_days,
+            "size_bytes": size
+        }
+
+
+# Instancia global de la serie temporal (config.yaml database.path)
+timeseries_store = TimeSeriesStore(
+    path=get_database_path(),
+    enabled=settings.TIMESERIES_ENABLED,
+    flush_interval=settings.TIMESERIES_FLUSH_INTERVAL,
+    batch_size=settings.TIMESERIES_BATCH_SIZE,
+    max_pending=settings.TIMESERIES_MAX_PENDING,
+    retention_days=settings.DATA_RETENTION_DAYS
+)
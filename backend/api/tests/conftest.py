@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos de la API se importan como en main.py (services.*, config) desde backend/api
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
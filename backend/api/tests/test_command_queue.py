@@ -0,0 +1,57 @@
+import pytest
+
+from services import command_queue as command_queue_module
+from services.command_queue import CommandQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(command_queue_module.time, "time", clock)
+    return clock
+
+
+def test_lost_ack_is_redelivered_on_next_sensor_post(clock):
+    queue = CommandQueue(ack_timeout=5.0, max_attempts=3)
+    command = queue.enqueue("control-01", "move_servo", {"position": 90})
+
+    # Entregado por un canal push; el ack se pierde y el canal se cierra
+    assert [c["id"] for c in queue.drain("control-01", track_ack=True)] == [command["id"]]
+    assert queue.inflight("control-01") == 1
+
+    clock.now += 1.0
+    assert queue.drain("control-01") == []
+
+    clock.now += 5.0
+    assert [c["id"] for c in queue.drain("control-01")] == [command["id"]]
+    assert queue.inflight("control-01") == 0
+    assert queue.redelivered == 1
+
+
+def test_enqueue_requeues_expired_inflight(clock):
+    queue = CommandQueue(ack_timeout=5.0)
+    first = queue.enqueue("control-01", "move_servo", {"position": 45})
+    queue.drain("control-01", track_ack=True)
+
+    clock.now += 6.0
+    second = queue.enqueue("control-01", "move_servo", {"position": 135})
+    assert queue.inflight("control-01") == 0
+    assert [c["id"] for c in queue.pending("control-01")] == [first["id"], second["id"]]
+
+
+def test_acked_command_is_not_redelivered(clock):
+    queue = CommandQueue(ack_timeout=5.0)
+    command = queue.enqueue("control-01", "move_servo", {"position": 90})
+    queue.drain("control-01", track_ack=True)
+    assert queue.ack("control-01", [command["id"]]) == 1
+
+    clock.now += 10.0
+    assert queue.drain("control-01") == []
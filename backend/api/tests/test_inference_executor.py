@@ -0,0 +1,42 @@
+import asyncio
+import threading
+import time
+
+from services.inference_executor import InferenceExecutor, run_to_completion
+
+
+def test_cancelled_call_waits_for_worker_thread():
+    executor = InferenceExecutor(preprocess_workers=1)
+    started = threading.Event()
+    finished = threading.Event()
+
+    def work():
+        started.set()
+        time.sleep(0.2)
+        finished.set()
+
+    async def main():
+        task = asyncio.create_task(executor.run_preprocess(work))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        # Al propagarse la cancelación el worker ya no usa nada del llamador
+        assert finished.is_set()
+        assert task.cancelled()
+        assert executor.get_stats()["pending"] == 0
+
+    try:
+        asyncio.run(main())
+    finally:
+        executor.shutdown()
+
+
+def test_run_to_completion_returns_result():
+    async def main():
+        loop = asyncio.get_running_loop()
+        return await run_to_completion(loop.run_in_executor(None, sum, [1, 2, 3]))
+
+    assert asyncio.run(main()) == 6
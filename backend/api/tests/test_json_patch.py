@@ -0,0 +1,48 @@
+import itertools
+import json
+import random
+
+import pytest
+
+from services import json_patch
+
+SCALARS = [0, 1, 2, 0.0, 1.0, 2.5, True, False, None, "", "1", "true"]
+
+
+@pytest.mark.parametrize("old, new", list(itertools.product(SCALARS, repeat=2)))
+def test_scalar_swaps_roundtrip(old, new):
+    document = {"value": old, "items": [old, {"nested": old}]}
+    target = {"value": new, "items": [new, {"nested": new}]}
+    patched = json_patch.apply(document, json_patch.diff(document, target))
+    assert patched == target
+    assert type(patched["value"]) is type(new)
+    assert type(patched["items"][0]) is type(new)
+    assert type(patched["items"][1]["nested"]) is type(new)
+
+
+@pytest.mark.parametrize("old, new", [(1, True), (0, False), (0.0, False), (1, 1.0), (True, 1)])
+def test_bool_int_float_are_distinct(old, new):
+    assert json_patch.diff(old, new) == [{"op": "replace", "path": "", "value": new}]
+    assert json_patch.diff({"a": [old]}, {"a": [new]}) == [{"op": "replace", "path": "/a/0", "value": new}]
+
+
+def test_unchanged_document_has_no_patch():
+    document = {"a": [1, True, 0.5, {"b": None}], "c/d": {"~e": "x"}}
+    assert json_patch.diff(document, {"a": [1, True, 0.5, {"b": None}], "c/d": {"~e": "x"}}) == []
+
+
+def _random_value(rng, depth=0):
+    if depth < 3 and rng.random() < 0.4:
+        if rng.random() < 0.5:
+            return [_random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+        return {rng.choice("abc/~"): _random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+    return rng.choice(SCALARS)
+
+
+def test_random_roundtrip():
+    rng = random.Random(1234)
+    for _ in range(2000):
+        old, new = _random_value(rng), _random_value(rng)
+        patched = json_patch.apply(old, json_patch.diff(old, new))
+        # json.dumps distingue 1, 1.0 y true; sort_keys ignora el orden de las claves
+        assert json.dumps(patched, sort_keys=True) == json.dumps(new, sort_keys=True)
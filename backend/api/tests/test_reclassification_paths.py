@@ -0,0 +1,33 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+
+from routes.reclassification import _resolve_under
+
+
+@pytest.fixture
+def root(tmp_path):
+    (tmp_path / "root" / "plastic").mkdir(parents=True)
+    (tmp_path / "outside").mkdir()
+    return tmp_path
+
+
+def test_relative_path_resolves_inside_root(root):
+    base = str(root / "root")
+    assert _resolve_under(base, "plastic", "images_dir") == os.path.realpath(base + "/plastic")
+    assert _resolve_under(base, None, "images_dir") == os.path.realpath(base)
+
+
+@pytest.mark.parametrize("relative", ["/etc", "../outside", "plastic/../../outside", "..\\\\outside"])
+def test_absolute_and_parent_paths_are_rejected(root, relative):
+    with pytest.raises(HTTPException) as error:
+        _resolve_under(str(root / "root"), relative, "images_dir")
+    assert error.value.status_code == 400
+
+
+def test_symlink_out_of_root_is_rejected(root):
+    os.symlink(root / "outside", root / "root" / "escape")
+    with pytest.raises(HTTPException) as error:
+        _resolve_under(str(root / "root"), "escape", "output_dir")
+    assert error.value.status_code == 400
@@ -1,14 +1,219 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List, Set
-import json
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from collections import deque
+import itertools
 import logging
 import asyncio
+import time
 from datetime import datetime
 
+import numpy as np
+
+from config import settings
+from services import json_patch
+from services.serialization import dumps, dumps_text, loads
+
 logger = logging.getLogger(__name__)
 
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+# Código de cierre cuando un cliente lento desborda su cola con la política "disconnect"
+OVERFLOW_CLOSE_CODE = 1008
+# Eventos de estado idempotentes: con la política "coalesce" un mensaje pendiente se sustituye por el más reciente.
+# Comandos y resultados de clasificación nunca se coalescen
+COALESCE_EVENTS = ("system_status", "sensor_data", "device_status", "camera_stream")
+# Campos de los temas delta que cambian en cada envío: van en el sobre ("volatile") y no en el documento,
+# así un estado sin cambios reales no genera patch
+DELTA_VOLATILE_PATHS: Dict[str, Tuple[str, ...]] = {
+    "system_status": ("/timestamp", "/system_metrics/timestamp", "/system_metrics/connectivity/last_discovery")
+}
+
+def coalesce_key(event_type: Optional[str], data: object) -> Optional[str]:
+    """Clave para sustituir mensajes pendientes (por evento y dispositivo); None si no se puede coalescer"""
+    if event_type not in COALESCE_EVENTS:
+        return None
+    device_id = data.get("device_id") if isinstance(data, dict) else None
+    return f"{event_type}:{device_id}" if device_id else event_type
+
+
+class ClientConnection:
+    """Cola de salida acotada de un WebSocket y su tarea escritora: un cliente lento sólo se retrasa a sí mismo"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, websocket: WebSocket, client_type: str, max_queue: int, overflow_policy: str, send_timeout: float):
+        self.websocket = websocket
+        self.client_type = client_type
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.send_timeout = send_timeout
+        self.id = f"{client_type}-{next(self._ids)}"
+        # (encolado, clave para coalesce, mensaje ya serializado)
+        self.queue: Deque[Tuple[float, Optional[str], str]] = deque()
+        self.wakeup = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.connected_at = datetime.now()
+        # Segundos entre encolar y terminar de enviar los últimos mensajes
+        self.lags: Deque[float] = deque(maxlen=200)
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.peak_depth = 0
+
+    def enqueue(self, text: str, key: Optional[str] = None) -> bool:
+        """Encolar sin bloquear; False si el mensaje no entra o la conexión debe cerrarse"""
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_queue:
+            if self.overflow_policy == "disconnect":
+                return False
+            replaced = False
+            if self.overflow_policy == "coalesce" and key is not None:
+                # Sustituir el mensaje pendiente del mismo tipo: sólo interesa el más reciente
+                for i, (_, queued_key, _) in enumerate(self.queue):
+                    if queued_key == key:
+                        del self.queue[i]
+                        self.coalesced += 1
+                        replaced = True
+                        break
+            if not replaced:
+                self.queue.popleft()
+                self.dropped += 1
+        self.queue.append((time.monotonic(), key, text))
+        self.enqueued += 1
+        self.peak_depth = max(self.peak_depth, len(self.queue))
+        self.wakeup.set()
+        return True
+
+    async def run_writer(self, on_error):
+        while not self.closed:
+            if not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            enqueued_at, _, text = self.queue.popleft()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), self.send_timeout)
+            except Exception as e:
+                await on_error(self, e)
+                return
+            self.sent += 1
+            self.lags.append(time.monotonic() - enqueued_at)
+
+    def get_stats(self) -> dict:
+        lags = np.array(self.lags) * 1000 if self.lags else None
+        oldest = round((time.monotonic() - self.queue[0][0]) * 1000, 2) if self.queue else 0.0
+        return {
+            "id": self.id,
+            "client_type": self.client_type,
+            "connected_at": self.connected_at.isoformat(),
+            "overflow_policy": self.overflow_policy,
+            "queue_depth": len(self.queue),
+            "max_queue": self.max_queue,
+            "peak_depth": self.peak_depth,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            # Retraso actual: antigüedad del mensaje más viejo sin enviar
+            "oldest_pending_ms": oldest,
+            "lag_ms": {
+                "last": round(float(lags[-1]), 2),
+                "p95": round(float(np.percentile(lags, 95)), 2),
+                "max": round(float(lags.max()), 2)
+            } if lags is not None else None
+        }
+
+class DeltaTopic:
+    """Último snapshot de un tema y sus patches recientes numerados por secuencia (modo delta)"""
+
+    def __init__(self, history: int = 32, volatile_paths: Tuple[str, ...] = ()):
+        self.seq = 0
+        self.snapshot: Optional[dict] = None
+        self.volatile_paths = volatile_paths
+        # Últimos valores de los campos volátiles (JSON Pointer -> valor)
+        self.volatile: Dict[str, object] = {}
+        # (seq, patch) que lleva del snapshot seq - 1 al seq
+        self.patches: Deque[Tuple[int, List[dict]]] = deque(maxlen=history)
+        self.subscribers: Set[WebSocket] = set()
+        self.updates = 0
+        self.unchanged = 0
+        self.full_bytes_sent = 0
+        self.patch_bytes_sent = 0
+
+    def update(self, data: dict) -> Optional[List[dict]]:
+        """Nuevo estado del tema; devuelve el patch (None si no cambió nada)"""
+        # Normalizar a JSON (fechas, numpy...) y desacoplar del dict del llamador
+        document = loads(dumps(data))
+        self.volatile = self._extract_volatile(document)
+        patch = json_patch.diff(self.snapshot, document) if self.snapshot is not None else [
+            {"op": "replace", "path": "", "value": document}
+        ]
+        if not patch:
+            self.unchanged += 1
+            return None
+        self.seq += 1
+        self.snapshot = document
+        self.patches.append((self.seq, patch))
+        self.updates += 1
+        return patch
+
+    def _extract_volatile(self, document: dict) -> Dict[str, object]:
+        """Sacar del documento los campos volátiles presentes"""
+        volatile = {}
+        for path in self.volatile_paths:
+            parent_path, _, key = path.rpartition("/")
+            try:
+                parent = json_patch.get(document, parent_path)
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+            if isinstance(parent, dict) and key in parent:
+                volatile[path] = parent.pop(key)
+        return volatile
+
+    def since(self, seq: int) -> Optional[List[Tuple[int, List[dict]]]]:
+        """Patches posteriores a ``seq``; None si ya no están en el historial (hace falta snapshot)"""
+        if seq > self.seq or seq < 0:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.patches or self.patches[0][0] > seq + 1:
+            return None
+        return [(patch_seq, patch) for patch_seq, patch in self.patches if patch_seq > seq]
+
+    def get_stats(self) -> dict:
+        return {
+            "seq": self.seq,
+            "subscribers": len(self.subscribers),
+            "updates": self.updates,
+            "unchanged": self.unchanged,
+            "history": len(self.patches),
+            "full_bytes_equivalent": self.full_bytes_sent,
+            "patch_bytes_sent": self.patch_bytes_sent,
+            "bytes_saved_ratio": round(1 - self.patch_bytes_sent / self.full_bytes_sent, 3) if self.full_bytes_sent else None
+        }
+
 class WebSocketManager:
-    def __init__(self):
+    def __init__(self,
+                 max_queue: int = 256,
+                 overflow_policy: str = "drop_oldest",
+                 send_timeout: float = 10.0,
+                 delta_topics: Tuple[str, ...] = ("system_status",),
+                 delta_history: int = 32):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.send_timeout = send_timeout
+        # Cola de salida y escritor de cada WebSocket
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.overflow_disconnects = 0
+        # Temas que admiten suscripción en modo delta (snapshot + JSON Patch)
+        self.delta_topics: Dict[str, DeltaTopic] = {
+            topic: DeltaTopic(delta_history, DELTA_VOLATILE_PATHS.get(topic, ())) for topic in delta_topics
+        }
+        
         # Conexiones activas por tipo de cliente
         self.active_connections: Dict[str, List[WebSocket]] = {
             "flutter_app": [],    # Aplicación Flutter
@@ -34,22 +239,46 @@ class WebSocketManager:
             "device_status": []
         }
         
-    async def connect(self, websocket: WebSocket, client_type: str = "flutter_app"):
+    def _register(self, websocket: WebSocket, client_type: str,
+                  overflow_policy: Optional[str] = None, max_queue: Optional[int] = None) -> ClientConnection:
+        connection = ClientConnection(
+            websocket,
+            client_type,
+            max_queue or self.max_queue,
+            overflow_policy or self.overflow_policy,
+            self.send_timeout
+        )
+        self.connections[websocket] = connection
+        connection.writer = asyncio.create_task(connection.run_writer(self._on_send_error))
+        return connection
+
+    async def connect(self, websocket: WebSocket, client_type: str = "flutter_app",
+                      overflow_policy: Optional[str] = None, max_queue: Optional[int] = None):
         """Aceptar nueva conexión WebSocket"""
         await websocket.accept()
         
-        if client_type in self.active_connections:
-            self.active_connections[client_type].append(websocket)
-            logger.info(f"New WebSocket connection: {client_type}, total: {len(self.active_connections[client_type])}")
-            
-            # Enviar datos recientes al nuevo cliente
-            await self.send_recent_data_to_client(websocket)
-        else:
+        if overflow_policy not in (None, *OVERFLOW_POLICIES):
+            logger.warning(f"Unknown overflow policy {overflow_policy}, using {self.overflow_policy}")
+            overflow_policy = None
+        if client_type not in self.active_connections:
             logger.warning(f"Unknown client type: {client_type}")
-            self.active_connections["flutter_app"].append(websocket)
+            client_type = "flutter_app"
+        self._register(websocket, client_type, overflow_policy, max_queue)
+        self.active_connections[client_type].append(websocket)
+        logger.info(f"New WebSocket connection: {client_type}, total: {len(self.active_connections[client_type])}")
+        
+        # Enviar datos recientes al nuevo cliente
+        await self.send_recent_data_to_client(websocket)
     
     async def disconnect(self, websocket: WebSocket, client_type: str = "flutter_app"):
         """Desconectar WebSocket"""
+        connection = self.connections.pop(websocket, None)
+        if connection is not None:
+            connection.closed = True
+            connection.wakeup.set()
+            if connection.writer is not None and connection.writer is not asyncio.current_task():
+                connection.writer.cancel()
+            client_type = connection.client_type
         if client_type in self.active_connections:
             if websocket in self.active_connections[client_type]:
                 self.active_connections[client_type].remove(websocket)
@@ -58,49 +287,139 @@ class WebSocketManager:
         # Remover de todas las suscripciones
         for event_type in self.event_subscriptions:
             self.event_subscriptions[event_type].discard(websocket)
+        for topic in self.delta_topics.values():
+            topic.subscribers.discard(websocket)
     
-    async def subscribe_to_event(self, websocket: WebSocket, event_type: str):
-        """Suscribir WebSocket a eventos específicos"""
+    async def _on_send_error(self, connection: ClientConnection, error: Exception):
+        """El escritor no pudo enviar (cliente caído o send bloqueado más de send_timeout)"""
+        if isinstance(error, asyncio.TimeoutError):
+            logger.warning(f"WebSocket {connection.id} send timed out after {connection.send_timeout}s, disconnecting")
+            await self._close(connection, reason="send timeout")
+        elif not isinstance(error, WebSocketDisconnect):
+            logger.error(f"Error sending to websocket {connection.id}: {error}")
+        await self.disconnect(connection.websocket, connection.client_type)
+    
+    async def _close(self, connection: ClientConnection, reason: str):
+        try:
+            await asyncio.wait_for(connection.websocket.close(code=OVERFLOW_CLOSE_CODE, reason=reason), 1.0)
+        except Exception:
+            pass
+    
+    async def _overflow_disconnect(self, connection: ClientConnection):
+        self.overflow_disconnects += 1
+        logger.warning(f"WebSocket {connection.id} send queue overflow ({connection.max_queue}), disconnecting")
+        await self.disconnect(connection.websocket, connection.client_type)
+        await self._close(connection, reason="send queue overflow")
+    
+    def _enqueue(self, websocket: WebSocket, text: str, key: Optional[str] = None) -> bool:
+        """Encolar un mensaje ya serializado sin esperar al envío (O(1))"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            # WebSocket aceptado fuera de connect() (p. ej. suscripción directa)
+            connection = self._register(websocket, "unregistered")
+        if connection.enqueue(text, key):
+            return True
+        if connection.overflow_policy == "disconnect" and not connection.closed:
+            connection.closed = True
+            asyncio.create_task(self._overflow_disconnect(connection))
+        return False
+    
+    async def subscribe_to_event(self, websocket: WebSocket, event_type: str, mode: str = "full"):
+        """Suscribir WebSocket a eventos específicos (mode="delta": snapshot y después sólo JSON Patch)"""
         if event_type in self.event_subscriptions:
-            self.event_subscriptions[event_type].add(websocket)
-            logger.info(f"WebSocket subscribed to {event_type}, subscribers: {len(self.event_subscriptions[event_type])}")
+            delta = mode == "delta" and event_type in self.delta_topics
+            if delta:
+                self.event_subscriptions[event_type].discard(websocket)
+                self.delta_topics[event_type].subscribers.add(websocket)
+            else:
+                self.event_subscriptions[event_type].add(websocket)
+                if event_type in self.delta_topics:
+                    self.delta_topics[event_type].subscribers.discard(websocket)
+            logger.info(f"WebSocket subscribed to {event_type} ({'delta' if delta else 'full'}), "
+                        f"subscribers: {len(self.event_subscriptions[event_type])}")
             
             # Enviar confirmación de suscripción
             await self.send_to_websocket(websocket, {
                 "type": "subscription_confirmed",
                 "event_type": event_type,
+                "mode": "delta" if delta else "full",
                 "timestamp": datetime.now().isoformat()
             })
+            if delta:
+                self._send_snapshot(websocket, event_type)
     
     async def unsubscribe_from_event(self, websocket: WebSocket, event_type: str):
         """Desuscribir WebSocket de eventos específicos"""
         if event_type in self.event_subscriptions:
             self.event_subscriptions[event_type].discard(websocket)
+            if event_type in self.delta_topics:
+                self.delta_topics[event_type].subscribers.discard(websocket)
             logger.info(f"WebSocket unsubscribed from {event_type}")
     
+    def _send_snapshot(self, websocket: WebSocket, event_type: str):
+        topic = self.delta_topics[event_type]
+        self._enqueue(websocket, dumps_text({
+            "type": "snapshot",
+            "event_type": event_type,
+            "seq": topic.seq,
+            "timestamp": datetime.now().isoformat(),
+            "data": topic.snapshot,
+            "volatile": topic.volatile
+        }))
+    
+    async def resync(self, websocket: WebSocket, event_type: str, seq: Optional[int] = None):
+        """Reenviar un tema delta: los patches desde ``seq`` si siguen en el historial, si no un snapshot"""
+        topic = self.delta_topics.get(event_type)
+        if topic is None:
+            return
+        patches = topic.since(seq) if seq is not None else None
+        if patches is None:
+            self._send_snapshot(websocket, event_type)
+            return
+        for patch_seq, patch in patches:
+            self._enqueue(websocket, dumps_text({
+                "type": "patch",
+                "event_type": event_type,
+                "seq": patch_seq,
+                "base_seq": patch_seq - 1,
+                "patch": patch,
+                "volatile": topic.volatile
+            }))
+    
+    def _broadcast_delta(self, event_type: str, data: dict, full_text: str):
+        topic = self.delta_topics[event_type]
+        patch = topic.update(data)
+        # Lo que habrían recibido en modo completo (también cuando no cambia nada y no se envía)
+        topic.full_bytes_sent += len(full_text) * len(topic.subscribers)
+        if patch is None or not topic.subscribers:
+            return
+        # Los patches no se coalescen: si se pierde uno, el cliente ve el salto en base_seq y pide resync
+        text = dumps_text({
+            "type": "patch",
+            "event_type": event_type,
+            "seq": topic.seq,
+            "base_seq": topic.seq - 1,
+            "timestamp": datetime.now().isoformat(),
+            "patch": patch,
+            "volatile": topic.volatile
+        })
+        for websocket in list(topic.subscribers):
+            self._enqueue(websocket, text)
+        topic.patch_bytes_sent += len(text) * len(topic.subscribers)
+    
     async def send_to_websocket(self, websocket: WebSocket, data: dict):
-        """Enviar datos a un WebSocket específico"""
-        try:
-            await websocket.send_text(json.dumps(data))
-        except Exception as e:
-            logger.error(f"Error sending to websocket: {e}")
+        """Enviar datos a un WebSocket específico (por su cola de salida, en orden)"""
+        self._enqueue(websocket, dumps_text(data))
     
     async def broadcast_to_type(self, client_type: str, data: dict):
         """Enviar datos a todos los clientes de un tipo específico"""
         if client_type not in self.active_connections:
             return
         
-        disconnected = []
-        for websocket in self.active_connections[client_type]:
-            try:
-                await websocket.send_text(json.dumps(data))
-            except Exception as e:
-                logger.error(f"Error broadcasting to {client_type}: {e}")
-                disconnected.append(websocket)
-        
-        # Limpiar conexiones desconectadas
-        for websocket in disconnected:
-            self.active_connections[client_type].remove(websocket)
+        # Serializar una sola vez; encolar es O(1) y no espera a ningún cliente
+        text = dumps_text(data)
+        for websocket in list(self.active_connections[client_type]):
+            self._enqueue(websocket, text, key=coalesce_key(data.get("type"), data))
     
     async def broadcast_to_event_subscribers(self, event_type: str, data: dict):
         """Enviar datos a todos los suscriptores de un evento específico"""
@@ -114,16 +433,13 @@ class WebSocketManager:
             "data": data
         }
         
-        disconnected = set()
-        for websocket in self.event_subscriptions[event_type]:
-            try:
-                await websocket.send_text(json.dumps(event_data))
-            except Exception as e:
-                logger.error(f"Error broadcasting event {event_type}: {e}")
-                disconnected.add(websocket)
-        
-        # Limpiar conexiones desconectadas
-        self.event_subscriptions[event_type] -= disconnected
+        # Una serialización por evento, compartida por todas las colas de salida
+        text = dumps_text(event_data)
+        key = coalesce_key(event_type, data)
+        for websocket in list(self.event_subscriptions[event_type]):
+            self._enqueue(websocket, text, key=key)
+        if event_type in self.delta_topics:
+            self._broadcast_delta(event_type, data, text)
         
         # Guardar en historial reciente
         await self.save_to_recent_data(event_type, data)
@@ -189,7 +505,7 @@ class WebSocketManager:
         await self.broadcast_to_event_subscribers("device_status", device_status)
     
     async def broadcast_camera_frame(self, frame_data: dict):
-        """Enviar frame de cámara a suscriptores (base64 encoded)"""
+        """Enviar frame de cámara a suscriptores (base64 en JSON; el stream en vivo va en binario por /ws/camera_stream)"""
         await self.broadcast_to_event_subscribers("camera_stream", frame_data)
     
     def get_connection_stats(self) -> dict:
@@ -204,9 +520,19 @@ class WebSocketManager:
                 event_type: len(subscribers)
                 for event_type, subscribers in self.event_subscriptions.items()
             },
+            "delta_topics": {topic_name: topic.get_stats() for topic_name, topic in self.delta_topics.items()},
             "recent_data_counts": {
                 data_type: len(data) if isinstance(data, list) else (1 if data else 0)
                 for data_type, data in self.recent_data.items()
+            },
+            "send_queues": {
+                "max_queue": self.max_queue,
+                "overflow_policy": self.overflow_policy,
+                "queued": sum(len(connection.queue) for connection in self.connections.values()),
+                "dropped": sum(connection.dropped for connection in self.connections.values()),
+                "coalesced": sum(connection.coalesced for connection in self.connections.values()),
+                "overflow_disconnects": self.overflow_disconnects,
+                "connections": [connection.get_stats() for connection in self.connections.values()]
             }
         }
         return stats
@@ -219,7 +545,13 @@ class WebSocketManager:
             if message_type == "subscribe":
                 event_type = message.get("event_type")
                 if event_type:
-                    await self.subscribe_to_event(websocket, event_type)
+                    await self.subscribe_to_event(websocket, event_type, message.get("mode", "full"))
+            
+            elif message_type == "resync":
+                # {"type": "resync", "event_type": "system_status", "seq": <último seq aplicado>} (sin seq: snapshot)
+                event_type = message.get("event_type")
+                if event_type:
+                    await self.resync(websocket, event_type, message.get("seq"))
             
             elif message_type == "unsubscribe":
                 event_type = message.get("event_type")
@@ -268,4 +600,9 @@ class WebSocketManager:
             logger.error(f"Error handling client message: {e}")
 
 # Instancia global del administrador WebSocket
-websocket_manager = WebSocketManager()
\ No newline at end of file
+websocket_manager = WebSocketManager(
+    max_queue=settings.WS_SEND_QUEUE_SIZE,
+    overflow_policy=settings.WS_OVERFLOW_POLICY,
+    send_timeout=settings.WS_MESSAGE_TIMEOUT,
+    delta_history=settings.WS_DELTA_HISTORY
+)
\ No newline at end of file
@@ -0,0 +1,794 @@
+#!/usr/bin/env python3
+"""
+UpCycle Pro Performance Benchmarks
+==================================
+
+Micro-benchmarks for the classification hot path of the backend API.
+
+Usage:
+    python benchmark.py serving [--model PATH] [--iterations N]
+    python benchmark.py backends [PATH ...] [--iterations N]
+    python benchmark.py preprocess [--iterations N] [--quality Q]
+    python benchmark.py startup [--runs N] [--timeout S]
+    python benchmark.py ingestion [--mode both|legacy|pooled] [--iterations N]
+    python benchmark.py sensors [--devices N] [--readings N]
+    python benchmark.py timeseries [--days N] [--devices N] [--interval S]
+    python benchmark.py commands [--commands N] [--poll-interval S]
+    python benchmark.py websocket [--clients N] [--broadcasts N]
+    python benchmark.py camera [--consumers N] [--duration S]
+    python benchmark.py delta [--broadcasts N] [--change-every N]
+
+Examples:
+    python benchmark.py serving                                  # Untrained MobileNetV2 head
+    python benchmark.py serving --model ../ai_client/CNN/best_model.keras
+    python benchmark.py backends                                 # config.yaml model.path
+    python benchmark.py backends api/cnn_model model.tflite model.keras
+    python benchmark.py preprocess                               # UXGA/SVGA synthetic frames
+    python benchmark.py startup --runs 3                         # Lazy vs eager model loading
+    python benchmark.py ingestion                                # /predict upload copies, RSS
+    python benchmark.py sensors --devices 48                     # Sensor history list vs ring buffers
+    python benchmark.py timeseries --days 21                     # SQLite inserts and history queries
+    python benchmark.py commands --poll-interval 5               # Sensor-poll piggyback vs push delivery
+    python benchmark.py websocket --clients 100                  # Per-client json.dumps vs encode-once fan-out
+    python benchmark.py camera --consumers 4                     # ESP32-CAM requests: direct /capture vs frame hub
+    python benchmark.py delta --change-every 20                  # system_status bytes: full documents vs JSON Patch
+"""
+
+import argparse
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+# Add the API directory to the Python path
+api_dir = Path(__file__).parent / "api"
+sys.path.insert(0, str(api_dir))
+
+
+def percentiles(samples_ms):
+    """Format p50/p95/p99 of a list of latencies in milliseconds"""
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return f"p50={p50:8.2f}ms  p95={p95:8.2f}ms  p99={p99:8.2f}ms"
+
+
+def time_calls(func, batch, iterations):
+    """Time repeated calls of func(batch) and return latencies in milliseconds"""
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func(batch)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def load_benchmark_model(model_path):
+    """Load a Keras model, or build the MobileNetV2 head without downloading weights"""
+    import tensorflow as tf
+
+    if model_path:
+        return tf.keras.models.load_model(model_path)
+
+    base_model = tf.keras.applications.MobileNetV2(weights=None, include_top=False, input_shape=(224, 224, 3))
+    return tf.keras.Sequential([
+        base_model,
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(128, activation="relu"),
+        tf.keras.layers.Dense(3, activation="softmax")
+    ])
+
+
+def bench_serving(args):
+    """Compare model.predict against the warm tf.function serving path"""
+    from services.model_serving import ServingModel
+
+    model = load_benchmark_model(args.model)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+
+    started = time.perf_counter()
+    serving = ServingModel(model, batch_sizes=batch_sizes)
+    trace_ms = (time.perf_counter() - started) * 1000
+    serving.warmup()
+    print(f"🔧 Traced {len(batch_sizes)} signatures in {trace_ms:.1f}ms")
+    print()
+
+    for size in batch_sizes:
+        batch = np.random.rand(size, 224, 224, 3).astype("float32")
+        model.predict(batch, verbose=0)  # Warm-up del camino actual
+
+        keras_ms = time_calls(lambda x: model.predict(x, verbose=0), batch, args.iterations)
+        serving_ms = time_calls(serving.predict, batch, args.iterations)
+
+        speedup = np.median(keras_ms) / np.median(serving_ms)
+        print(f"📦 batch={size:<3d} model.predict  {percentiles(keras_ms)}")
+        print(f"   batch={size:<3d} tf.function    {percentiles(serving_ms)}  ({speedup:.2f}x)")
+
+
+def bench_backends(args):
+    """Measure load time and per-image latency of each model backend"""
+    from config import get_model_artifact_path
+    from services.model_backends import detect_backend
+
+    paths = args.paths or [get_model_artifact_path()]
+    batch = np.random.rand(args.batch_size, 224, 224, 3).astype("float32")
+
+    for path in paths:
+        try:
+            backend = detect_backend(path)(path).load()
+            backend.warmup()
+        except Exception as e:
+            print(f"❌ {path}: {e}")
+            continue
+
+        per_image_ms = [
+            sample / args.batch_size
+            for sample in time_calls(backend.predict, batch, args.iterations)
+        ]
+        print(f"🤖 {backend.name:<12s} load={backend.load_seconds * 1000:8.1f}ms  "
+              f"warmup={backend.warmup_seconds * 1000:8.1f}ms  per-image {percentiles(per_image_ms)}")
+        print(f"   {path}")
+
+
+def synthetic_jpeg(width, height, quality):
+    """Build a camera-like JPEG frame (smooth gradients plus sensor noise)"""
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    frame = np.stack([x * 255 / width, y * 255 / height, (x + y) * 127 / (width + height)], axis=-1)
+    frame += rng.normal(0, 8, frame.shape)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(frame, 0, 255).astype("uint8")).save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def legacy_preprocess(image_data):
+    """Previous path: full-resolution decode, default resize, two float copies"""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_data))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image = image.resize((224, 224))
+    img_array = np.array(image)
+    img_array = img_array.astype("float32") / 255.0
+    return np.expand_dims(img_array, axis=0)
+
+
+def bench_preprocess(args):
+    """Compare the legacy preprocessing path with the draft-mode fast path"""
+    from services.preprocessing import preprocess_image_bytes
+
+    buffer = np.empty((224, 224, 3), dtype=np.float32)
+    for name, (width, height) in {"UXGA": (1600, 1200), "SVGA": (800, 600)}.items():
+        image_data = synthetic_jpeg(width, height, args.quality)
+        legacy_ms = time_calls(legacy_preprocess, image_data, args.iterations)
+        fast_ms = time_calls(lambda data: preprocess_image_bytes(data, buffer), image_data, args.iterations)
+
+        difference = np.abs(legacy_preprocess(image_data)[0] - preprocess_image_bytes(image_data)).mean()
+        speedup = np.median(legacy_ms) / np.median(fast_ms)
+        print(f"🖼️  {name} {width}x{height} ({len(image_data) / 1024:.0f} KB)")
+        print(f"   legacy      {percentiles(legacy_ms)}")
+        print(f"   fast path   {percentiles(fast_ms)}  ({speedup:.2f}x, mean |diff|={difference:.4f})")
+
+
+def legacy_ingest(upload):
+    """Original /predict ingestion: read() -> BytesIO -> np.array -> astype -> expand_dims"""
+    from PIL import Image
+
+    upload.file.seek(0)
+    image_data = upload.file.read()
+    image = Image.open(io.BytesIO(image_data))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image = image.resize((224, 224))
+    image_array = np.array(image)
+    image_array = image_array.astype("float32") / 255.0
+    return np.expand_dims(image_array, axis=0)
+
+
+async def pooled_ingest(upload):
+    """Pooled ingestion: upload buffer + memoryview decode into a pooled float32 tensor"""
+    from services.classifier import preprocess_many
+    from services.ingestion import ingest_upload, tensor_pool
+
+    tensors = tensor_pool.acquire_many(1)
+    try:
+        async with ingest_upload(upload) as image_data:
+            preprocess_many([image_data], tensors)
+    finally:
+        tensor_pool.release_many(tensors)
+
+
+def run_ingestion(mode, iterations, image_data):
+    """Ingest the same upload repeatedly and return (peak bytes per request, latencies ms)"""
+    import asyncio
+    import tempfile
+    import tracemalloc
+
+    from starlette.datastructures import UploadFile
+
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(image_data)
+    spooled.seek(0)
+    upload = UploadFile(file=spooled, size=len(image_data), filename="frame.jpg")
+
+    loop = asyncio.new_event_loop()
+    ingest = (lambda: legacy_ingest(upload)) if mode == "legacy" else (lambda: loop.run_until_complete(pooled_ingest(upload)))
+    ingest()  # llenar los pools antes de medir
+
+    tracemalloc.start()
+    peaks, latencies = [], []
+    for _ in range(iterations):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        ingest()
+        latencies.append((time.perf_counter() - started) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    loop.close()
+    return peaks, latencies
+
+
+def bench_ingestion(args):
+    """Compare allocations and peak RSS of the legacy and pooled /predict ingestion"""
+    import resource
+
+    if args.mode == "both":
+        # Un proceso por modo para que el pico de RSS de uno no contamine al otro
+        for mode in ("legacy", "pooled"):
+            subprocess.run(
+                [sys.executable, __file__, "ingestion", "--mode", mode,
+                 "--iterations", str(args.iterations), "--quality", str(args.quality)],
+                check=True
+            )
+        return
+
+    image_data = synthetic_jpeg(1600, 1200, args.quality)
+    rss_before_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    peaks, latencies = run_ingestion(args.mode, args.iterations, image_data)
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"📥 {args.mode:<6s} UXGA upload ({len(image_data) / 1024:.0f} KB), {args.iterations} requests")
+    print(f"   latency         {percentiles(latencies)}")
+    print(f"   traced peak     {np.median(peaks) / 1024:8.1f} KB/request (numpy + Python objects)")
+    print(f"   max RSS         {max_rss_mb:8.1f} MB (+{max_rss_mb - rss_before_mb:.1f} MB while ingesting)")
+
+
+def free_port():
+    """Pick an unused local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_startup(lazy, timeout):
+    """Start uvicorn and time the first /health response and model readiness"""
+    port = free_port()
+    env = dict(os.environ, MODEL_LAZY_LOAD=str(lazy).lower())
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=api_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    first_response = ready = None
+    try:
+        while time.perf_counter() - started < timeout and ready is None:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    health = json.load(response)
+            except OSError:
+                time.sleep(0.01)
+                continue
+            elapsed = time.perf_counter() - started
+            if first_response is None:
+                first_response = elapsed
+            if health.get("readiness") in ("ready", "failed"):
+                ready = elapsed
+            else:
+                time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait()
+    return first_response, ready
+
+
+def bench_startup(args):
+    """Measure process start to first HTTP response, lazy vs eager model loading"""
+    for lazy in (True, False):
+        first, ready = [], []
+        for _ in range(args.runs):
+            first_response, model_ready = measure_startup(lazy, args.timeout)
+            if first_response is not None:
+                first.append(first_response * 1000)
+            if model_ready is not None:
+                ready.append(model_ready * 1000)
+        print(f"🚀 {'lazy ' if lazy else 'eager'} model loading ({args.runs} runs)")
+        print(f"   first response  {percentiles(first) if first else 'timeout'}")
+        print(f"   model ready     {percentiles(ready) if ready else 'timeout'}")
+
+
+def bench_sensors(args):
+    """Compare the global sensor_history list with the per-device ring buffer store"""
+    from datetime import datetime
+    from routes.esp32_integration import ESP32SensorData
+    from services.sensor_store import SensorHistoryStore
+
+    rng = np.random.default_rng(0)
+    readings = [
+        ESP32SensorData(
+            device_id=f"control-{i % args.devices:02d}",
+            timestamp=datetime.now(),
+            pir1=bool(rng.integers(2)), pir2=bool(rng.integers(2)), pir3=bool(rng.integers(2)),
+            weight1=float(rng.random()), weight2=float(rng.random()), weight3=float(rng.random()),
+            conveyor_active=True
+        )
+        for i in range(args.readings)
+    ]
+
+    # Misma historia retenida por dispositivo en ambos casos
+    legacy_capacity = args.capacity * args.devices
+
+    def legacy_insert(history, reading):
+        history.append(reading.dict())
+        if len(history) > legacy_capacity:
+            history.pop(0)
+
+    def legacy_query(history, device_id):
+        return [record for record in history if record["device_id"] == device_id][-args.limit:]
+
+    store = SensorHistoryStore(capacity_per_device=args.capacity, max_devices=args.devices)
+    history = []
+    for name, insert, query in (
+        ("list.pop(0)", lambda r: legacy_insert(history, r), lambda d: legacy_query(history, d)),
+        ("ring buffer", store.append, lambda d: store.latest(d, args.limit))
+    ):
+        insert_ms = []
+        query_ms = []
+        for i, reading in enumerate(readings):
+            started = time.perf_counter()
+            insert(reading)
+            insert_ms.append((time.perf_counter() - started) * 1000)
+            if i % args.devices == 0:
+                started = time.perf_counter()
+                query(reading.device_id)
+                query_ms.append((time.perf_counter() - started) * 1000)
+        print(f"📟 {name} ({args.devices} devices, {args.readings} readings, limit={args.limit})")
+        print(f"   insert  {percentiles(insert_ms)}")
+        print(f"   query   {percentiles(query_ms)}")
+    print(f"   ring buffer columns: {store.get_stats()['column_bytes'] / 1024:.0f} KB "
+          f"for {store.get_stats()['stored_readings']} readings")
+
+
+def bench_timeseries(args):
+    """Batched SQLite inserts and range/bucket queries over weeks of sensor readings"""
+    import tempfile
+    from datetime import datetime
+    from types import SimpleNamespace
+    from services.timeseries_store import TimeSeriesStore
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = TimeSeriesStore(
+            os.path.join(folder, "bench.db"), batch_size=5000, max_pending=10 ** 8, retention_days=args.days + 62
+        )
+        store.open()
+        end = time.time()
+        start = end - args.days * 86400
+        started = time.perf_counter()
+        for device in range(args.devices):
+            for offset in np.arange(0, args.days * 86400, args.interval):
+                store.add_sensor_reading(SimpleNamespace(
+                    device_id=f"control-{device:02d}", timestamp=datetime.fromtimestamp(start + offset),
+                    pir1=bool(offset % 7 == 0), pir2=None, pir3=None,
+                    weight1=float(offset % 100) / 10, weight2=None, weight3=None,
+                    conveyor_active=True, servo_positions=None
+                ))
+        store.flush(timeout=3600)
+        elapsed = time.perf_counter() - started
+        rows = store.inserted["sensor_readings"]
+        stats = store.get_stats()
+        print(f"🗄️  {rows} readings ({args.devices} devices, {args.days} days every {args.interval}s) "
+              f"in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s), {stats['size_bytes'] / 2 ** 20:.0f} MB, "
+              f"{len(stats['partitions']['sensor_readings'])} monthly partitions")
+
+        window_start = datetime.fromtimestamp(start + (args.days // 4) * 86400)
+        window_end = datetime.fromtimestamp(end - (args.days // 4) * 86400)
+        range_ms = time_calls(
+            lambda _: store.query_sensor_readings("control-00", window_start, window_end, args.limit), None, args.iterations
+        )
+        bucket_ms = time_calls(
+            lambda _: store.query_sensor_buckets("control-00", 3600, datetime.fromtimestamp(start)), None, args.iterations
+        )
+        print(f"   latest {args.limit} in range   {percentiles(range_ms)}")
+        print(f"   hourly buckets ({args.days}d) {percentiles(bucket_ms)}")
+        store.close()
+
+
+def bench_commands(args):
+    """Classify-to-servo latency: commands piggybacked on sensor polls vs woken push delivery"""
+    import asyncio
+    from services.command_queue import CommandQueue
+
+    async def run(push):
+        queue = CommandQueue(max_depth=args.commands + 1)
+        rng = np.random.default_rng(0)
+        stop = asyncio.Event()
+
+        async def device():
+            while not stop.is_set():
+                if push:
+                    ready = await queue.wait("control-00", 1.0)
+                else:
+                    await asyncio.sleep(args.poll_interval)
+                    ready = True
+                commands = queue.drain("control-00", track_ack=True) if ready else []
+                # El servo confirma tras moverse (se simula un ack inmediato)
+                queue.ack("control-00", [command["id"] for command in commands])
+
+        task = asyncio.create_task(device())
+        for _ in range(args.commands):
+            await asyncio.sleep(float(rng.uniform(0, args.gap * 2)))
+            queue.enqueue("control-00", "move_servo", {"position": 45}, classified_at=time.time())
+        await asyncio.sleep(args.poll_interval + 0.1)
+        stop.set()
+        await task
+        return queue.get_stats()["classify_to_servo_ms"]
+
+    for name, push in (("sensor poll", False), ("push (wait)", True)):
+        latency = asyncio.run(run(push))
+        print(f"🦾 {name:<12} {latency['count']} commands  "
+              f"p50={latency['p50']:8.2f}ms  p95={latency['p95']:8.2f}ms  p99={latency['p99']:8.2f}ms")
+
+
+def system_metrics_payload():
+    """system_status event with the same shape as periodic_system_status / get_system_metrics"""
+    from datetime import datetime
+    now = datetime.now()
+    devices = {}
+    for kind, base in (("esp32_cam", 50), ("esp32_control", 60)):
+        ips = [f"192.168.1.{base + i}" for i in range(4)]
+        devices[kind] = {
+            "discovered": len(ips),
+            "ips": ips,
+            "status": [
+                {
+                    "ip": ip,
+                    "status": "online",
+                    # Respuesta de /status del firmware: uptime y heap cambian en cada sondeo
+                    "info": {
+                        "device_id": f"{kind}-{i:02d}",
+                        "firmware": "2.1.0",
+                        "uptime": 3600 + i * 60,
+                        "free_heap": 180000 - i * 1024,
+                        "wifi_rssi": -55 - i,
+                        "ip": ip
+                    }
+                }
+                for i, ip in enumerate(ips)
+            ]
+        }
+    return {
+        "system_metrics": {
+            "timestamp": now.isoformat(),
+            "devices": devices,
+            "connectivity": {
+                "total_devices": 8,
+                "online_devices": 8,
+                "last_discovery": now.isoformat()
+            }
+        },
+        "model_loaded": True,
+        "api_version": "2.0.0",
+        "timestamp": now.isoformat()
+    }
+
+
+def bench_websocket(args):
+    """Fan-out of one system_status event: sequential json.dumps per client vs WebSocketManager encode-once"""
+    import asyncio
+    import json
+    from services.serialization import dumps, orjson
+    from websocket_manager import WebSocketManager
+
+    class NullWebSocket:
+        async def accept(self):
+            pass
+
+        async def send_text(self, text):
+            await asyncio.sleep(0)
+
+    payload = system_metrics_payload()
+    event = {"event_type": "system_status", "timestamp": payload["timestamp"], "data": payload}
+
+    encoder = "orjson" if orjson is not None else "json (orjson not installed)"
+    json_ms = time_calls(lambda data: [json.dumps(data, default=str) for _ in range(args.clients)], event, args.broadcasts)
+    once_ms = time_calls(dumps, event, args.broadcasts)
+    print(f"📡 Serialization for {args.clients} clients ({len(dumps(event))} bytes per event)")
+    print(f"   json.dumps x{args.clients:<5d}  {percentiles(json_ms)}")
+    print(f"   {encoder} x1  {percentiles(once_ms)}")
+
+    async def legacy_fanout(clients):
+        samples = []
+        for _ in range(args.broadcasts):
+            started = time.perf_counter()
+            for websocket in clients:
+                await websocket.send_text(json.dumps(event, default=str))
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples
+
+    async def queued_fanout():
+        manager = WebSocketManager(max_queue=args.broadcasts + 10)
+        for _ in range(args.clients):
+            websocket = NullWebSocket()
+            await manager.connect(websocket, "flutter_app")
+            await manager.subscribe_to_event(websocket, "system_status")
+        await asyncio.sleep(0.01)
+        broadcast_ms = []
+        delivered_ms = []
+        for _ in range(args.broadcasts):
+            started = time.perf_counter()
+            await manager.broadcast_system_status(payload)
+            broadcast_ms.append((time.perf_counter() - started) * 1000)
+            while any(connection.queue for connection in manager.connections.values()):
+                await asyncio.sleep(0)
+            delivered_ms.append((time.perf_counter() - started) * 1000)
+        for websocket in list(manager.connections):
+            await manager.disconnect(websocket)
+        return broadcast_ms, delivered_ms
+
+    legacy_ms = asyncio.run(legacy_fanout([NullWebSocket() for _ in range(args.clients)]))
+    broadcast_ms, delivered_ms = asyncio.run(queued_fanout())
+    print(f"📣 Broadcast to {args.clients} clients")
+    print(f"   sequential send_text     {percentiles(legacy_ms)}")
+    print(f"   encode-once enqueue      {percentiles(broadcast_ms)}")
+    print(f"   encode-once delivered    {percentiles(delivered_ms)}")
+
+
+def bench_camera(args):
+    """ESP32-CAM request rate with consumers hitting /capture directly vs reading the shared frame hub"""
+    import asyncio
+    import logging
+    import aiohttp
+    from aiohttp import web
+    from services.camera_hub import CameraHub
+
+    # Los reintentos del stream en el modo sin /stream son esperados
+    logging.getLogger("services.camera_hub").setLevel(logging.ERROR)
+
+    frame = synthetic_jpeg(800, 600, 80)
+    boundary = b"123456789000000000000987654321"
+
+    async def run(mode):
+        hits = {"capture": 0, "stream": 0}
+        # El ESP32 atiende las peticiones de una en una
+        device_lock = asyncio.Lock()
+
+        async def capture(request):
+            hits["capture"] += 1
+            async with device_lock:
+                await asyncio.sleep(args.capture_ms / 1000)
+                return web.Response(body=frame, content_type="image/jpeg")
+
+        async def stream(request):
+            hits["stream"] += 1
+            response = web.StreamResponse(
+                headers={"Content-Type": "multipart/x-mixed-replace;boundary=" + boundary.decode()}
+            )
+            await response.prepare(request)
+            try:
+                while True:
+                    await response.write(
+                        b"\r\n--" + boundary + b"\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % len(frame) + frame
+                    )
+                    await asyncio.sleep(1 / args.camera_fps)
+            except ConnectionError:
+                return response
+
+        app = web.Application()
+        app.router.add_get("/capture", capture)
+        if mode == "hub (stream)":
+            app.router.add_get("/stream", stream)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        port = free_port()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        camera = f"127.0.0.1:{port}"
+
+        hub = CameraHub(max_age=args.max_age, idle_seconds=1.0)
+        hub.feed(camera).url = f"http://{camera}/stream"
+        latencies = []
+        deadline = time.monotonic() + args.duration
+
+        async def consumer(session):
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                if mode == "direct /capture":
+                    async with session.get(f"http://{camera}/capture") as response:
+                        await response.read()
+                else:
+                    await hub.get_frame(camera)
+                latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(args.interval)
+
+        async with aiohttp.ClientSession() as session:
+            await asyncio.gather(*(consumer(session) for _ in range(args.consumers)))
+        hub.close()
+        await runner.cleanup()
+        return hits, latencies
+
+    for mode in ("direct /capture", "hub (stream)", "hub (/capture)"):
+        hits, latencies = asyncio.run(run(mode))
+        requests = hits["capture"] + hits["stream"]
+        print(f"📷 {mode:<16} {args.consumers} consumers x {len(latencies) // args.consumers} reads: "
+              f"{requests / args.duration:5.2f} device req/s ({hits['capture']} capture, {hits['stream']} stream)")
+        print(f"   read latency     {percentiles(latencies)}")
+
+
+def bench_delta(args):
+    """Bytes per system_status subscriber: full document every broadcast vs snapshot + JSON Patch"""
+    import asyncio
+    import json
+    from datetime import datetime
+    from services import json_patch
+    from websocket_manager import WebSocketManager
+
+    class RecordingWebSocket:
+        def __init__(self):
+            self.messages = []
+
+        async def accept(self):
+            pass
+
+        async def send_text(self, text):
+            self.messages.append(text)
+
+    async def run():
+        manager = WebSocketManager(max_queue=args.broadcasts + 10)
+        full, delta = RecordingWebSocket(), RecordingWebSocket()
+        for websocket, mode in ((full, "full"), (delta, "delta")):
+            await manager.connect(websocket, "flutter_app")
+            await manager.subscribe_to_event(websocket, "system_status", mode)
+        await asyncio.sleep(0.01)
+        full.messages.clear()
+        delta.messages.clear()
+
+        payload = system_metrics_payload()
+        metrics = payload["system_metrics"]
+        for i in range(args.broadcasts):
+            # Como en producción: marcas de tiempo y uptime/heap de cada dispositivo cambian en cada envío;
+            # cada change_every envíos un dispositivo se cae o vuelve
+            payload["timestamp"] = metrics["timestamp"] = metrics["connectivity"]["last_discovery"] = datetime.now().isoformat()
+            for device in metrics["devices"].values():
+                for entry in device["status"]:
+                    if "info" in entry:
+                        entry["info"]["uptime"] += 30
+                        entry["info"]["free_heap"] += (-512, 256, 0)[(i + entry["info"]["uptime"]) % 3]
+            if i % args.change_every == args.change_every - 1:
+                entry = metrics["devices"]["esp32_control"]["status"][-1]
+                if entry["status"] == "online":
+                    entry.update(status="offline", error="Cannot connect to host")
+                    entry.pop("info")
+                    metrics["connectivity"]["online_devices"] -= 1
+                else:
+                    entry.pop("error")
+                    entry.update(status="online", info={"uptime": 0, "free_heap": 180000})
+                    metrics["connectivity"]["online_devices"] += 1
+            await manager.broadcast_system_status(payload)
+            await asyncio.sleep(0)
+        while any(connection.queue for connection in manager.connections.values()):
+            await asyncio.sleep(0.001)
+
+        # El cliente delta reconstruye exactamente el último documento
+        document = None
+        for text in delta.messages:
+            message = json.loads(text)
+            document = message["data"] if message["type"] == "snapshot" else json_patch.apply(document, message["patch"])
+            volatile = message["volatile"]
+        # Los campos volátiles llegan en el sobre de cada mensaje
+        for path, value in volatile.items():
+            parent, _, key = path.rpartition("/")
+            json_patch.get(document, parent)[key] = value
+        assert document == json.loads(full.messages[-1])["data"], "delta client diverged"
+        return full.messages, delta.messages
+
+    full_messages, delta_messages = asyncio.run(run())
+    full_bytes = sum(len(text) for text in full_messages)
+    delta_bytes = sum(len(text) for text in delta_messages)
+    print(f"📉 system_status x{args.broadcasts} (a change every {args.change_every} broadcasts)")
+    print(f"   full documents   {full_bytes / 1024:8.1f} KB  ({full_bytes / len(full_messages):.0f} B/message)")
+    print(f"   snapshot + patch {delta_bytes / 1024:8.1f} KB  ({len(delta_messages)} messages, "
+          f"{100 * (1 - delta_bytes / full_bytes):.1f}% less)")
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description="UpCycle Pro performance benchmarks",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    serving = subparsers.add_parser("serving", help="model.predict vs tf.function serving latency")
+    serving.add_argument("--model", default=None, help="Keras model file (default: untrained MobileNetV2)")
+    serving.add_argument("--batch-sizes", default="1,4,16", help="Comma separated batch sizes (default: 1,4,16)")
+    serving.add_argument("--iterations", type=int, default=50, help="Calls per batch size (default: 50)")
+    serving.set_defaults(func=bench_serving)
+
+    backends = subparsers.add_parser("backends", help="Load time and per-image latency per model backend")
+    backends.add_argument("paths", nargs="*", help="Model artifacts (default: config.yaml model.path)")
+    backends.add_argument("--batch-size", type=int, default=1, help="Images per call (default: 1)")
+    backends.add_argument("--iterations", type=int, default=50, help="Calls per backend (default: 50)")
+    backends.set_defaults(func=bench_backends)
+
+    preprocess = subparsers.add_parser("preprocess", help="Legacy vs draft-mode JPEG preprocessing")
+    preprocess.add_argument("--quality", type=int, default=80, help="JPEG quality of the test frames (default: 80)")
+    preprocess.add_argument("--iterations", type=int, default=50, help="Frames per resolution (default: 50)")
+    preprocess.set_defaults(func=bench_preprocess)
+
+    ingestion = subparsers.add_parser("ingestion", help="Legacy vs pooled /predict upload ingestion")
+    ingestion.add_argument("--mode", default="both", choices=["both", "legacy", "pooled"], help="Path to measure (default: both)")
+    ingestion.add_argument("--quality", type=int, default=90, help="JPEG quality of the upload (default: 90)")
+    ingestion.add_argument("--iterations", type=int, default=200, help="Requests per path (default: 200)")
+    ingestion.set_defaults(func=bench_ingestion)
+
+    startup = subparsers.add_parser("startup", help="Process start to first /health response")
+    startup.add_argument("--runs", type=int, default=3, help="Server starts per mode (default: 3)")
+    startup.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for the model (default: 120)")
+    startup.set_defaults(func=bench_startup)
+
+    sensors = subparsers.add_parser("sensors", help="Sensor history list vs per-device ring buffers")
+    sensors.add_argument("--devices", type=int, default=48, help="ESP32-CONTROL boards posting (default: 48)")
+    sensors.add_argument("--readings", type=int, default=100000, help="Readings inserted (default: 100000)")
+    sensors.add_argument("--capacity", type=int, default=1000, help="History capacity (default: 1000)")
+    sensors.add_argument("--limit", type=int, default=50, help="Readings returned per query (default: 50)")
+    sensors.set_defaults(func=bench_sensors)
+
+    timeseries = subparsers.add_parser("timeseries", help="SQLite time-series inserts and history queries")
+    timeseries.add_argument("--days", type=int, default=21, help="Days of history (default: 21)")
+    timeseries.add_argument("--devices", type=int, default=4, help="ESP32-CONTROL boards (default: 4)")
+    timeseries.add_argument("--interval", type=float, default=2.0, help="Seconds between readings (default: 2)")
+    timeseries.add_argument("--limit", type=int, default=1000, help="Rows per range query (default: 1000)")
+    timeseries.add_argument("--iterations", type=int, default=20, help="Queries per kind (default: 20)")
+    timeseries.set_defaults(func=bench_timeseries)
+
+    commands = subparsers.add_parser("commands", help="Sensor-poll piggyback vs push command delivery latency")
+    commands.add_argument("--commands", type=int, default=50, help="Servo commands enqueued (default: 50)")
+    commands.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between sensor posts (default: 1)")
+    commands.add_argument("--gap", type=float, default=0.1, help="Mean seconds between classifications (default: 0.1)")
+    commands.set_defaults(func=bench_commands)
+
+    websocket = subparsers.add_parser("websocket", help="Per-client json.dumps vs encode-once WebSocket fan-out")
+    websocket.add_argument("--clients", type=int, default=100, help="Subscribed clients (default: 100, WS_MAX_CONNECTIONS)")
+    websocket.add_argument("--broadcasts", type=int, default=50, help="Events broadcast (default: 50)")
+    websocket.set_defaults(func=bench_websocket)
+
+    camera = subparsers.add_parser("camera", help="ESP32-CAM request rate: direct /capture vs shared frame hub")
+    camera.add_argument("--consumers", type=int, default=4, help="Concurrent frame consumers (default: 4)")
+    camera.add_argument("--duration", type=float, default=10.0, help="Seconds per mode (default: 10)")
+    camera.add_argument("--interval", type=float, default=0.5, help="Seconds between reads per consumer (default: 0.5)")
+    camera.add_argument("--max-age", type=float, default=0.5, help="Frame max age for hub reads (default: 0.5)")
+    camera.add_argument("--capture-ms", type=float, default=150.0, help="Simulated ESP32 /capture time (default: 150)")
+    camera.add_argument("--camera-fps", type=float, default=10.0, help="Simulated MJPEG stream rate (default: 10)")
+    camera.set_defaults(func=bench_camera)
+
+    delta = subparsers.add_parser("delta", help="system_status bytes: full documents vs snapshot + JSON Patch")
+    delta.add_argument("--broadcasts", type=int, default=120, help="Periodic status broadcasts (default: 120, one hour)")
+    delta.add_argument("--change-every", type=int, default=20, help="Broadcasts between real changes (default: 20)")
+    delta.set_defaults(func=bench_delta)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+UpCycle Pro TFLite Conversion Script
+====================================
+
+Converts the CNN classifier (Keras file or SavedModel) into TFLite models for
+CPU-only API nodes, optionally quantized, and reports accuracy vs. latency so a
+quantization level can be chosen per deployment.
+
+Usage:
+    python convert_model.py [--source PATH] [--quantization MODE ...]
+                            [--calibration-dir DIR] [--eval-dir DIR]
+
+Examples:
+    python convert_model.py --quantization float16
+    python convert_model.py --quantization none float16 int8 --calibration-dir ../data/captured_images
+    python convert_model.py --quantization int8 --calibration-dir samples/ --eval-dir dataset/test --report report.json
+
+Serve a converted model with:
+    MODEL_ARTIFACT_PATH=api/tflite_models/classifier_int8.tflite python start_server.py
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+# Add the API directory to the Python path
+api_dir = Path(__file__).parent / "api"
+sys.path.insert(0, str(api_dir))
+
+
+def print_report(reports):
+    """Print the accuracy-vs-latency table"""
+    print()
+    print(f"{'backend':<12s} {'size (MB)':>10s} {'accuracy':>9s} {'agreement':>10s} {'p50 ms':>8s} {'p95 ms':>8s}  path")
+    for report in reports:
+        size = f"{report['size_bytes'] / (1024 * 1024):.2f}" if report["size_bytes"] else "-"
+        agreement = report.get("agreement_with_reference")
+        print(
+            f"{report['backend']:<12s} {size:>10s} {report['accuracy']:>9.4f} "
+            f"{(f'{agreement:.4f}' if agreement is not None else '-'):>10s} "
+            f"{report['latency_ms']['p50']:>8.3f} {report['latency_ms']['p95']:>8.3f}  {report['path']}"
+        )
+
+
+def main():
+    """Main entry point"""
+    from config import get_model_artifact_path, load_project_config
+
+    images_path = load_project_config().get("monitoring", {}).get("images_path", "")
+
+    parser = argparse.ArgumentParser(
+        description="Convert the UpCycle Pro CNN to (quantized) TFLite",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument(
+        "--source",
+        default=get_model_artifact_path(),
+        help="Keras model or SavedModel directory (default: config.yaml model.path)"
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=str(api_dir / "tflite_models"),
+        help="Directory for the .tflite files (default: api/tflite_models)"
+    )
+    parser.add_argument(
+        "--quantization",
+        nargs="+",
+        default=["float16", "int8"],
+        choices=["none", "dynamic", "float16", "int8"],
+        help="Quantization modes to produce (default: float16 int8)"
+    )
+    parser.add_argument(
+        "--calibration-dir",
+        default=str(Path(__file__).resolve().parents[1] / images_path) if images_path else None,
+        help="Sample images for int8 calibration (default: config.yaml monitoring.images_path)"
+    )
+    parser.add_argument(
+        "--num-calibration",
+        type=int,
+        default=200,
+        help="Calibration images used for int8 (default: 200)"
+    )
+    parser.add_argument(
+        "--eval-dir",
+        default=None,
+        help="Labeled images (<dir>/<class>/*.jpg) for the accuracy-vs-latency report"
+    )
+    parser.add_argument(
+        "--eval-limit",
+        type=int,
+        default=0,
+        help="Maximum evaluation images per class (default: all)"
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        help="Write the report as JSON to this path"
+    )
+
+    args = parser.parse_args()
+
+    from services.model_conversion import accuracy_latency_report, convert_to_tflite
+
+    if not args.source or not os.path.exists(args.source):
+        print(f"❌ Source model not found: {args.source}")
+        sys.exit(1)
+
+    print(f"🤖 Source model: {args.source}")
+    converted = []
+    for mode in args.quantization:
+        output_path = os.path.join(args.output_dir, f"classifier_{mode}.tflite")
+        try:
+            result = convert_to_tflite(
+                args.source,
+                output_path,
+                quantization=mode,
+                calibration_dir=args.calibration_dir,
+                num_calibration=args.num_calibration
+            )
+        except Exception as e:
+            print(f"❌ {mode}: {e}")
+            continue
+        converted.append(result)
+        print(f"✅ {mode:<8s} {result['size_bytes'] / (1024 * 1024):7.2f} MB  "
+              f"({result['conversion_seconds']}s)  -> {output_path}")
+
+    summary = {"source": args.source, "converted": converted}
+
+    if args.eval_dir and converted:
+        print(f"🧪 Evaluating on {args.eval_dir}...")
+        reports = accuracy_latency_report(
+            args.source,
+            [result["path"] for result in converted],
+            args.eval_dir,
+            limit=args.eval_limit
+        )
+        print_report(reports)
+        summary["report"] = reports
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+        print(f"📝 Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+UpCycle Pro Bulk Re-classification
+==================================
+
+Re-runs a classifier over the whole captured_images archive (hundreds of
+thousands of frames) on CPU. Images are decoded in parallel while the model
+classifies the previous batch, and per-image predictions are written as
+compressed columnar shards (.npz) next to a checkpoint, so an interrupted run
+resumes at the last completed shard.
+
+Usage:
+    python reclassify.py --output-dir DIR [--images-dir DIR] [--model PATH]
+                         [--batch-size N] [--workers N] [--executor thread|process]
+                         [--shard-size N] [--limit N]
+    python reclassify.py --output-dir DIR --summary
+
+Examples:
+    python reclassify.py --output-dir ../data/reclassified/v2 --model api/tflite_models/classifier_int8.tflite
+    python reclassify.py --output-dir ../data/reclassified/v2 --executor process --workers 8
+    python reclassify.py --output-dir ../data/reclassified/v2 --summary
+
+Read the results with:
+    from services.reclassification import load_results
+    columns = load_results("../data/reclassified/v2")  # path, predicted, confidence, probabilities, recorded, valid
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+# Add the API directory to the Python path
+api_dir = Path(__file__).parent / "api"
+sys.path.insert(0, str(api_dir))
+
+
+def print_summary(summary):
+    """Print the class distribution of a finished job"""
+    print()
+    print(f"🖼️  Images: {summary['images']} ({summary['failed_images']} failed to decode)")
+    for name, count in summary["predicted_distribution"].items():
+        print(f"   {name:<10s} {count:>10d}")
+    if summary["agreement_with_recorded"] is not None:
+        print(f"🎯 Agreement with archived class: {summary['agreement_with_recorded']:.4f} "
+              f"({summary['labeled_images']} labeled images)")
+    if summary["mean_confidence"] is not None:
+        print(f"📈 Mean confidence: {summary['mean_confidence']:.4f}")
+
+
+def main():
+    """Main entry point"""
+    from config import get_captured_images_path, get_model_artifact_path
+
+    parser = argparse.ArgumentParser(
+        description="Re-classify the UpCycle Pro captured image archive",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument(
+        "--output-dir",
+        required=True,
+        help="Directory for shards and checkpoint; an existing checkpoint is resumed"
+    )
+    parser.add_argument(
+        "--images-dir",
+        default=get_captured_images_path(),
+        help="Image archive to walk (default: config.yaml monitoring.images_path)"
+    )
+    parser.add_argument(
+        "--model",
+        default=get_model_artifact_path(),
+        help="Keras file, SavedModel directory or .tflite (default: config.yaml model.path)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=32,
+        help="Images per inference batch (default: 32)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Parallel decode workers (default: CPU count)"
+    )
+    parser.add_argument(
+        "--executor",
+        default="thread",
+        choices=["thread", "process"],
+        help="Decode in threads or in worker processes (default: thread)"
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=10000,
+        help="Images per result shard / checkpoint interval (default: 10000)"
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=0,
+        help="Only process the first N images of the archive (default: all)"
+    )
+    parser.add_argument(
+        "--summary",
+        action="store_true",
+        help="Only print the summary of an existing output directory"
+    )
+
+    args = parser.parse_args()
+
+    from services.reclassification import ReclassificationJob, summarize_results
+
+    if args.summary:
+        try:
+            summary = summarize_results(args.output_dir)
+        except FileNotFoundError:
+            print(f"❌ No reclassification results in {args.output_dir}")
+            sys.exit(1)
+        print_summary(summary)
+        print(json.dumps(summary, indent=2))
+        return
+
+    if not args.images_dir or not os.path.isdir(args.images_dir):
+        print(f"❌ Images directory not found: {args.images_dir}")
+        sys.exit(1)
+    if not args.model or not os.path.exists(args.model):
+        print(f"❌ Model not found: {args.model}")
+        sys.exit(1)
+
+    job = ReclassificationJob(
+        images_dir=args.images_dir,
+        output_dir=args.output_dir,
+        model_path=args.model,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        executor=args.executor,
+        shard_size=args.shard_size,
+        limit=args.limit
+    )
+
+    # Ctrl+C termina el lote actual y deja el checkpoint listo para reanudar
+    signal.signal(signal.SIGINT, lambda *_: job.cancel())
+
+    last_print = 0.0
+
+    def on_progress(current):
+        nonlocal last_print
+        now = time.monotonic()
+        if now - last_print < 1.0 and current.processed < current.total:
+            return
+        last_print = now
+        status = current.get_status()
+        eta = f"{status['eta_seconds']:.0f}s" if status["eta_seconds"] is not None else "-"
+        print(f"\r⏳ {status['processed']}/{status['total']} "
+              f"({status['progress'] * 100:.1f}%)  {status['images_per_second']:.1f} img/s  ETA {eta}   ",
+              end="", flush=True)
+
+    print(f"🤖 Model: {args.model}")
+    print(f"📁 Images: {args.images_dir}")
+    status = job.run(on_progress)
+    print()
+
+    if status["state"] == "failed":
+        print(f"❌ Reclassification failed: {status['error']}")
+        sys.exit(1)
+    if status["state"] == "cancelled":
+        print(f"⏸️  Stopped at {status['processed']}/{status['total']}; run again with the same --output-dir to resume")
+        return
+
+    print(f"✅ Reclassified {status['processed']} images into {args.output_dir}")
+    print_summary(summarize_results(args.output_dir))
+
+
+if __name__ == "__main__":
+    main()
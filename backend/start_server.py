@@ -17,6 +17,7 @@ Examples:
 
 import argparse
 import asyncio
+import importlib.util
 import logging
 import os
 import sys
@@ -40,22 +41,22 @@ def setup_logging(level: str = "INFO"):
     logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
 
 def check_dependencies():
-    """Check if all required dependencies are installed"""
-    required_packages = [
-        "fastapi",
-        "uvicorn",
-        "aiohttp",
-        "tensorflow",
-        "numpy",
-        "pillow",
-        "pydantic",
-    ]
+    """Check if all required dependencies are installed (without importing them)"""
+    # package name -> import name
+    required_packages = {
+        "fastapi": "fastapi",
+        "uvicorn": "uvicorn",
+        "aiohttp": "aiohttp",
+        "tensorflow": "tensorflow",
+        "numpy": "numpy",
+        "pillow": "PIL",
+        "pydantic": "pydantic",
+    }
     
     missing_packages = []
-    for package in required_packages:
-        try:
-            __import__(package)
-        except ImportError:
+    for package, module in required_packages.items():
+        # find_spec only locates the package: importing TensorFlow here would cost seconds
+        if importlib.util.find_spec(module) is None:
             missing_packages.append(package)
     
     if missing_packages:
@@ -123,12 +124,11 @@ async def test_system_components():
     """Test system components before starting server"""
     print("🧪 Testing system components...")
     
-    # Test model loading
-    try:
-        import tensorflow as tf
-        print("✅ TensorFlow is working")
-    except Exception as e:
-        print(f"❌ TensorFlow error: {e}")
+    # TensorFlow is imported by the API in the background, together with the model
+    if importlib.util.find_spec("tensorflow") is not None:
+        print("✅ TensorFlow is installed (loaded in the background by the API)")
+    else:
+        print("❌ TensorFlow is not installed")
     
     # Test image processing
     try: